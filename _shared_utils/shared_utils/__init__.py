@@ -2,6 +2,7 @@ from . import (
     arcgis_query,
     catalog_utils,
     dask_utils,
+    geometry_utils,
     gtfs_utils_v2,
     portfolio_utils,
     publish_utils,
@@ -14,6 +15,7 @@ __all__ = [
     "arcgis_query",
     "catalog_utils",
     "dask_utils",
+    "geometry_utils",
     "gtfs_utils_v2",
     "portfolio_utils",
     "publish_utils",
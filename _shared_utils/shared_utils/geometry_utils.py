@@ -0,0 +1,210 @@
+"""
+Build line geometries in bulk from coordinate / point arrays.
+
+Instead of constructing a shapely.LineString row-by-row
+(df.apply or a groupby lambda), pass all the coordinates at once
+to shapely.linestrings with an index array that says which
+line each coordinate belongs to.
+
+Also apportion line lengths (route shapes) across polygon layers
+with one spatial index and bulk clipping.
+"""
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+
+def lines_from_coords(coords: np.ndarray, line_ids: np.ndarray) -> np.ndarray:
+    """
+    coords: (N, 2) array of x, y coordinates.
+    line_ids: (N,) array of integer line ids (0 to n_lines - 1),
+        coordinates in the same line are kept in their original order.
+
+    Returns an array of linestrings, position i is line_id i.
+    Every line needs at least 2 coordinates.
+    """
+    coords = np.asarray(coords)
+    line_ids = np.asarray(line_ids)
+
+    order = np.argsort(line_ids, kind="stable")
+
+    return shapely.linestrings(coords[order], indices=line_ids[order])
+
+
+def lines_from_points(points: np.ndarray, line_ids: np.ndarray) -> np.ndarray:
+    """
+    Multi-point paths: connect an array of point geometries
+    into one linestring per line_id, in the order the points appear.
+    """
+    return lines_from_coords(shapely.get_coordinates(np.asarray(points)), line_ids)
+
+
+def line_segments_between_points(start_points: np.ndarray, end_points: np.ndarray) -> np.ndarray:
+    """
+    Draw a 2-point line from each start point to its end point.
+    start_points and end_points are arrays of the same length.
+    """
+    start_coords = shapely.get_coordinates(np.asarray(start_points))
+    end_coords = shapely.get_coordinates(np.asarray(end_points))
+
+    return shapely.linestrings(np.stack([start_coords, end_coords], axis=1))
+
+
+def condense_points_to_lines(
+    df: pd.DataFrame,
+    group_cols: list,
+    geom_col: str = "geometry",
+) -> tuple[pd.DataFrame, np.ndarray]:
+    """
+    Group points by group_cols and draw one line per group,
+    in the order the points appear in df.
+    Groups must have at least 2 points.
+
+    Returns the group_cols df (one row per group, sorted like a groupby)
+    and the array of lines, aligned to it.
+    """
+    grouped = df.groupby(group_cols, observed=True, group_keys=False)
+
+    line_ids = grouped.ngroup().to_numpy()
+    groups = grouped.size().reset_index()[group_cols]
+
+    return groups, lines_from_points(df[geom_col].to_numpy(), line_ids)
+
+
+def connect_subsequent_points(gdf: gpd.GeoDataFrame, group_cols: list) -> gpd.GeoDataFrame:
+    """
+    Within each group, draw a line from each point to the next one.
+    The last point in each group has nothing to connect to and is dropped,
+    if we have 3 points, we can draw 2 lines.
+    gdf should already be sorted in the order points should be connected.
+    """
+    end_geometry = gdf.groupby(group_cols, group_keys=False).geometry.shift(-1)
+    has_end = end_geometry.notna().to_numpy()
+
+    lines = line_segments_between_points(gdf.geometry.to_numpy()[has_end], end_geometry.to_numpy()[has_end])
+
+    gdf2 = gpd.GeoDataFrame(
+        gdf[has_end].drop(columns="geometry"),
+        geometry=gpd.GeoSeries(lines, index=gdf.index[has_end]),
+        crs=gdf.crs,
+    )
+
+    return gdf2
+
+
+def line_lengths_by_polygon(
+    lines: np.ndarray, polygons: np.ndarray, polygon_tree: shapely.STRtree = None
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    For every line-polygon pair that overlaps, get the length of the
+    line that falls inside the polygon.
+    Polygons are indexed once (pass polygon_tree to reuse an index)
+    and all the lines are clipped in one vectorized call.
+
+    Returns line positions, polygon positions and the intersected lengths.
+    Pairs that only touch (zero length) are dropped, same as gpd.overlay.
+    """
+    lines = np.asarray(lines)
+    polygons = np.asarray(polygons)
+
+    if polygon_tree is None:
+        polygon_tree = shapely.STRtree(polygons)
+
+    line_idx, polygon_idx = polygon_tree.query(lines, predicate="intersects")
+
+    length = shapely.length(shapely.intersection(lines[line_idx], polygons[polygon_idx]))
+    keep = length > 0
+
+    return line_idx[keep], polygon_idx[keep], length[keep]
+
+
+def _geometry_keys(geometry: np.ndarray) -> np.ndarray:
+    """
+    Hash each geometry's WKB, so unchanged geometries can be matched across runs.
+    """
+    return pd.util.hash_array(shapely.to_wkb(np.asarray(geometry)).astype(object))
+
+
+# polygon_key used in the cache for lines that don't intersect any polygon
+NO_POLYGON_KEY = 0
+
+
+def apportion_lines_to_polygons(
+    lines_gdf: gpd.GeoDataFrame,
+    polygons_gdf: gpd.GeoDataFrame,
+    polygon_cols: list,
+    cache: pd.DataFrame = None,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Split each line's length across the polygons it passes through
+    (route shapes across tracts, legislative districts, etc).
+    Both gdfs should be in the same projected CRS.
+
+    Returns a long df (lines_gdf columns without geometry + polygon_cols + intersect_length),
+    one row for each line-polygon pair that overlaps,
+    and the updated intersection cache.
+
+    cache holds intersected lengths keyed by the hash of the line and polygon geometries.
+    Lines already in the cache for this polygon layer are not clipped again,
+    so the same shapes for another operator, date or run are cheap.
+    Save the returned cache and pass it in next time.
+    """
+    lines_gdf = lines_gdf[lines_gdf.geometry.notna()]
+
+    line_keys = _geometry_keys(lines_gdf.geometry.to_numpy())
+    polygon_keys = _geometry_keys(polygons_gdf.geometry.to_numpy())
+
+    # Polygon layers are told apart by the set of polygons in them
+    layer_key = pd.util.hash_array(np.sort(np.unique(polygon_keys))).sum()
+
+    if cache is None:
+        cache = pd.DataFrame(
+            {
+                "layer_key": pd.Series(dtype="uint64"),
+                "line_key": pd.Series(dtype="uint64"),
+                "polygon_key": pd.Series(dtype="uint64"),
+                "intersect_length": pd.Series(dtype="float64"),
+            }
+        )
+
+    cached_lines = cache.line_key[cache.layer_key == layer_key].unique()
+
+    unique_keys, first_position = np.unique(line_keys, return_index=True)
+    is_new = ~np.isin(unique_keys, cached_lines)
+
+    new_lines = lines_gdf.geometry.to_numpy()[first_position[is_new]]
+    line_idx, polygon_idx, length = line_lengths_by_polygon(new_lines, polygons_gdf.geometry.to_numpy())
+
+    # Record lines that didn't intersect any polygon too, so they aren't clipped again
+    no_polygon = np.setdiff1d(np.arange(len(new_lines)), line_idx)
+
+    new_cache = pd.DataFrame(
+        {
+            "layer_key": layer_key,
+            "line_key": np.concatenate([unique_keys[is_new][line_idx], unique_keys[is_new][no_polygon]]),
+            "polygon_key": np.concatenate(
+                [polygon_keys[polygon_idx], np.full(len(no_polygon), NO_POLYGON_KEY, dtype="uint64")]
+            ),
+            "intersect_length": np.concatenate([length, np.zeros(len(no_polygon))]),
+        }
+    ).drop_duplicates(subset=["layer_key", "line_key", "polygon_key"])
+
+    cache = pd.concat([cache, new_cache], axis=0, ignore_index=True)
+
+    lengths = cache[(cache.layer_key == layer_key) & (cache.polygon_key != NO_POLYGON_KEY)].drop(columns="layer_key")
+
+    polygon_attributes = (
+        polygons_gdf[polygon_cols].assign(polygon_key=polygon_keys).drop_duplicates(subset="polygon_key")
+    )
+
+    df = (
+        pd.DataFrame(lines_gdf.drop(columns=lines_gdf.geometry.name))
+        .assign(line_key=line_keys)
+        .merge(lengths, on="line_key", how="inner")
+        .merge(polygon_attributes, on="polygon_key", how="inner")
+        .drop(columns=["line_key", "polygon_key"])
+        .reset_index(drop=True)
+    )
+
+    return df, cache
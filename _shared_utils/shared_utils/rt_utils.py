@@ -4,6 +4,7 @@ import gzip
 import json
 import os
 import re
+import tempfile
 import time
 from pathlib import Path
 from typing import Literal, Union
@@ -152,6 +153,31 @@ def primary_cardinal_direction(
     return cardinal_definition_rules(distance_east, distance_north)
 
 
+def primary_cardinal_direction_array(
+    distance_east: np.ndarray,
+    distance_north: np.ndarray,
+) -> np.ndarray:
+    """
+    distance_east: np.ndarray of destination.x - origin.x
+    distance_north: np.ndarray of destination.y - origin.y
+
+    Vectorized version of cardinal_definition_rules, using the same rules,
+    so coordinate arrays don't need to go through points row-by-row.
+    """
+    east_west = np.abs(distance_east) > np.abs(distance_north)
+
+    return np.select(
+        [
+            east_west & (distance_east > 0),
+            east_west & (distance_east < 0),
+            ~east_west & (distance_north > 0),
+            ~east_west & (distance_north < 0),
+        ],
+        ["Eastbound", "Westbound", "Northbound", "Southbound"],
+        default="Unknown",
+    )
+
+
 def add_origin_destination(
     gdf: Union[gpd.GeoDataFrame, dg.GeoDataFrame],
 ) -> Union[gpd.GeoDataFrame, dg.GeoDataFrame]:
@@ -512,37 +538,6 @@ def get_routelines(
         return routelines
 
 
-def check_intermediate_data(
-    speedmaps_index_df: pd.DataFrame = pd.DataFrame(),
-    analysis_date: dt.date = None,
-) -> pd.DataFrame:
-    """
-    speedmaps_index_df: pd.DataFrame of all agencies to try generating a speedmap
-        from rt_delay/build_speedmaps_index.py
-    For speedmap generation scripts in rt_delay.
-    Check if intermediate file exists (process partially complete) and
-    return that to script, otherwise check intermediate data from GCS
-    """
-    assert analysis_date or not speedmaps_index_df.empty, "must provide analysis date if not providing index df"
-    analysis_date = speedmaps_index_df.analysis_date.iloc[0] if not analysis_date else analysis_date
-    progress_path = f"./_rt_progress_{analysis_date}.parquet"
-    already_tried = os.path.exists(progress_path)
-    assert already_tried or not speedmaps_index_df.empty, "must provide df if no existing progress parquet"
-    if already_tried:
-        print(f"found {progress_path}, resuming")
-        speedmaps_index_joined = pd.read_parquet(progress_path)
-        print(speedmaps_index_joined >> count(_.status))  # show status when running script
-    else:
-        operators_ran = get_operators(analysis_date, speedmaps_index_df.organization_itp_id.to_list())
-        operators_ran_df = pd.DataFrame.from_dict(operators_ran, orient="index", columns=["status"])
-        operators_ran_df.index.name = "itp_id"
-        speedmaps_index_joined = speedmaps_index_df >> inner_join(
-            _, operators_ran_df, on={"organization_itp_id": "itp_id"}
-        )
-
-    return speedmaps_index_joined
-
-
 def categorize_time_of_day(value: Union[int, dt.datetime]) -> str:
     if isinstance(value, int):
         hour = value
@@ -820,20 +815,84 @@ def get_operators(analysis_date, operator_list, verbose=False):
     return op_list_runstatus
 
 
+def colors_from_colormap(values: pd.Series, cmap: branca.colormap.ColorMap) -> pd.Series:
+    """
+    Vectorized cmap.rgb_bytes_tuple for a column.
+    Step colormaps only have one color per bin, so values are binned with
+    np.searchsorted against cmap.index. Other colormaps are keyed on unique values.
+    The colormap is called once for each bin (or unique value), not once per row.
+    """
+    value_arr = values.to_numpy()
+
+    if isinstance(cmap, branca.colormap.StepColormap):
+        keys = np.clip(np.searchsorted(cmap.index, value_arr, side="right"), 1, len(cmap.colors))
+    else:
+        keys = value_arr
+
+    codes, _ = pd.factorize(keys)
+    unique_codes, first_positions = np.unique(codes, return_index=True)
+
+    # One representative value from each bin gives the bin's color
+    color_lookup = np.empty(len(unique_codes), dtype="object")
+    color_lookup[:] = [cmap.rgb_bytes_tuple(v) for v in value_arr[first_positions]]
+
+    return pd.Series(color_lookup[np.searchsorted(unique_codes, codes)], index=values.index)
+
+
+def write_gzipped_geojson(gdf: gpd.GeoDataFrame, path: str, chunk_size: int = 50_000):
+    """
+    Stream a gdf to a gzipped geojson FeatureCollection in GCS,
+    serializing chunk_size features at a time instead of
+    holding the entire geojson string in memory.
+    Features are the same as gdf.to_json() (no per-feature bbox).
+    """
+    with fs.open(path, "wb") as writer:
+        with gzip.GzipFile(fileobj=writer, mode="w") as gz:
+            gz.write(b'{"type": "FeatureCollection", "features": [')
+
+            for i, start in enumerate(range(0, len(gdf), chunk_size)):
+                features = gdf.iloc[start : start + chunk_size].to_geo_dict(na="null", show_bbox=False)["features"]
+                if i > 0:
+                    gz.write(b", ")
+                gz.write(json.dumps(features)[1:-1].encode("utf-8"))
+
+            gz.write(b"]}")
+
+    return
+
+
+def write_flatgeobuf(gdf: gpd.GeoDataFrame, path: str):
+    """
+    Write a gdf as FlatGeobuf (.fgb) in GCS. This is a binary format
+    with a spatial index, so clients can stream features by bounding box.
+    """
+    # Write to a temp folder of its own, so concurrent exports don't collide
+    with tempfile.TemporaryDirectory() as tmpdir:
+        local_filename = os.path.join(tmpdir, Path(path).name)
+        gdf.to_file(local_filename, driver="FlatGeobuf")
+        fs.put(local_filename, path)
+
+    return
+
+
 def spa_map_export_link(
-    gdf: gpd.GeoDataFrame, path: str, state: dict, site: str = SPA_MAP_SITE, cache_seconds: int = 3600
+    gdf: gpd.GeoDataFrame,
+    path: str,
+    state: dict,
+    site: str = SPA_MAP_SITE,
+    cache_seconds: int = 3600,
+    export_format: Literal["geojson", "flatgeobuf"] = "geojson",
 ):
     """
-    Called via set_state_export. Handles stream writing of gzipped geojson to GCS bucket,
-    encoding spa state as base64 and URL generation.
+    Called via set_state_export. Handles stream writing of gzipped geojson
+    (or FlatGeobuf) to GCS bucket, encoding spa state as base64 and URL generation.
     """
     assert cache_seconds in range(3601), "cache must be 0-3600 seconds"
-    geojson_str = gdf.to_json()
-    geojson_bytes = geojson_str.encode("utf-8")
     print(f"writing to {path}")
-    with fs.open(path, "wb") as writer:  # write out to public-facing GCS?
-        with gzip.GzipFile(fileobj=writer, mode="w") as gz:
-            gz.write(geojson_bytes)
+    if export_format == "flatgeobuf":
+        write_flatgeobuf(gdf, path)
+    else:
+        write_gzipped_geojson(gdf, path)
     if cache_seconds != 3600:
         fs.setxattrs(path, fixed_key_metadata={"cache_control": f"public, max-age={cache_seconds}"})
     base64state = base64.urlsafe_b64encode(json.dumps(state).encode()).decode()
@@ -854,6 +913,8 @@ def set_state_export(
     existing_state: dict = {},
     cache_seconds: int = 3600,
     manual_centroid: list = None,
+    export_format: Literal["geojson", "flatgeobuf"] = "geojson",
+    simplify_tolerance: float = None,
 ):
     """
     Applies light formatting to gdf for successful spa display. Will pass map_type
@@ -863,16 +924,23 @@ def set_state_export(
     to apply the color to.
     Cache is 1 hour by default, can set shorter time in seconds for
     "near realtime" applications (suggest 120) or development (suggest 0)
+    Supply simplify_tolerance (meters) to simplify geometries before export,
+    which shrinks statewide layers. export_format="flatgeobuf" writes a .fgb
+    instead of .geojson.gz, for map clients that read FlatGeobuf.
 
     Returns dict with state dictionary and map URL. Can call multiple times and supply
     previous state as existing_state to create multilayered maps.
     """
     assert not gdf.empty, "geodataframe is empty!"
     spa_map_state = existing_state or {"name": "null", "layers": [], "lat_lon": (), "zoom": 13}
-    path = f"{bucket}{subfolder}{filename}.geojson.gz"
+    extension = "fgb" if export_format == "flatgeobuf" else "geojson.gz"
+    path = f"{bucket}{subfolder}{filename}.{extension}"
+    if simplify_tolerance:
+        gdf = gdf.to_crs(geography_utils.CA_NAD83Albers)
+        gdf = gdf.assign(geometry=gdf.geometry.simplify(simplify_tolerance))
     gdf = gdf.to_crs(geography_utils.WGS84)
     if cmap and color_col:
-        gdf["color"] = gdf[color_col].apply(lambda x: cmap.rgb_bytes_tuple(x))
+        gdf["color"] = colors_from_colormap(gdf[color_col], cmap)
     gdf = gdf.round(2)  # round for map display
     this_layer = [
         {
@@ -895,5 +963,7 @@ def set_state_export(
         spa_map_state["legend_url"] = legend_url
     return {
         "state_dict": spa_map_state,
-        "spa_link": spa_map_export_link(gdf=gdf, path=path, state=spa_map_state, cache_seconds=cache_seconds),
+        "spa_link": spa_map_export_link(
+            gdf=gdf, path=path, state=spa_map_state, cache_seconds=cache_seconds, export_format=export_format
+        ),
     }
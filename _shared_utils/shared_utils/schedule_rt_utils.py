@@ -15,29 +15,82 @@ from siuba import *
 PACIFIC_TIMEZONE = "US/Pacific"
 
 
-def localize_timestamp_col(df: dd.DataFrame, timestamp_col: Union[str, list]) -> dd.DataFrame:
+def localize_timestamp_series(ts: pd.Series, timezone: Union[str, pd.Series] = PACIFIC_TIMEZONE) -> pd.Series:
+    """
+    Convert UTC timestamps into naive local (wall-clock) timestamps.
+    This is columnar: tz_convert and tz_localize(None) work on the whole
+    column instead of stripping tzinfo one timestamp at a time.
+
+    timezone can be a single timezone, or a series of timezones
+    (each operator's timezone) aligned with ts. In that case, rows are
+    converted in bulk, once for each unique timezone.
+    """
+    utc_ts = pd.to_datetime(ts, utc=True)
+
+    if isinstance(timezone, str):
+        return utc_ts.dt.tz_convert(timezone).dt.tz_localize(None)
+
+    local_ts = pd.Series(pd.NaT, index=ts.index, dtype="datetime64[ns]")
+
+    for tz in timezone.dropna().unique():
+        is_tz = (timezone == tz).to_numpy()
+        local_ts[is_tz] = utc_ts[is_tz].dt.tz_convert(tz).dt.tz_localize(None)
+
+    return local_ts
+
+
+def seconds_since_service_day(ts: pd.Series, service_date: str = None) -> pd.Series:
+    """
+    For naive local timestamps, get the integer seconds since midnight.
+    If service_date is given, seconds are counted from that date's midnight,
+    so timestamps after midnight keep counting past 86,400.
+    Otherwise, count from each timestamp's own midnight
+    (same as hour * 3,600 + minute * 60 + second).
+    """
+    if service_date is None:
+        service_day_start = ts.dt.normalize()
+    else:
+        service_day_start = pd.Timestamp(service_date)
+
+    return (ts - service_day_start) // pd.Timedelta(seconds=1)
+
+
+def localize_timestamp_col(
+    df: dd.DataFrame,
+    timestamp_col: Union[str, list],
+    timezone_col: str = None,
+    add_seconds: bool = False,
+) -> dd.DataFrame:
     """
     RT vehicle timestamps are given in UTC.
-    Localize these to Pacific Time.
+    Localize these to Pacific Time, or to each row's timezone in timezone_col.
+    If add_seconds is True, also add {timestamp_col}_local_sec,
+    the seconds since midnight, so downstream steps
+    (segment_calcs.convert_timestamp_to_seconds) can use it directly.
     """
     # https://stackoverflow.com/questions/62992863/trying-to-convert-aware-local-datetime-to-naive-local-datetime-in-panda-datafram
 
     if isinstance(timestamp_col, str):
         timestamp_col = [timestamp_col]
 
+    def localize_partition(part: pd.DataFrame, c: str) -> pd.Series:
+        timezone = PACIFIC_TIMEZONE if timezone_col is None else part[timezone_col]
+        return localize_timestamp_series(part[c], timezone)
+
     for c in timestamp_col:
         if isinstance(df, (dd.DataFrame, dg.GeoDataFrame)):
-            localized_timestamp_col = (
-                dd.to_datetime(df[c], utc=True)
-                .dt.tz_convert(PACIFIC_TIMEZONE)
-                .apply(lambda t: t.replace(tzinfo=None), meta=(None, "datetime64[ns]"))
-            )
+            df[f"{c}_local"] = df.map_partitions(localize_partition, c, meta=(f"{c}_local", "datetime64[ns]"))
+
+            if add_seconds:
+                df[f"{c}_local_sec"] = df[f"{c}_local"].map_partitions(
+                    seconds_since_service_day, meta=(f"{c}_local_sec", "int64")
+                )
+
         elif isinstance(df, (pd.DataFrame, gpd.GeoDataFrame)):
-            localized_timestamp_col = (
-                pd.to_datetime(df[c], utc=True).dt.tz_convert(PACIFIC_TIMEZONE).apply(lambda t: t.replace(tzinfo=None))
-            )
+            df[f"{c}_local"] = localize_partition(df, c)
 
-        df[f"{c}_local"] = localized_timestamp_col
+            if add_seconds:
+                df[f"{c}_local_sec"] = seconds_since_service_day(df[f"{c}_local"])
 
     return df
 
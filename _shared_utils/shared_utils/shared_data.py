@@ -3,9 +3,9 @@ One-off functions, run once, save datasets for shared use.
 """
 import geopandas as gpd
 import pandas as pd
-import shapely
 from calitp_data_analysis import geography_utils, utils
 from calitp_data_analysis.sql import to_snakecase
+from shared_utils import geometry_utils
 from shared_utils.arcgis_query import query_arcgis_feature_server
 
 GCS_FILE_PATH = "gs://calitp-analytics-data/data-analyses/shared_data/"
@@ -108,23 +108,8 @@ def draw_line_between_points(gdf: gpd.GeoDataFrame, group_cols: list) -> gpd.Geo
 
     Segment goes from current to next postmile.
     """
-    # Grab the subsequent point geometry
-    # We can drop whenever the last point is missing within
-    # a group. If we have 3 points, we can draw 2 lines.
-    gdf = gdf.assign(end_geometry=(gdf.groupby(group_cols, group_keys=False).geometry.shift(-1))).dropna(
-        subset="end_geometry"
-    )
-
-    # Construct linestring with 2 point coordinates
-    gdf = (
-        gdf.assign(
-            line_geometry=gdf.apply(lambda x: shapely.LineString([x.geometry, x.end_geometry]), axis=1).set_crs(
-                geography_utils.WGS84
-            )
-        )
-        .drop(columns=["geometry", "end_geometry"])
-        .rename(columns={"line_geometry": "geometry"})
-    )
+    # Lines are built in bulk from the point coordinates
+    gdf = geometry_utils.connect_subsequent_points(gdf, group_cols).set_crs(geography_utils.WGS84, allow_override=True)
 
     return gdf
 
@@ -3,66 +3,33 @@ os.environ["CALITP_BQ_MAX_BYTES"] = str(800_000_000_000)
 
 import branca
 import folium
-from shared_utils import gtfs_utils_v2
+from calitp_data_analysis.geography_utils import WGS84
+from segment_speed_utils import gtfs_schedule_wrangling, helpers
+from shared_utils import rt_dates
 
 from siuba import *
 import pandas as pd
 import geopandas as gpd 
 
-import datetime as dt
 import time
 
 import seaborn as sns
 import matplotlib.pyplot as plt
 
 
-#Function to fetch feeds, trips, stoptimes and stops_geo data from warehouse v2
-def get_feeds_trips_stops_data(selected_agencies, selected_date):
+#Function to get trips and routes per stop for each day type from the cached gtfs_funnel tables (no warehouse queries)
+def get_stop_frequencies(selected_agencies, dates_labelled):
     
-    trip_cols = ["name", "gtfs_dataset_key", "feed_key", "trip_id", "route_id", "route_type"]
-    stoptimes_cols = ["key", "_gtfs_key", "feed_key", "trip_id", "stop_id"]
-    stop_cols = ["feed_key", "stop_id", "geometry", "stop_name", "stop_code", "location_type", "stop_desc"]
+    stop_freq = gtfs_schedule_wrangling.stop_frequencies_by_day_type(
+        dates_labelled, 
+        operator_names=selected_agencies, 
+        by_hour=False
+    )
     
-    feeds = gtfs_utils_v2.schedule_daily_feed_to_gtfs_dataset_name(selected_date=selected_date)
+    if stop_freq.empty:
+        raise ValueError(f"No feeds data found for agencies '{selected_agencies}' on {dates_labelled}.")
     
-    def select_by_agency(df, column, values):
-        if isinstance(values, str):
-            values = [values]  # Convert single string to list of strings
-        
-        selected_df_list = []
-        for value in values:
-            selected_df = df[df[column].str.contains(value, case=False)].copy()
-            selected_df_list.append(selected_df)
-        
-        selected_df_concat = pd.concat(selected_df_list, ignore_index=True)
-        return selected_df_concat
-    
-    feed_data = select_by_agency(feeds, 'name', selected_agencies)
-    
-    if feed_data.empty:
-        raise ValueError(f"No feeds data found for agencies '{selected_agencies}' on {selected_date}.")
-    
-    feed_key_list = feed_data['feed_key'].tolist()
-    
-    trips_data_list = []
-    stoptimes_data_list = []
-    stop_locations_gdf = gpd.GeoDataFrame()
-
-    for feed_key in feed_key_list:
-        trips = gtfs_utils_v2.get_trips(selected_date=selected_date, operator_feeds=[feed_key])[trip_cols]
-        trips_data_list.append(trips)
-        
-        stoptimes = gtfs_utils_v2.get_stop_times(selected_date=selected_date, operator_feeds=[feed_key], 
-                                                trip_df=trips, get_df=True)[stoptimes_cols]
-        stoptimes_data_list.append(stoptimes)
-        
-        stops_gdf = gtfs_utils_v2.get_stops(selected_date=selected_date, operator_feeds=[feed_key])[stop_cols]
-        stop_locations_gdf = pd.concat([stop_locations_gdf, stops_gdf], ignore_index=True)
-    
-    trips_data = pd.concat(trips_data_list, ignore_index=True)
-    stoptimes_data = pd.concat(stoptimes_data_list, ignore_index=True)
-    
-    return feed_data, trips_data, stoptimes_data, stop_locations_gdf
+    return stop_freq
 
 
 #Function to analyze data
@@ -95,33 +62,33 @@ def analyze_dataset(df):
     display(df.head(3))
     print()
 
-#Function to merge stops and trips and aggregate by route type, stop id, feed_key and agencies_name
-def merge_and_aggregate_stops_and_trips(stoptimes_data, trips_data, agg_prefix=''):
-    on_cols = ["trip_id", "feed_key"]
-    how = 'left'
-    joined_df = pd.merge(stoptimes_data, trips_data, on=on_cols, how=how, suffixes=('_stops','_trips'))
-    
-    groupby_cols=['route_type', 'stop_id', 'feed_key', 'name']
-    agg_cols={
-        f'n_trips_{agg_prefix}': ('trip_id', 'nunique'),
-        f'n_routes_{agg_prefix}': ('route_id', 'nunique')
-}
-    aggregated_data = joined_df.groupby(groupby_cols).agg(**agg_cols).reset_index()
-    return aggregated_data 
-
-
-#Function to merge stops_geo and stop_times 
-def merge_stops(stoptimes_data, stops_location_data, on_cols):
-    joined_df = pd.merge(stoptimes_data, stops_location_data, on=on_cols)
-    return joined_df
-
-#Function to merge stoptimes for weekday, saturday and sunday 
-def merge_stoptimes(stoptimes_weekday, stoptimes_sat, stoptimes_sun, merge_cols, final_cols):
-    merged_df = pd.merge(stoptimes_weekday, stoptimes_sat, on=merge_cols, how="outer")
-    merged_df = pd.merge(merged_df, stoptimes_sun, on=merge_cols, how="outer")
-    
-    merged_df=merged_df[final_cols]
-    return merged_df
+#Function to make day types into columns (n_trips_weekday, n_routes_weekday, etc) and attach stop geometry
+def stop_frequencies_wide(stop_freq, dates_labelled):
+    # feed_key can change between dates, so match day types on the operator name + stop_id
+    stop_cols = ["name", "stop_id", "route_type"]
+    
+    wide = stop_freq.pivot(
+        index=stop_cols, columns="day_type", values=["n_trips", "n_routes"]
+    )
+    wide.columns = [f"{metric}_{day_type}" for metric, day_type in wide.columns]
+    wide = wide.reset_index()
+    
+    # take stop name / geometry from the first day type the stop shows up in
+    feed_names = stop_freq[["day_type", "feed_key", "name"]].drop_duplicates()
+    stops = pd.concat([
+        helpers.import_scheduled_stops(
+            analysis_date,
+            filters=[[("feed_key", "in", feed_names[feed_names.day_type == day_type].feed_key.tolist())]],
+            columns=["feed_key", "stop_id", "stop_name", "geometry"],
+            get_pandas=True,
+            crs=WGS84
+        ) for day_type, analysis_date in dates_labelled.items()
+    ], ignore_index=True).merge(
+        feed_names[["feed_key", "name"]].drop_duplicates(), on="feed_key"
+    ).drop_duplicates(subset=["name", "stop_id"])
+    
+    gdf = pd.merge(stops, wide, on=["name", "stop_id"], how="inner")
+    return gpd.GeoDataFrame(gdf, geometry="geometry", crs=WGS84)
 
 #Function to plot trips per stops and routes per stop
 import matplotlib.pyplot as plt
@@ -133,41 +100,20 @@ def plot_histogram(data, column, title):
     plt.show()
 
 
-analysis_dt = dt.date(2022,6,1)
-analysis_sat = dt.date(2022,6,4)
-analysis_sun = dt.date(2022,6,5)
-    
-dates_labelled = {'weekday': analysis_dt, 'saturday': analysis_sat, 'sunday': analysis_sun}
+# cached gtfs_funnel tables are available for the rt_dates full weeks
+dates_labelled = {
+    'weekday': rt_dates.DATES["apr2024"], 
+    'saturday': rt_dates.DATES["apr2024e"], 
+    'sunday': rt_dates.DATES["apr2024f"]
+}
 selected_agencies = ['LA Metro', 'Salinas', 'SBMTD']
-     
-warehouse_data_by_date = {}
-for daytype in dates_labelled.keys():
-    print(daytype)
-    analysis_dt = dates_labelled[daytype]
-    # tuple ordered: feed_data, trips_data, stoptimes_data, stop_locations_gdf
-    warehouse_data_by_date[daytype] = get_feeds_trips_stops_data(selected_agencies, analysis_dt)
-        
-    stops_all = []
 
-for daytype in dates_labelled.keys():
-    print(daytype)
-    analysis_dt = dates_labelled[daytype]
-    trips = warehouse_data_by_date[daytype][1]
-    st = warehouse_data_by_date[daytype][2]
-    stops = warehouse_data_by_date[daytype][3]
-    st_merged = merge_and_aggregate_stops_and_trips(trips, st, agg_prefix=daytype)
-    stop_merged = merge_stops(st_merged, stops, ["stop_id", "feed_key"])
-    stops_all.append(stop_merged)
-        
-merge_cols = ["name","route_type", "stop_id","geometry", "stop_code", "stop_name", "location_type"]
-final_cols = ["name","location_type","route_type","stop_name","stop_id","stop_code","geometry","n_trips_weekday","n_trips_saturday","n_trips_sunday","n_routes_weekday","n_routes_saturday","n_routes_sunday", "stop_desc"]
-    
-stoptimes_all = merge_stoptimes(*stops_all, merge_cols=merge_cols, final_cols=final_cols)
-stoptimes_all_gdf = gpd.GeoDataFrame(stoptimes_all, geometry='geometry')
+stop_freq = get_stop_frequencies(selected_agencies, dates_labelled)
+stoptimes_all_gdf = stop_frequencies_wide(stop_freq, dates_labelled)
 filtered_stoptimes_all_gdf = stoptimes_all_gdf[stoptimes_all_gdf['route_type'] == '3']
     
 GCS_FILE_PATH  = 'gs://calitp-analytics-data/data-analyses/ahsc_grant'
-filtered_stoptimes_all_gdf.to_parquet(f"{GCS_FILE_PATH}/tbl1_trips_perstop_07_08_2024.parquet")
-    
-
-    
+# tbl1_trips_perstop_07_08_2024 (Jun 2022 warehouse data, with stop_code / location_type / stop_desc)
+# is left as is, the cached tables have a different week and don't carry those stop columns
+filtered_stoptimes_all_gdf.to_parquet(
+    f"{GCS_FILE_PATH}/tbl1_trips_perstop_{dates_labelled['weekday']}.parquet")
@@ -2,19 +2,30 @@
 Create analysis data for service increase estimator
 and tract-level stats.
 """
-import dask.dataframe as dd
 import datetime
+import gcsfs
 import geopandas as gpd
 import intake
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 from dask import delayed, compute
 
 from calitp_data_analysis import geography_utils, utils
 from segment_speed_utils import helpers
-from shared_utils import portfolio_utils, publish_utils
+from shared_utils import portfolio_utils
 
 catalog = intake.open_catalog("*.yml")
+fs = gcsfs.GCSFileSystem()
+
+GRID_COLS = [
+    "schedule_gtfs_dataset_key", 
+    "day_name", "departure_hour",
+    "route_id", "shape_id"
+]
+GRID_HOURS = range(0, 25) # set this to be all hours
 
 #------------------------------------------------------------------#
 ## Functions to create operator-route-level dataset
@@ -51,48 +62,166 @@ def calculate_frequency(
     return trips_per_hour2
 
 
+def define_grid_axes(
+    df: pd.DataFrame,
+    group_cols: list = GRID_COLS,
+    hours: range = GRID_HOURS
+) -> dict:
+    """
+    The dense grid is never stored, only its definition.
+    Each axis is the unique values of that column, 
+    except departure_hour, which is all hours (or just the hours passed in).
+    The grid is every combination of the axes (in group_cols order),
+    operator-day_name-hour-route-shape.
+    """
+    return {
+        c: np.asarray(hours) if c == "departure_hour" 
+        else pd.unique(df[c]) 
+        for c in group_cols
+    }
+
+
+def locate_in_grid(
+    df: pd.DataFrame, 
+    axes: dict
+) -> np.ndarray:
+    """
+    Position of each sparse row within the flattened dense grid.
+    Rows with a value not on an axis get -1.
+    """
+    positions = [pd.Index(values).get_indexer(df[c]) 
+                 for c, values in axes.items()]
+    on_grid = np.all([p >= 0 for p in positions], axis=0)
+    
+    cells = np.full(len(df), -1, dtype="int64")
+    cells[on_grid] = np.ravel_multi_index(
+        [p[on_grid] for p in positions], 
+        [len(v) for v in axes.values()]
+    )
+    
+    return cells
+
+
+def expand_sparse_grid(
+    df: pd.DataFrame,
+    axes: dict,
+    chunk_rows: int = None
+):
+    """
+    Generator of the dense grid, chunk_rows at a time,
+    with rows that don't have service filled in with zeros. 
+    Only the cells in the current chunk are held in memory.
+    Other columns from df are kept, null where there is no service.
+    """
+    group_cols = list(axes.keys())
+    shape = [len(v) for v in axes.values()]
+    n_cells = int(np.prod(shape))
+    chunk_rows = chunk_rows or max(n_cells, 1)
+    
+    cells = locate_in_grid(df, axes)
+    
+    sparse = (df.drop(columns = group_cols)
+              .assign(cell = cells)
+              .loc[cells >= 0]
+              .drop_duplicates("cell", keep="first")
+              .set_index("cell")
+             )
+    
+    for start in range(0, n_cells, chunk_rows):
+        chunk_cells = np.arange(start, min(start + chunk_rows, n_cells))
+        chunk_position = np.unravel_index(chunk_cells, shape)
+        
+        chunk = pd.concat([
+            pd.DataFrame({
+                c: axes[c][i] for c, i in zip(group_cols, chunk_position)
+            }),
+            sparse.reindex(chunk_cells).reset_index(drop=True)
+        ], axis=1)
+        
+        # Fill with zeroes
+        chunk = chunk.assign(
+            n_trips = chunk.n_trips.fillna(0).astype("int32"),
+        ).astype({
+            "departure_hour": "int8"
+        })
+        
+        yield chunk
+        
+
 def expand_rows_fill_with_zeros(
     df: pd.DataFrame,
-    group_cols: list = [
-        "schedule_gtfs_dataset_key", 
-        "day_name", "departure_hour",
-        "route_id", "shape_id"
-    ]
+    group_cols: list = GRID_COLS
 ) -> pd.DataFrame:
     """
     Use group_cols to uniquely identify a row that we want to expand 
     and fill in rows that don't have service with zeros. 
     We will use operator-day_name-hour-route-shape.
+    For large grids, use expand_sparse_grid in chunks instead.
     """    
-    # Set the iterables to be exact order as shape_cols
-    iterables = [
-        df.schedule_gtfs_dataset_key.unique(),
-        df.day_name.unique(),
-        range(0, 25), # set this to be all hours
-        df.route_id.unique(),
-        df.shape_id.unique(),
-    ]
-    
-    multi_ix = pd.MultiIndex.from_product(
-        iterables, 
-        names = group_cols
+    return pd.concat(
+        expand_sparse_grid(df, define_grid_axes(df, group_cols)), 
+        axis=0, ignore_index=True
     )
+
+
+def expand_operators(
+    sparse_file: str,
+    operators: list,
+    hours: range = GRID_HOURS,
+    chunk_rows: int = 5_000_000
+):
+    """
+    Generator of the dense grid for each operator, 
+    read from the sparse frequency table one operator at a time
+    and expanded chunk_rows at a time.
+    Pass hours to only expand some hours.
+    """
+    for one_operator in operators:
+        one_df = pd.read_parquet(
+            sparse_file,
+            filters = [[("schedule_gtfs_dataset_key", "==", one_operator)]]
+        )
+        
+        yield from expand_sparse_grid(
+            one_df, define_grid_axes(one_df, hours = hours), chunk_rows)
+            
+
+def write_dense_grid(
+    sparse_file: str,
+    operators: list,
+    export_file: str,
+    chunk_rows: int = 5_000_000
+):
+    """
+    Expand each operator's sparse frequency table into the 
+    dense grid and stream the chunks into one parquet,
+    so no more than one chunk is in memory at a time.
+    """
+    sparse_schema = pq.read_schema(sparse_file)
     
-    df2 = df.set_index(group_cols)
-    df2 = df2[~df2.index.duplicated(keep="first")]
-    
-    df_expanded = (df2.reindex(multi_ix)
-                   .reset_index()
-                  )
-    
-    # Fill with zeroes
-    df_expanded = df_expanded.assign(
-        n_trips = df_expanded.n_trips.fillna(0).astype("int32"),
-    ).astype({
-        "departure_hour": "int8"
-    })
+    with fs.open(export_file, "wb") as f:
+        writer = None
+        
+        for chunk in expand_operators(sparse_file, operators, chunk_rows = chunk_rows):
+                
+            if writer is None:
+                # Types come from the sparse file, so chunks that are
+                # all nulls in a column still line up
+                schema = pa.schema([
+                    pa.field("departure_hour", pa.int8()) if c == "departure_hour" 
+                    else pa.field("n_trips", pa.int32()) if c == "n_trips"
+                    else sparse_schema.field(c)
+                    for c in chunk.columns
+                ])
+                writer = pq.ParquetWriter(f, schema)
+
+            writer.write_table(
+                pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+        
+        if writer is not None:
+            writer.close()
     
-    return df_expanded
+    return
     
 
 def clip_shapes(
@@ -289,7 +418,7 @@ def create_bus_arrivals_by_tract_data(selected_date: str):
     
 if __name__ == "__main__":
     
-    from service_increase_vars import dates, DATA_PATH
+    from service_increase_vars import dates, DATA_PATH, EXPAND_DENSE
     
     start = datetime.datetime.now()
     
@@ -328,39 +457,18 @@ if __name__ == "__main__":
     ).schedule_gtfs_dataset_key.unique()
     
     
-    frequency_dfs = [
-        delayed(pd.read_parquet)(
-           f"{DATA_PATH}shape_frequency.parquet",
-           filters = [[("schedule_gtfs_dataset_key", "==", one_operator)]]
-    ) for one_operator in operators]
-    
-    expanded_dfs = [
-        delayed(expand_rows_fill_with_zeros)(one_df) 
-        for one_df in frequency_dfs
-    ]
-    
-    results_ddf = dd.from_delayed(expanded_dfs) 
-    
+    # shape_frequency is the sparse form (only hours with service)
+    # and the grid axes can always be derived from it (define_grid_axes).
+    # Downstream scripts expand it as they go (expand_operators), 
+    # shapes_processed is only written if EXPAND_DENSE is set.
     SHAPES_PROCESSED_FILE = "shapes_processed"
     
-    # Partitioned parquet as a release valve since we're 
-    # running close to memory
-    results_ddf.to_parquet(
-        f"{DATA_PATH}{SHAPES_PROCESSED_FILE}", 
-        partition_on = "schedule_gtfs_dataset_key",
-        overwrite=True
-    )
-    
-    shapes_processed = pd.read_parquet(
-        f"{DATA_PATH}{SHAPES_PROCESSED_FILE}/"
-    )
-    
-    shapes_processed.to_parquet(f"{DATA_PATH}{SHAPES_PROCESSED_FILE}.parquet")
-
-    publish_utils.if_exists_then_delete(
-        f"{DATA_PATH}{SHAPES_PROCESSED_FILE}/")
-    print("delete partitioned")
-    del shapes_processed
+    if EXPAND_DENSE:
+        write_dense_grid(
+            f"{DATA_PATH}shape_frequency.parquet",
+            operators,
+            f"{DATA_PATH}{SHAPES_PROCESSED_FILE}.parquet",
+        )
 
     time2 = datetime.datetime.now()
     print(f"save expanded df: {time2 - time1}")
@@ -1,3 +1,4 @@
+import gcsfs
 import geopandas as gpd
 import pandas as pd
 
@@ -6,9 +7,12 @@ from typing import Literal
 
 from calitp_data_analysis import utils
 from calitp_data_analysis.geography_utils import WGS84
+from create_analysis_data import expand_operators
 from segment_speed_utils import helpers
 from service_increase_vars import PUBLIC_GCS, DATA_PATH, dates
 
+fs = gcsfs.GCSFileSystem()
+
 def crosswalk_with_identifiers(
     date_list: list
 ) -> pd.DataFrame:
@@ -72,6 +76,25 @@ def export_parquet_as_csv_or_geojson(
         
     return
 
+def export_dense_grid_as_csv(
+    sparse_file: str,
+    export_file: str
+):
+    """
+    Expand the sparse frequency table into the 
+    operator-day_name-hour-route-shape grid (with zeros)
+    and stream it into one csv, so the dense parquet isn't needed.
+    """
+    operators = pd.read_parquet(
+        sparse_file, columns = ["schedule_gtfs_dataset_key"]
+    ).schedule_gtfs_dataset_key.unique()
+    
+    with fs.open(export_file, "w") as f:
+        for i, chunk in enumerate(expand_operators(sparse_file, operators)):
+            chunk.to_csv(f, header = (i == 0), index=False)
+    
+    return
+
 if __name__ == "__main__":
     
     all_dates = list(dates.values())
@@ -82,8 +105,10 @@ if __name__ == "__main__":
         f"gtfs_crosswalk.csv", index=False
     )
     
-    export_parquet_as_csv_or_geojson(
-        f"{DATA_PATH}shapes_processed.parquet", "df")
+    export_dense_grid_as_csv(
+        f"{DATA_PATH}shape_frequency.parquet",
+        f"{PUBLIC_GCS}bus_service_increase/shapes_processed.csv"
+    )
     
     export_parquet_as_csv_or_geojson(
         f"{DATA_PATH}shapes_categorized.parquet", "gdf")
@@ -9,3 +9,7 @@ dates = {
     "sat": rt_dates.DATES["oct2023e"],
     "sun": rt_dates.DATES["oct2023f"],
 }
+
+# Write the dense operator-day_name-hour-route-shape grid (shapes_processed).
+# Scripts downstream expand the sparse shape_frequency table themselves.
+EXPAND_DENSE = False
@@ -6,6 +6,8 @@ import pandas as pd
 from siuba import *
 
 from bus_service_utils import utils as bus_utils
+from create_analysis_data import expand_operators
+from service_increase_vars import DATA_PATH, dates
 
 ## {tract type: target trips per hour}
 TARGET_FREQ = {
@@ -14,17 +16,18 @@ TARGET_FREQ = {
     'rural': 1
 } 
 
+# Keep 5am-9pm hours
+SERVICE_HOURS = range(5, 21)
+
 
 # Merge routes with tract type (notebook A3)
 def merge_shapes_with_tract_type(selected_date: str) -> pd.DataFrame:
     """
+    Expand the sparse shape_frequency table one operator at a time
+    (hours without service are filled in with zeros) for 5am-9pm,
+    and attach the target frequency for the shape's tract type.
     """
-    # Filter and keep 5am-9pm hours
-    service_by_shape = dd.read_parquet(
-        f"{DATA_PATH}shapes_processed.parquet", 
-        filters = [[("departure_hour", ">", 4),
-                    ("departure_hour", "<", 21)]]
-    ).repartition(npartitions=20)
+    sparse_file = f"{DATA_PATH}shape_frequency.parquet"
     
     shapes_categorized = pd.read_parquet(
         f"{DATA_PATH}shapes_categorized_{selected_date}.parquet",
@@ -35,30 +38,42 @@ def merge_shapes_with_tract_type(selected_date: str) -> pd.DataFrame:
         target_trips = shapes_categorized.tract_type.map(TARGET_FREQ)
     )
     
-    service_by_tract_type = dd.merge(
-        service_by_shape,
-        shapes_categorized,
-        on = ["schedule_gtfs_dataset_key", "shape_id"],
-        how = "inner"
-    )
-    
-    avg_service = (service_by_tract_type
-                   .groupby(["schedule_gtfs_dataset_key", 
-                             "shape_id"],
-                            observed=True, group_keys=False)
-                   .agg({"avg_service_minutes": "mean"})
-                   .reset_index()
-                  ).query(
+    service_by_tract_type = pd.concat([
+        pd.merge(
+            chunk,
+            shapes_categorized,
+            on = ["schedule_gtfs_dataset_key", "shape_id"],
+            how = "inner"
+        ) for chunk in expand_operators(
+            sparse_file, 
+            shapes_categorized.schedule_gtfs_dataset_key.unique(),
+            hours = SERVICE_HOURS
+        )
+    ], axis=0, ignore_index=True)
+    
+    # avg_service_minutes is null in the hours without service, 
+    # so the average can come straight from the sparse rows
+    avg_service = (pd.read_parquet(
+        sparse_file,
+        filters = [[("departure_hour", ">", 4),
+                    ("departure_hour", "<", 21)]],
+        columns = ["schedule_gtfs_dataset_key", "shape_id", 
+                   "avg_service_minutes"]
+        ).groupby(["schedule_gtfs_dataset_key", 
+                   "shape_id"],
+                  observed=True, group_keys=False)
+        .agg({"avg_service_minutes": "mean"})
+        .reset_index()
+    ).query(
         'avg_service_minutes.notna()'
     ).rename(
         columns = {"avg_service_minutes": "avg_runtime"}
-    ).repartition(npartitions=1)
-
+    )
     
     # fill in missing avg_service_minutes with the mean of 
     # avg_service_minutes across hours / days / routes (but same shape)
     # if it can't be filled in, then drop
-    df = dd.merge(
+    df = pd.merge(
         service_by_tract_type,
         avg_service,
         on = ["schedule_gtfs_dataset_key", "shape_id"],
@@ -76,7 +91,7 @@ def merge_shapes_with_tract_type(selected_date: str) -> pd.DataFrame:
         additional_trips = df.target_trips - df.n_trips
     )
     
-    return df.compute()
+    return df
 
 # Calculate route-level additional service hours / trips / annual extrapolation
 def add_additional_trips_and_annualize(df):
@@ -195,20 +210,13 @@ def calculate_operator_capex(service_increase_df, ntd_joined):
     
 if __name__ == "__main__":
     
+    selected_date = dates["wed"]
+    
     # Merge in tract type
     df = merge_shapes_with_tract_type(selected_date)
-    df = df.persist()
     
     # Calculate service hrs, trips by route and extrapolate to annual numbers
-    df2 = df.map_partitions(
-        add_additional_trips_and_annualize,
-        meta = {**df.dtypes.to_dict(),
-            "additional_trips": "int",
-            "annual_service_hrs": "float",
-            "annual_addl_service_hrs": "float",
-           },
-        align_dataframes = True
-    ).compute()
+    df2 = add_additional_trips_and_annualize(df)
     
     df2.to_parquet(f"{DATA_PATH}service_increase.parquet")
     
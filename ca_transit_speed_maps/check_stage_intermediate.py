@@ -6,47 +6,33 @@ from siuba import *
 import pandas as pd
 import datetime as dt
 
-import shared_utils
 from rt_analysis import rt_parser
 import tqdm
 import warnings
-from build_speedmaps_index import ANALYSIS_DATE
-
-def stage_intermediate_data(row: pd.Series, pbar: tqdm.tqdm) -> None:
-    '''
-    Call using pd.apply for convienient iteration.
-    Save progress to parquet after running each agency in case script is interrupted
-    That progress parquet (when complete) is used in next script, actual output is ignored
-    '''
-    global speedmaps_index_joined
-    analysis_date = row.analysis_date
-    progress_path = f'./_rt_progress_{analysis_date}.parquet'
-        
-    if row.status != 'already_ran':
-        try:
-            rt_day = rt_parser.OperatorDayAnalysis(row.organization_itp_id,
-                                                   analysis_date, pbar)
-            rt_day.export_views_gcs()
-            row.status = 'already_ran'
-        except Exception as e:
-            print(f'{row.organization_itp_id} parser failed: {e}')
-            row.status = 'parser_failed'
-        speedmaps_index_joined.loc[row.name] = row
-        speedmaps_index_joined.to_parquet(progress_path)
-    
-    return  
+from build_speedmaps_index import ANALYSIS_DATE, PROGRESS_PATH
 
 if __name__ == "__main__":
     
-    speedmaps_index_joined = shared_utils.rt_utils.check_intermediate_data(
-        analysis_date = ANALYSIS_DATE)    # check if this stage needed
-    if speedmaps_index_joined.status.isin(['already_ran', 'parser_failed',
-                                           'map_confirmed', 'map_failed']).all():
+    speedmaps_index = pd.read_parquet(PROGRESS_PATH)
+    progress = rt_parser.speedmap_progress_table(speedmaps_index, ANALYSIS_DATE)
+    
+    # check if this stage needed
+    if progress.status.isin(['already_ran', 'parser_failed',
+                             'map_confirmed', 'map_failed']).all():
         print('already attempted to stage all intermediate data:')
     else:
-        pbar = tqdm.tqdm()
+        # each operator runs in its own worker and writes a checkpoint when done,
+        # if interrupted, rerunning picks up where it left off
+        to_run = progress[progress.status == 'speedmap_segs_available']
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
-            _ = speedmaps_index_joined.apply(stage_intermediate_data, axis = 1, args=[pbar])
+            rt_parser.run_operators(ANALYSIS_DATE, to_run.organization_itp_id.to_list(),
+                                    pbar = tqdm.tqdm())
         print()
         print('intermediate data stage attempt complete:')
+        progress = rt_parser.speedmap_progress_table(speedmaps_index, ANALYSIS_DATE)
+        
+    # status is persisted back to the progress parquet for notebooks
+    # and signal_tools.score_signals_statewide that filter on it
+    progress.to_parquet(PROGRESS_PATH)
+    print(progress.status.value_counts())
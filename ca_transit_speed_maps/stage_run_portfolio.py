@@ -12,13 +12,12 @@ from siuba import *
 
 import datetime as dt
 from rt_analysis import rt_parser
-from shared_utils import rt_utils
 
 import os
 
 import pyaml
 import yaml
-from build_speedmaps_index import ANALYSIS_DATE
+from build_speedmaps_index import ANALYSIS_DATE, PROGRESS_PATH
 
 def make_rt_site_yml(speedmaps_index_joined,
                        rt_site_path = '../portfolio/sites/rt.yml'):
@@ -74,8 +73,8 @@ def deploy_portfolio():
 
 if __name__ == "__main__":
 
-    speedmaps_index_joined = rt_utils.check_intermediate_data(
-        analysis_date = ANALYSIS_DATE)
+    speedmaps_index_joined = rt_parser.speedmap_progress_table(
+        pd.read_parquet(PROGRESS_PATH), ANALYSIS_DATE)
     make_rt_site_yml(speedmaps_index_joined)
     stage_portfolio()
     deploy_portfolio()
\ No newline at end of file
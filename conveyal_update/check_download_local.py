@@ -0,0 +1,104 @@
+'''
+Check download_data against a local http server standing in for the raw schedule bucket,
+so the downloader can be tried out without GCS.
+
+Serves a temp folder laid out like RAW_SCHEDULE_ROOT, downloads it twice
+(the second run should find every feed unchanged), then scrapes one feed again
+(a later ts= folder) and makes sure only that one is downloaded again.
+Also checks that nothing but feed zips ends up in the folder that gets bundled.
+
+python check_download_local.py
+'''
+import datetime as dt
+import fsspec
+import functools
+import glob
+import http.server
+import io
+import os
+import tempfile
+import threading
+import pandas as pd
+
+import conveyal_vars
+import download_data
+
+def write_fake_feed(source_dir: str, row, ts: str = '00:00:00'):
+    path = (f'{source_dir}/dt={row.date.strftime("%Y-%m-%d")}/ts={row.date.isoformat()}T{ts}'
+            f'/base64_url={row.base64_url}/gtfs.zip')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(os.urandom(10_000))
+
+class RawListingHandler(http.server.SimpleHTTPRequestHandler):
+    '''
+    http.server percent-encodes the links in directory listings (dt%3D...),
+    list names as is (like the bucket's object names) so fsspec's http glob matches them
+    '''
+    def list_directory(self, path):
+        names = sorted(os.listdir(path))
+        body = ''.join(f'<a href="{name}{"/" if os.path.isdir(os.path.join(path, name)) else ""}">{name}</a>\n'
+                       for name in names).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        return io.BytesIO(body)
+
+    def log_message(self, format, *args):
+        return
+
+def serve_folder(folder: str):
+    '''
+    start a local http server for folder in a background thread, returns the server and its url
+    '''
+    handler = functools.partial(RawListingHandler, directory=folder)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+def bundled_files(download_dir: str):
+    return sorted(os.path.relpath(path, download_dir) for path in
+                  glob.glob(f'{download_dir}/**/*', recursive=True) if os.path.isfile(path))
+
+if __name__ == '__main__':
+
+    region = list(conveyal_vars.conveyal_regions.keys())[0]
+    feeds_df = pd.DataFrame({
+        'region': region,
+        'date': dt.date(2024, 10, 16),
+        'feed_key': ['feed_a', 'feed_b', 'feed_c'],
+        'gtfs_dataset_name': ['Feed A Schedule', 'Feed B Schedule', 'Feed C Schedule'],
+        'base64_url': ['YQ', 'Yg', 'Yw'],
+    })
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source_dir = f'{tmp}/schedule'
+        for row in feeds_df.itertuples():
+            write_fake_feed(source_dir, row)
+        server, url = serve_folder(tmp)
+
+        download_kwargs = dict(filesystem = fsspec.filesystem('http'), source_root = f'{url}/schedule',
+                               download_dir = f'{tmp}/feeds')
+        try:
+            download_data.download_regions(feeds_df, [region], **download_kwargs)
+            first = download_data.read_checksums(f'{tmp}/feeds')
+            assert len(first) == len(feeds_df)
+
+            # nothing changed, every feed should be skipped
+            download_data.download_regions(feeds_df, [region], **download_kwargs)
+            assert download_data.read_checksums(f'{tmp}/feeds') == first
+
+            # feed scraped again later that day, only that one is downloaded again
+            write_fake_feed(source_dir, next(feeds_df.itertuples()), ts = '12:00:00')
+            download_data.download_regions(feeds_df, [region], **download_kwargs)
+            second = download_data.read_checksums(f'{tmp}/feeds')
+            changed = [name for name in first if first[name]['sha256'] != second[name]['sha256']]
+            assert changed == [download_data.feed_filename(next(feeds_df.itertuples()))]
+
+            expected = sorted(download_data.feed_filename(row) for row in feeds_df.itertuples())
+            assert bundled_files(f'{tmp}/feeds') == expected, bundled_files(f'{tmp}/feeds')
+        finally:
+            server.shutdown()
+
+    print('local download check passed')
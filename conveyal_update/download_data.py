@@ -1,35 +1,137 @@
+import hashlib
+import json
 import os
+import time
 from calitp_data_analysis import get_fs
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from siuba import *
 
 from tqdm import tqdm
-tqdm.pandas()
 
 fs = get_fs()
 
 import conveyal_vars
+import glob
 import shutil
 
 regions = conveyal_vars.conveyal_regions
 TARGET_DATE = conveyal_vars.TARGET_DATE
 
-regions_and_feeds = pd.read_parquet(f'{conveyal_vars.GCS_PATH}regions_feeds_{TARGET_DATE.isoformat()}.parquet')
+RAW_SCHEDULE_ROOT = 'gs://calitp-gtfs-schedule-raw-v2/schedule'
+MAX_WORKERS = 8
+MAX_RETRIES = 3
 
-def download_feed(row):
+def read_regions_and_feeds(target_date = TARGET_DATE):
+    # from match_feeds_regions.py, read when needed so importing this module doesn't hit GCS
+    return pd.read_parquet(f'{conveyal_vars.GCS_PATH}regions_feeds_{target_date.isoformat()}.parquet')
+
+def feed_source_uri(row, source_root: str = RAW_SCHEDULE_ROOT):
     # need wildcard for file too -- not all are gtfs.zip!
-    uri = f'gs://calitp-gtfs-schedule-raw-v2/schedule/dt={row.date.strftime("%Y-%m-%d")}/*/base64_url={row.base64_url}/*.zip'
-    fs.get(uri, f'{row.path}/{row.gtfs_dataset_name.replace(" ", "_")}_{row.feed_key}_gtfs.zip')
-    # print(f'downloaded {row.path}/{row.feed_key}_gtfs.zip')
+    return f'{source_root}/dt={row.date.strftime("%Y-%m-%d")}/*/base64_url={row.base64_url}/*.zip'
+
+def feed_filename(row):
+    return f'{row.region}/{row.gtfs_dataset_name.replace(" ", "_")}_{row.feed_key}_gtfs.zip'
+
+def sha256_file(path: str):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def checksum_path(download_dir: str):
+    # kept next to (not inside) the download folder, which gets zipped up as the bundle
+    return f'{download_dir}_checksums.json'
+
+def read_checksums(download_dir: str):
+    path = checksum_path(download_dir)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def write_checksums(checksums: dict, download_dir: str):
+    # write to a temp file and swap it in, so a killed run never leaves a partial json
+    path = checksum_path(download_dir)
+    with open(f'{path}.part', 'w') as f:
+        json.dump(checksums, f, indent=2)
+    os.replace(f'{path}.part', path)
+
+def download_feed(row, download_dir: str, prior: dict = None, 
+                  filesystem = fs, source_root: str = RAW_SCHEDULE_ROOT):
+    '''
+    download one feed zip to download_dir/region/.
+    the source checksum comes from the object metadata (filesystem.checksum), if the source and
+    its checksum match the prior download and the local file is intact (sha256), the download is skipped.
+    otherwise download to a .part file and rename it into place once complete.
+    filesystem / source_root can point to any fsspec filesystem laid out like the raw schedule bucket
+    (gcs here, a local folder or http server for testing).
+    returns the checksum entry for this feed.
+    '''
+    matches = sorted(filesystem.glob(feed_source_uri(row, source_root)))
+    assert len(matches) > 0, f'no zip found for {row.feed_key}'
+    # if the feed was scraped more than once that day, take the latest ts
+    source = matches[-1]
+    source_checksum = str(filesystem.checksum(source))
     
-def download_region(feeds_df, region: str):
+    local_path = f'{download_dir}/{feed_filename(row)}'
+    if (prior and prior['source'] == source and prior['source_checksum'] == source_checksum and 
+        os.path.exists(local_path) and sha256_file(local_path) == prior['sha256']):
+        return {**prior, 'downloaded': False}
+    
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            filesystem.get(source, f'{local_path}.part')
+            break
+        except Exception as e:
+            if attempt == MAX_RETRIES:
+                # don't leave a partial zip behind to get bundled
+                if os.path.exists(f'{local_path}.part'):
+                    os.remove(f'{local_path}.part')
+                raise
+            print(f'retrying {row.feed_key} after: {e}')
+            time.sleep(2 ** attempt)
+    os.replace(f'{local_path}.part', local_path)
+    
+    return {'source': source, 'source_checksum': source_checksum, 
+            'sha256': sha256_file(local_path), 'downloaded': True}
+
+def download_regions(feeds_df, region_list: list, max_workers: int = MAX_WORKERS, 
+                     filesystem = fs, source_root: str = RAW_SCHEDULE_ROOT, download_dir: str = None):
+    '''
+    download the feeds for all regions in region_list with a pool of max_workers threads.
+    the checksum json next to the download folder records each finished feed, so an interrupted
+    run picks up where it left off and unchanged feeds aren't downloaded again.
+    '''
+    assert all(region in regions.keys() for region in region_list)
+    download_dir = download_dir or f'./feeds_{feeds_df.date.iloc[0].strftime("%Y-%m-%d")}'
+    for region in region_list:
+        os.makedirs(f'{download_dir}/{region}', exist_ok=True)
+    # partial downloads left by a killed run
+    for part in glob.glob(f'{download_dir}/*/*.part'):
+        os.remove(part)
     
-    assert region in regions.keys()
-    path = f'./feeds_{feeds_df.date.iloc[0].strftime("%Y-%m-%d")}/{region}'
-    if not os.path.exists(path): os.makedirs(path)
-    region = (feeds_df >> filter(_.region == region)).copy()
-    region['path'] = path
-    region.progress_apply(download_feed, axis = 1)
+    feeds = feeds_df >> filter(_.region.isin(region_list))
+    checksums = read_checksums(download_dir)
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(
+                download_feed, row, download_dir, checksums.get(feed_filename(row)), 
+                filesystem, source_root
+            ): feed_filename(row) for row in feeds.itertuples()
+        }
+        n_downloaded = 0
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            result = future.result()
+            n_downloaded += result.pop('downloaded')
+            checksums[futures[future]] = result
+            write_checksums(checksums, download_dir)
+    print(f'downloaded {n_downloaded} feeds, {len(futures) - n_downloaded} unchanged')
+    
+def download_region(feeds_df, region: str):
+    download_regions(feeds_df, [region])
     
 def generate_script(regions):
     #  https://docs.conveyal.com/prepare-inputs#preparing-the-osm-data
@@ -44,8 +146,8 @@ def generate_script(regions):
         
 if __name__ == '__main__':
     
-    for region in tqdm(regions.keys()):
-        download_region(regions_and_feeds, region)
+    regions_and_feeds = read_regions_and_feeds()
+    download_regions(regions_and_feeds, list(regions.keys()))
     shutil.make_archive(f'feeds_{TARGET_DATE}', 'zip', f'./feeds_{TARGET_DATE}/')
     fs.put(f'feeds_{TARGET_DATE}.zip', f'{conveyal_vars.GCS_PATH}feeds_{TARGET_DATE}.zip')
     generate_script(regions)
\ No newline at end of file
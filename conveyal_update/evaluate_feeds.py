@@ -9,13 +9,14 @@ import datetime as dt
 
 import conveyal_vars
 
-def check_defined_elsewhere(row, df):
+def check_defined_elsewhere(df: pd.DataFrame):
     '''
-    for feeds without service defined, check if the same service is captured in another feed that does include service
+    for feeds without service defined, check if the same service is captured in another feed that does include service.
+    services from feeds with service defined are collected once, then every feed is a hashed lookup against them.
     '''
-    is_defined = ((df >> filter(-_.n.isna())).service_key == row.service_key).any()
-    row['service_any_feed'] = is_defined
-    return row
+    services_defined = df.loc[df.n.notna(), 'service_key'].dropna().unique()
+    df = df.assign(service_any_feed = df.service_key.isin(services_defined))
+    return df
 
 TARGET_DATE = conveyal_vars.TARGET_DATE
 
@@ -53,7 +54,7 @@ def attach_transit_services(feeds_on_target: pd.DataFrame):
         
 def report_undefined(feeds_on_target: pd.DataFrame):
     fname = 'no_apparent_service.csv'
-    undefined = feeds_on_target.apply(check_defined_elsewhere, axis=1, args=[feeds_on_target]) >> filter(-_.service_any_feed)
+    undefined = check_defined_elsewhere(feeds_on_target) >> filter(-_.service_any_feed)
     print('these feeds have no service defined on target date, nor are their services captured in other feeds:')
     print(undefined >> select(_.gtfs_dataset_name, _.service_any_feed))
     print(f'saving detailed csv to {fname}')
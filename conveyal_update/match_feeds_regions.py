@@ -17,19 +17,27 @@ feeds_on_target = pd.read_parquet(f'{conveyal_vars.GCS_PATH}feeds_{TARGET_DATE.i
 
 def create_region_gdf():
     # https://shapely.readthedocs.io/en/stable/reference/shapely.box.html#shapely.box
-    # xmin, ymin, xmax, ymax
-    to_bbox = lambda x: [x['west'], x['south'], x['east'], x['north']]
+    # xmin, ymin, xmax, ymax, boxes for all regions built at once
     df = pd.DataFrame(regions).transpose().reset_index().rename(columns={'index':'region'})
-    df['bbox'] = df.apply(to_bbox, axis=1)
-    df['geometry'] = df.apply(lambda x: shapely.geometry.box(*x.bbox), axis = 1)
-    df = df >> select(-_.bbox)
+    df['geometry'] = shapely.box(
+        df.west.astype(float), df.south.astype(float), 
+        df.east.astype(float), df.north.astype(float)
+    )
     region_gdf = gpd.GeoDataFrame(df, crs=geography_utils.WGS84).to_crs(geography_utils.CA_NAD83Albers)
     return region_gdf
 
 def join_stops_regions(region_gdf: gpd.GeoDataFrame, feeds_on_target: pd.DataFrame):
+    '''
+    find which feeds have stops in each region. 
+    stops go into an STRtree once, and all the region boxes are queried against it together.
+    '''
     all_stops = gtfs_utils_v2.get_stops(selected_date=TARGET_DATE, operator_feeds=feeds_on_target.feed_key).to_crs(geography_utils.CA_NAD83Albers)
-    region_join = gpd.sjoin(region_gdf, all_stops)
-    regions_and_feeds = region_join >> distinct(_.region, _.feed_key)
+    stop_tree = shapely.STRtree(all_stops.geometry.to_numpy())
+    region_idx, stop_idx = stop_tree.query(region_gdf.geometry.to_numpy(), predicate='intersects')
+    regions_and_feeds = pd.DataFrame({
+        'region': region_gdf.region.to_numpy()[region_idx],
+        'feed_key': all_stops.feed_key.to_numpy()[stop_idx],
+    }).drop_duplicates().reset_index(drop=True)
     return regions_and_feeds
 
 if __name__ == '__main__':
@@ -32,38 +32,16 @@ Data
 def load_schedule_vp_metrics(organization:str)->pd.DataFrame:
     """
     Load schedule versus realtime file.
+    This extract (from publish_report_extracts) only has rows found 
+    in both schedule and real time data, is already rounded 
+    and renamed, and holds one row group per organization.
     """
-    schd_vp_url = f"{GTFS_DATA_DICT.digest_tables.dir}{GTFS_DATA_DICT.digest_tables.route_schedule_vp}.parquet"
-    
-    # Keep only rows that are found in both schedule and real time data
-    df = (pd.read_parquet(schd_vp_url, 
-          filters=[[("organization_name", "==", organization),
-         ("sched_rt_category", "==", "schedule_and_vp")]])
-         )
-    
-    # Delete duplicates
-    df = df.drop_duplicates().reset_index(drop = True)
-    
-    # Round float columns
-    float_columns = df.select_dtypes(include=['float'])
-    for i in float_columns:
-        df[i] = df[i].round(2)
-    
-    # Multiply percent columns to 100% 
-    pct_cols = df.columns[df.columns.str.contains("pct")].tolist()
-    for i in pct_cols:
-        df[i] = df[i] * 100
-        
-    # Add column to create rulers for the charts
-    df["ruler_100_pct"] = 100
-    df["ruler_for_vp_per_min"] = 2
-    
-    # Add a column that flips frequency to be every X minutes instead
-    # of every hour.
-    df["frequency_in_minutes"] = 60/df.frequency
-    
-    # Replace column names
-    df.columns = df.columns.map(_report_utils.replace_column_names)
+    schd_vp_url = f"{GTFS_DATA_DICT.digest_tables.dir}{GTFS_DATA_DICT.digest_tables.route_schedule_vp_report}.parquet"
+    
+    df = pd.read_parquet(
+        schd_vp_url, 
+        filters=[[("Organization", "==", organization)]]
+    )
 
     return df
 
@@ -72,17 +50,13 @@ def load_operator_metrics(organization_name:str)->pd.DataFrame:
     Load dataframe with the total scheduled service hours 
     a transit operator.
     """
-    url = f"{GTFS_DATA_DICT.digest_tables.dir}{GTFS_DATA_DICT.digest_tables.operator_metrics}.parquet"
+    url = f"{GTFS_DATA_DICT.digest_tables.dir}{GTFS_DATA_DICT.digest_tables.operator_metrics_report}.parquet"
 
-    df = pd.read_parquet(url,
-    filters=[[(("organization_name", "==", organization_name))]])
-    
-    # Rename dataframe
-    df.columns = df.columns.map(_report_utils.replace_column_names)
-    
-    df["ruler_100_pct"] = 100
+    df = pd.read_parquet(
+        url,
+        filters=[[("Organization", "==", organization_name)]]
+    )
     
-    df["ruler_for_vp_per_min"] = 2
     return df
 
 """
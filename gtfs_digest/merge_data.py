@@ -6,6 +6,8 @@ Grain is operator-service_date-route-direction-time_period.
 import geopandas as gpd
 import pandas as pd
 
+from pathlib import Path
+
 from segment_speed_utils import gtfs_schedule_wrangling, time_series_utils
 from shared_utils import gtfs_utils_v2, publish_utils
 from update_vars import GTFS_DATA_DICT, SEGMENT_GCS, RT_SCHED_GCS, SCHED_GCS
@@ -18,8 +20,72 @@ route_time_cols = [
 
 sort_cols = route_time_cols + ["service_date"]
 
+SCHED_STORE = f"{RT_SCHED_GCS}{GTFS_DATA_DICT.digest_tables.sched_route_direction_store}"
+SPEEDS_STORE = f"{RT_SCHED_GCS}{GTFS_DATA_DICT.digest_tables.speeds_route_direction_store}"
+RT_SCHED_STORE = f"{RT_SCHED_GCS}{GTFS_DATA_DICT.digest_tables.rt_sched_route_direction_store}"
+CROSSWALK_STORE = f"{RT_SCHED_GCS}{GTFS_DATA_DICT.digest_tables.crosswalk_store}"
+MERGED_STORE = f"{RT_SCHED_GCS}{GTFS_DATA_DICT.digest_tables.route_schedule_vp_store}"
+
+SCHED_COLS = route_time_cols + [
+    "route_primary_direction",
+    "avg_scheduled_service_minutes", 
+    "avg_stop_miles",
+    "n_trips", "frequency", 
+    "is_express", "is_rapid",  "is_rail",
+    "is_coverage", "is_downtown_local", "is_local",
+]
+
+SPEEDS_COLS = route_time_cols + ["speed_mph"]
+
+CROSSWALK_COLS = [
+    "schedule_gtfs_dataset_key",
+    "name",
+    "schedule_source_record_id",
+    "base64_url",
+    "organization_source_record_id",
+    "organization_name",
+    "caltrans_district"
+]
+
+
+def update_input_stores(date_list: list) -> list:
+    """
+    Bring the schedule, speeds, and rt_vs_schedule 
+    time-series stores up to date for date_list.
+    Returns every date that was (re)written in any of them.
+    The crosswalk isn't part of the merged store, 
+    it's kept up to date in concatenate_crosswalk_organization.
+    """
+    written_dates = (
+        time_series_utils.update_time_series_store(
+            RT_SCHED_GCS,
+            GTFS_DATA_DICT.rt_vs_schedule_tables.sched_route_direction_metrics,
+            date_list,
+            SCHED_STORE,
+            sort_cols = route_time_cols + ["route_primary_direction"],
+            columns = SCHED_COLS,
+        ) + time_series_utils.update_time_series_store(
+            SEGMENT_GCS,
+            GTFS_DATA_DICT.rt_stop_times.route_dir_single_summary,
+            date_list,
+            SPEEDS_STORE,
+            sort_cols = route_time_cols,
+            columns = SPEEDS_COLS,
+        ) + time_series_utils.update_time_series_store(
+            RT_SCHED_GCS,
+            GTFS_DATA_DICT.rt_vs_schedule_tables.vp_route_direction_metrics,
+            date_list,
+            RT_SCHED_STORE,
+            sort_cols = route_time_cols,
+        )
+    )
+    
+    return sorted(set(written_dates))
+
+
 def concatenate_schedule_by_route_direction(
-    date_list: list
+    date_list: list,
+    columns: list = SCHED_COLS
 ) -> pd.DataFrame:
     """
     Concatenate schedule metrics (from gtfs_funnel)
@@ -28,26 +94,25 @@ def concatenate_schedule_by_route_direction(
     """
     FILE = GTFS_DATA_DICT.rt_vs_schedule_tables.sched_route_direction_metrics
     
-    route_time_dir_cols = route_time_cols + ["route_primary_direction"]
-    
-    df = time_series_utils.concatenate_datasets_across_dates(
+    time_series_utils.update_time_series_store(
         RT_SCHED_GCS,
         FILE,
         date_list,
-        data_type = "df",
-        columns = route_time_dir_cols + [
-            "avg_scheduled_service_minutes", 
-            "avg_stop_miles",
-            "n_trips", "frequency", 
-            "is_express", "is_rapid",  "is_rail",
-            "is_coverage", "is_downtown_local", "is_local",
-        ],
-    ).sort_values(route_time_dir_cols + ["service_date"]).rename(
+        SCHED_STORE,
+        sort_cols = route_time_cols + ["route_primary_direction"],
+        columns = SCHED_COLS,
+    )
+    
+    df = time_series_utils.read_time_series_store(
+        SCHED_STORE,
+        date_list,
+        columns = columns,
+    ).rename(
         columns = {
             # rename so we understand data source
             "n_trips": "n_scheduled_trips",
         }
-    ).reset_index(drop=True)    
+    )
     
     return df
 
@@ -61,14 +126,21 @@ def concatenate_speeds_by_route_direction(
     for all the dates we have.
     """
     FILE = GTFS_DATA_DICT.rt_stop_times.route_dir_single_summary
-
-    df = time_series_utils.concatenate_datasets_across_dates(
+    
+    time_series_utils.update_time_series_store(
         SEGMENT_GCS,
         FILE,
         date_list,
-        data_type = "df",
-        columns = route_time_cols + ["speed_mph"],
-    ).sort_values(sort_cols).reset_index(drop=True)
+        SPEEDS_STORE,
+        sort_cols = route_time_cols,
+        columns = SPEEDS_COLS,
+    )
+    
+    df = time_series_utils.read_time_series_store(
+        SPEEDS_STORE,
+        date_list,
+        columns = SPEEDS_COLS,
+    )
     
     return df
 
@@ -82,13 +154,19 @@ def concatenate_rt_vs_schedule_by_route_direction(
     for all the dates we have.
     """
     FILE = GTFS_DATA_DICT.rt_vs_schedule_tables.vp_route_direction_metrics
-
-    df = time_series_utils.concatenate_datasets_across_dates(
+    
+    time_series_utils.update_time_series_store(
         RT_SCHED_GCS,
         FILE,
         date_list,
-        data_type = "df",
-    ).sort_values(sort_cols).reset_index(drop=True)
+        RT_SCHED_STORE,
+        sort_cols = route_time_cols,
+    )
+    
+    df = time_series_utils.read_time_series_store(
+        RT_SCHED_STORE,
+        date_list,
+    )
     
     # We'll add this back in after merging
     # because these would be NaN if it's not in schedule
@@ -115,22 +193,19 @@ def concatenate_crosswalk_organization(
     """
     FILE = GTFS_DATA_DICT.schedule_tables.gtfs_key_crosswalk
     
-    crosswalk_cols = [
-        "schedule_gtfs_dataset_key",
-        "name",
-        "schedule_source_record_id",
-        "base64_url",
-        "organization_source_record_id",
-        "organization_name",
-        "caltrans_district"
-    ]
-    
-    df = time_series_utils.concatenate_datasets_across_dates(
+    time_series_utils.update_time_series_store(
         SCHED_GCS,
         FILE,
         date_list,
-        data_type = "df",
-        columns = crosswalk_cols
+        CROSSWALK_STORE,
+        sort_cols = ["organization_name", "schedule_gtfs_dataset_key"],
+        columns = CROSSWALK_COLS
+    )
+    
+    df = time_series_utils.read_time_series_store(
+        CROSSWALK_STORE,
+        date_list,
+        columns = CROSSWALK_COLS
     )
     
     return df
@@ -217,29 +292,19 @@ def set_primary_typology(df: pd.DataFrame) -> pd.DataFrame:
     return df2
 
 
-def merge_data_sources_by_route_direction(
+def merge_schedule_rt_speeds(
     df_schedule: pd.DataFrame,
     df_rt_sched: pd.DataFrame,
     df_avg_speeds: pd.DataFrame,
-    df_crosswalk: pd.DataFrame
-):
+) -> pd.DataFrame:
     """
     Merge schedule, rt_vs_schedule, and speeds data, 
     which are all at route-direction-time_period-date grain.
-    This merged dataset will be used in GTFS digest visualizations.
+    Every row only depends on its own date, 
+    so this is done once per date (see merge_new_dates).
     """
-    # Get primary route type
-    primary_typology = set_primary_typology(df_schedule)
-    
-    df_schedule2 = pd.merge(
-        df_schedule,
-        primary_typology,
-        on = route_time_cols,
-        how = "left"
-    )
-    
     df = pd.merge(
-        df_schedule2,
+        df_schedule,
         df_rt_sched,
         on = route_time_cols + ["service_date"],
         how = "outer",
@@ -253,6 +318,84 @@ def merge_data_sources_by_route_direction(
     df = df.assign(
         sched_rt_category = df.sched_rt_category.map(
             gtfs_schedule_wrangling.sched_rt_category_dict)
+    )
+    
+    return df
+
+
+def merge_new_dates(date_list: list) -> list:
+    """
+    Merge schedule, rt_vs_schedule and speeds for the dates
+    that aren't in the merged store yet, plus any date whose inputs 
+    were written again (ex: input columns changed).
+    If the merged columns change, every date is merged again,
+    so the store's partitions don't mix schemas.
+    
+    Returns the dates merged.
+    """
+    written_dates = update_input_stores(date_list)
+    manifest = time_series_utils.read_time_series_manifest(MERGED_STORE)
+    
+    dates_to_merge = sorted(
+        set(date_list).difference(manifest["service_dates"]).union(written_dates)
+    )
+    
+    if len(dates_to_merge) == 0:
+        return dates_to_merge
+    
+    def merge_dates(dates: list) -> pd.DataFrame:
+        return merge_schedule_rt_speeds(
+            concatenate_schedule_by_route_direction(dates),
+            concatenate_rt_vs_schedule_by_route_direction(
+                dates).astype({"direction_id": "float"}),
+            concatenate_speeds_by_route_direction(dates),
+        )
+    
+    df = merge_dates(dates_to_merge)
+    new_columns = [c for c in df.columns if c != "service_date"]
+    
+    if manifest["columns"] is not None and manifest["columns"] != new_columns:
+        dates_to_merge = sorted(
+            set(dates_to_merge).union(manifest["service_dates"]))
+        df = merge_dates(dates_to_merge)
+    
+    time_series_utils.write_time_series_partitions(
+        df,
+        MERGED_STORE,
+        Path(GTFS_DATA_DICT.digest_tables.route_schedule_vp).name,
+        sort_cols = route_time_cols
+    )
+    
+    return dates_to_merge
+
+
+def merge_data_sources_by_route_direction(
+    df_merged: pd.DataFrame,
+    primary_typology: pd.DataFrame,
+    df_crosswalk: pd.DataFrame
+):
+    """
+    Attach what's chosen across all the dates to the 
+    merged schedule, rt_vs_schedule, and speeds rows: 
+    primary typology, standardized route names, organization info
+    and the most common cardinal direction.
+    These can change for past dates when a new month comes in, 
+    so they're redone every run, from the merged store.
+    This merged dataset will be used in GTFS digest visualizations.
+    """
+    # Get primary route type (only for rows found in schedule)
+    in_schedule = df_merged.sched_rt_category.isin(
+        ["schedule_only", "schedule_and_vp"])
+    
+    df = pd.merge(
+        df_merged,
+        primary_typology,
+        on = route_time_cols,
+        how = "left"
+    )
+    
+    df = df.assign(
+        typology = df.typology.where(in_schedule.to_numpy())
     ).pipe(
         merge_in_standardized_route_names,
     ).merge(
@@ -280,6 +423,8 @@ if __name__ == "__main__":
     
     from shared_utils import rt_dates
     
+    # Dates already in the time-series stores are not re-read,
+    # only new months are appended and merged
     analysis_date_list = (
         rt_dates.y2024_dates + rt_dates.y2023_dates
     )
@@ -287,31 +432,32 @@ if __name__ == "__main__":
     DIGEST_RT_SCHED = GTFS_DATA_DICT.digest_tables.route_schedule_vp 
     DIGEST_SEGMENT_SPEEDS = GTFS_DATA_DICT.digest_tables.route_segment_speeds
     
-    # These are public schedule_gtfs_dataset_keys
+    merged_dates = merge_new_dates(analysis_date_list)
+    print(f"merged {len(merged_dates)} new dates")
+    
+    # These are public schedule_gtfs_dataset_keys.
+    # Filter here (not in the merged store), since a dataset 
+    # can become private after its dates are merged.
     public_feeds = gtfs_utils_v2.filter_to_public_schedule_gtfs_dataset_keys()
     
-    # Get cardinal direction for each route
-    df_sched = concatenate_schedule_by_route_direction(analysis_date_list).pipe(
-        # Drop any private datasets before exporting
+    df_merged = time_series_utils.read_time_series_store(
+        MERGED_STORE, 
+        analysis_date_list
+    ).pipe(
         publish_utils.exclude_private_datasets, 
         public_gtfs_dataset_keys = public_feeds
     )
     
-    df_avg_speeds = concatenate_speeds_by_route_direction(
-        analysis_date_list
+    primary_typology = concatenate_schedule_by_route_direction(
+        analysis_date_list,
+        columns = route_time_cols + [
+            "is_express", "is_rapid",  "is_rail",
+            "is_coverage", "is_downtown_local", "is_local",
+        ]
     ).pipe(
         publish_utils.exclude_private_datasets, 
         public_gtfs_dataset_keys = public_feeds
-    )
-                    
-    df_rt_sched = (
-        concatenate_rt_vs_schedule_by_route_direction(
-            analysis_date_list
-        ).pipe(
-            publish_utils.exclude_private_datasets, 
-            public_gtfs_dataset_keys = public_feeds
-        ).astype({"direction_id": "float"})
-    )
+    ).pipe(set_primary_typology)
     
     df_crosswalk = concatenate_crosswalk_organization(
         analysis_date_list
@@ -321,14 +467,19 @@ if __name__ == "__main__":
     )
     
     df = merge_data_sources_by_route_direction(
-        df_sched,
-        df_rt_sched,
-        df_avg_speeds,
+        df_merged,
+        primary_typology,
         df_crosswalk
     )
 
-    df.to_parquet(
-        f"{RT_SCHED_GCS}{DIGEST_RT_SCHED}.parquet"
+    # Sort by organization and date, and keep row groups small,
+    # so readers filtering on organization_name or service_date 
+    # can skip most of the file
+    df.sort_values(
+        ["organization_name", "service_date"] + route_time_cols
+    ).reset_index(drop=True).to_parquet(
+        f"{RT_SCHED_GCS}{DIGEST_RT_SCHED}.parquet",
+        row_group_size = 50_000
     )
     print("Saved Digest RT")
     
@@ -0,0 +1,134 @@
+"""
+Pre-slice the digest tables used by the parameterized
+portfolio notebooks.
+
+Each notebook loads one organization. Instead of every notebook
+scanning the statewide parquet, rounding floats, and renaming columns,
+do it once here and write the table sorted by organization,
+with each organization in its own row group.
+Readers filtering on Organization only read that row group.
+"""
+import datetime
+import gcsfs
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import _report_utils
+from update_vars import GTFS_DATA_DICT, RT_SCHED_GCS
+
+fs = gcsfs.GCSFileSystem()
+
+# organization_name after _report_utils.replace_column_names
+ORGANIZATION_COL = "Organization"
+
+
+def prep_schedule_vp_metrics(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Keep only rows that are found in both schedule and real time data,
+    and get the columns ready for the charts.
+    """
+    df = df[
+        df.sched_rt_category == "schedule_and_vp"
+    ].drop_duplicates().reset_index(drop = True)
+
+    # Round float columns
+    float_columns = df.select_dtypes(include=['float']).columns
+    df[float_columns] = df[float_columns].round(2)
+
+    # Multiply percent columns to 100%
+    pct_cols = df.columns[df.columns.str.contains("pct")].tolist()
+    df[pct_cols] = df[pct_cols] * 100
+
+    # Add column to create rulers for the charts
+    df["ruler_100_pct"] = 100
+    df["ruler_for_vp_per_min"] = 2
+
+    # Add a column that flips frequency to be every X minutes instead
+    # of every hour.
+    df["frequency_in_minutes"] = 60/df.frequency
+
+    df = _report_utils.replace_column_names(df)
+
+    return df
+
+
+def prep_operator_metrics(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Rename columns and add rulers for the operator charts.
+    """
+    df = _report_utils.replace_column_names(df)
+
+    df["ruler_100_pct"] = 100
+    df["ruler_for_vp_per_min"] = 2
+
+    return df
+
+
+def write_row_group_per_organization(
+    df: pd.DataFrame,
+    export_path: str,
+    organization_col: str = ORGANIZATION_COL
+):
+    """
+    Sort by organization and write each organization
+    as its own row group, so the row group statistics
+    (min/max of organization) identify exactly one organization.
+    """
+    df = df.dropna(
+        subset = organization_col
+    ).sort_values(
+        organization_col, kind = "stable"
+    ).reset_index(drop=True)
+
+    table = pa.Table.from_pandas(df, preserve_index = False)
+
+    # Rows are sorted, so the group sizes in sorted order
+    # give us the offsets for each organization's slice
+    group_sizes = df.groupby(
+        organization_col, sort = True, observed = True
+    ).size().tolist()
+
+    with fs.open(export_path, "wb") as f:
+        with pq.ParquetWriter(f, table.schema) as writer:
+            offset = 0
+            for n in group_sizes:
+                writer.write_table(
+                    table.slice(offset, n),
+                    row_group_size = n
+                )
+                offset += n
+
+    return
+
+
+if __name__ == "__main__":
+
+    start = datetime.datetime.now()
+
+    DIGEST_RT_SCHED = GTFS_DATA_DICT.digest_tables.route_schedule_vp
+    OPERATOR_METRICS = GTFS_DATA_DICT.digest_tables.operator_metrics
+
+    DIGEST_RT_SCHED_REPORT = GTFS_DATA_DICT.digest_tables.route_schedule_vp_report
+    OPERATOR_METRICS_REPORT = GTFS_DATA_DICT.digest_tables.operator_metrics_report
+
+    schedule_vp = pd.read_parquet(
+        f"{RT_SCHED_GCS}{DIGEST_RT_SCHED}.parquet"
+    ).pipe(prep_schedule_vp_metrics)
+
+    write_row_group_per_organization(
+        schedule_vp,
+        f"{RT_SCHED_GCS}{DIGEST_RT_SCHED_REPORT}.parquet"
+    )
+
+    operator_metrics = pd.read_parquet(
+        f"{RT_SCHED_GCS}{OPERATOR_METRICS}.parquet"
+    ).pipe(prep_operator_metrics)
+
+    write_row_group_per_organization(
+        operator_metrics,
+        f"{RT_SCHED_GCS}{OPERATOR_METRICS_REPORT}.parquet"
+    )
+
+    end = datetime.datetime.now()
+    print(f"report extracts: {end - start}")
@@ -35,8 +35,10 @@ def concat_batches(analysis_date: str) -> dd.DataFrame:
     
     ddf = dd.from_delayed(delayed_dfs)
     
+    # Localize in bulk and keep seconds since midnight, 
+    # so later steps don't need to derive it from the timestamp again
     ddf = schedule_rt_utils.localize_timestamp_col(
-        ddf, ["location_timestamp"])
+        ddf, ["location_timestamp"], add_seconds = True)
     
     return ddf
 
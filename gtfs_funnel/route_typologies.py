@@ -21,9 +21,10 @@ of service frequency and route typology.
 """
 import datetime
 import geopandas as gpd
+import numpy as np
 import pandas as pd
-
-from dask import delayed, compute
+import re
+import shapely
 
 from segment_speed_utils import gtfs_schedule_wrangling, helpers                       
 from segment_speed_utils.project_vars import PROJECT_CRS   
@@ -45,6 +46,18 @@ route_typologies = [
     "rapid", "express", "rail"
 ]
 
+# Words in route_short_name / route_long_name that tag the route
+EXPRESS_PATTERN = re.compile("express|limited", flags=re.IGNORECASE)
+RAPID_PATTERN = re.compile("rapid", flags=re.IGNORECASE)
+RAIL_ROUTE_TYPES = ['0', '1', '2', '5', '6', '7', '11', '12']
+
+# Upper bounds for NACTO peak frequency categories.
+# Be more generous, if there are overlapping
+# cutoffs for categories, we'll use the lower value
+# so transit route / road can achieve a better score.
+FREQ_BINS = [-np.inf, 4, 10, 20, np.inf]
+FREQ_CATEGORIES = ["low", "moderate", "high", "very_high"]
+
 def categorize_routes_by_name(
     analysis_date: str
 ) -> pd.DataFrame:
@@ -69,29 +82,17 @@ def categorize_routes_by_name(
 
     df = df.assign(
         combined_name = df.route_short_name + "__" + df.route_long_name
-    )
-    
-    typology_tags = df.apply(
-        lambda x: tag_rapid_express_rail(
-            x.combined_name, x.route_type), axis=1
-    )
-    
-    df2 = pd.concat([df, typology_tags], axis=1)
+    ).pipe(tag_rapid_express_rail)
 
-    df2 = df2.assign(
-        is_local = df2.apply(
-            lambda x: 
-            1 if (x.is_express==0) and (x.is_rapid==0) and 
-            (x.is_rail==0)
-            else 0, axis=1).astype(int)
+    df = df.assign(
+        is_local = ((df.is_express==0) & (df.is_rapid==0) & 
+                    (df.is_rail==0)).astype(int)
     )
     
-    return df2
+    return df
 
 
-def tag_rapid_express_rail(
-    route_name_string: str, route_type_string: str
-) -> pd.Series:
+def tag_rapid_express_rail(df: pd.DataFrame) -> pd.DataFrame:
     """
     Use the combined route_name and see if we can 
     tag out words that indicate the route is
@@ -101,56 +102,37 @@ def tag_rapid_express_rail(
     For local routes, we'll pass that through NACTO to see
     if we can better categorize as downtown_local, local, or coverage.
     """
-    route_name_string = route_name_string.lower()
-    
-    express = 0
-    rapid = 0
-    rail = 0
-    
-    if any(substring in route_name_string for substring in 
-           ["express", "limited"]):
-        express = 1
-    if "rapid" in route_name_string:
-        rapid = 1
-    
-    rail_types = ['0', '1', '2', '5', '6', '7', '11', '12']
-    if route_type_string in rail_types:
-        rail = 1
+    df = df.assign(
+        is_express = df.combined_name.str.contains(
+            EXPRESS_PATTERN, regex=True).astype(int),
+        is_rapid = df.combined_name.str.contains(
+            RAPID_PATTERN, regex=True).astype(int),
+        is_rail = df.route_type.isin(RAIL_ROUTE_TYPES).astype(int),
+    )
     
-    return pd.Series(
-            [express, rapid, rail], 
-            index=['is_express', 'is_rapid', 'is_rail']
-        )
+    return df
 
 
-def nacto_peak_frequency_category(freq_value: float) -> str:
+def nacto_peak_frequency_category(freq_values: pd.Series) -> pd.Series:
     """
     Assign peak frequencies into categories.
-    Be more generous, if there are overlapping
-    cutoffs for categories, we'll use the lower value
-    so transit route / road can achieve a better score.
+    Bins are closed on the left, so a frequency at the cutoff
+    moves up into the next category.
     
     Source: https://nacto.org/publication/transit-street-design-guide/introduction/service-context/transit-frequency-volume/
     """
-    # Set the upper bounds here 
-    low_cutoff = 4
-    mod_cutoff = 10
-    high_cutoff = 20
-    
-    if freq_value < low_cutoff:
-        return "low"
-    elif freq_value >= low_cutoff and freq_value < mod_cutoff:
-        return "moderate"
-    elif freq_value >= mod_cutoff and freq_value < high_cutoff:
-        return "high"
-    elif freq_value >= high_cutoff:
-        return "very_high"
+    return pd.cut(
+        freq_values,
+        bins = FREQ_BINS,
+        labels = FREQ_CATEGORIES,
+        right = False
+    ).astype("object")
 
     
 def nacto_stop_frequency(
-    stop_freq: float, 
-    service_freq: str
-) -> str:
+    stop_freq: pd.Series, 
+    service_freq: pd.Series
+) -> np.ndarray:
     """
     Assign NACTO route typologies.
     Be more generous, if there are overlapping
@@ -161,27 +143,20 @@ def nacto_stop_frequency(
     """
     cut1 = 3
     cut2 = 4
-    mod_high = ["moderate", "high"]
-    
-    if stop_freq >= cut2:
-        return "downtown_local"
-    
-    elif (stop_freq >= cut1 and 
-          stop_freq < cut2 and 
-          service_freq in mod_high
-         ):
-        return "local"
-    
-    elif (stop_freq >= 1 and stop_freq < cut1 and 
-          service_freq in mod_high):
-        return "rapid"
-    
-    elif service_freq == "low":
-        #(stop_freq >= 2 and stop_freq < 8
-        return "coverage"
+    mod_high = service_freq.isin(["moderate", "high"])
     
     # last category is "express", which we'll have to tag on 
     # the route name side
+    return np.select(
+        [
+            stop_freq >= cut2,
+            (stop_freq >= cut1) & (stop_freq < cut2) & mod_high,
+            (stop_freq >= 1) & (stop_freq < cut1) & mod_high,
+            service_freq == "low",
+        ],
+        ["downtown_local", "local", "rapid", "coverage"],
+        default = None
+    )
 
     
 def prep_roads(dict_inputs: dict) -> gpd.GeoDataFrame:
@@ -197,14 +172,12 @@ def prep_roads(dict_inputs: dict) -> gpd.GeoDataFrame:
     ).to_crs(PROJECT_CRS)
     
     road_stats = road_stats.assign(
-        freq_category = road_stats.apply(
-            lambda x: nacto_peak_frequency_category(x.frequency), axis=1)
+        freq_category = nacto_peak_frequency_category(road_stats.frequency)
     )
     
     road_stats = road_stats.assign(
-        typology = road_stats.apply(
-            lambda x: nacto_stop_frequency(
-            x.stops_per_mi, x.freq_category), axis=1)
+        typology = nacto_stop_frequency(
+            road_stats.stops_per_mi, road_stats.freq_category)
     )
     
     df = pd.merge(
@@ -216,43 +189,59 @@ def prep_roads(dict_inputs: dict) -> gpd.GeoDataFrame:
     
     return df
     
+def index_buffered_roads(
+    roads: gpd.GeoDataFrame,
+    buffer_meters: int
+) -> shapely.STRtree:
+    """
+    Buffer the road segments once and build a spatial index on them.
+    The roads don't change across dates, so this is reused
+    for every date's shapes.
+    Tree positions line up with the rows in roads.
+    """
+    return shapely.STRtree(
+        roads.geometry.buffer(buffer_meters).to_numpy()
+    )
+
+
 def overlay_shapes_to_roads(
     roads: gpd.GeoDataFrame,
     analysis_date: str,
-    buffer_meters: int
-) -> gpd.GeoDataFrame:
+    buffer_meters: int,
+    road_tree: shapely.STRtree = None
+) -> pd.DataFrame:
+    """
+    Find the buffered road segments each shape crosses
+    and how many meters of the shape fall within them.
+    """
+    if road_tree is None:
+        road_tree = index_buffered_roads(roads, buffer_meters)
     
     common_shape = gtfs_schedule_wrangling.most_common_shape_by_route_direction(
         analysis_date
-    ).pipe(helpers.remove_shapes_outside_ca)
+    ).pipe(helpers.remove_shapes_outside_ca).reset_index(drop=True)
 
     common_shape = common_shape.assign(
         route_meters = common_shape.geometry.length,
     )
-        
-    # use sjoin first to find where we want to calculate overlay
-    s1 = gpd.sjoin(
-        roads,
-        common_shape,
-        how = "inner",
-        predicate = "intersects"
-    ).drop(columns = ["index_right"]).reset_index(drop=True)
-    
-    # merge shape geometry back in 
-    gdf = pd.merge(
-        s1,
-        common_shape.rename(columns = {"geometry": "shape_geometry"}),
-        on = route_dir_cols,
-        how = "inner"
-    )
     
-    # buffer road segment geom and take overlay
-    overlay_geom = gdf.shape_geometry.intersection(
-        gdf.geometry.buffer(buffer_meters), align=True)
+    shape_geom = common_shape.geometry.to_numpy()
     
-    gdf = gdf.assign(
-        overlay_geom = overlay_geom,
-        overlay_meters = overlay_geom.length
+    # pairs of (shape position, road position) that intersect
+    shape_idx, road_idx = road_tree.query(shape_geom, predicate="intersects")
+    
+    overlay_meters = shapely.length(
+        shapely.intersection(
+            shape_geom[shape_idx], 
+            road_tree.geometries.take(road_idx)
+        )
+    )
+    
+    gdf = pd.concat([
+        common_shape[route_dir_cols].iloc[shape_idx].reset_index(drop=True),
+        roads[typology_cols].iloc[road_idx].reset_index(drop=True)
+    ], axis=1).assign(
+        overlay_meters = overlay_meters
     )
     
     # Calculate the sum of overlay meters for each typology combo
@@ -337,10 +326,10 @@ def reconcile_route_and_nacto_typologies(
     
     # Retain as local if coverage or downtown_local aren't true
     df = df.assign(
-        is_local = df.apply(
-            lambda x: 1 if ((x.is_coverage==0) and (x.is_downtown_local == 0))
-            or (x.is_nacto_local==1)
-            else 0, axis=1)
+        is_local = (
+            ((df.is_coverage==0) & (df.is_downtown_local==0)) | 
+            (df.is_nacto_local==1)
+        ).astype(int)
     )
     
     drop_cols = [c for c in df.columns if "is_nacto_" in c]
@@ -361,18 +350,20 @@ if __name__ == "__main__":
     
     start = datetime.datetime.now()
 
-    roads = delayed(prep_roads)(GTFS_DATA_DICT)
     ROAD_BUFFER_METERS = 20
     TYPOLOGY_THRESHOLD = 0.10
     
+    roads = prep_roads(GTFS_DATA_DICT)
+    road_tree = index_buffered_roads(roads, ROAD_BUFFER_METERS)
+    
     for analysis_date in analysis_date_list:
         
         time0 = datetime.datetime.now()
              
-        gdf = delayed(overlay_shapes_to_roads)(
-            roads, analysis_date, ROAD_BUFFER_METERS
-        )    
-        gdf = compute(gdf)[0]
+        gdf = overlay_shapes_to_roads(
+            roads, analysis_date, ROAD_BUFFER_METERS, 
+            road_tree = road_tree
+        )
         
         # Only keep significant typologies, but leave as typology-freq_category
         route_typology_df = gdf.loc[gdf.pct_typology >= TYPOLOGY_THRESHOLD]
@@ -7,6 +7,7 @@ import datetime
 import geopandas as gpd
 import numpy as np
 import pandas as pd
+import shapely
 
 from calitp_data_analysis import utils
 from shared_utils import rt_utils
@@ -63,26 +64,77 @@ def prep_scheduled_stop_times(analysis_date: str) -> gpd.GeoDataFrame:
 
 
 def get_projected_stop_meters(
-    stop_times: pd.DataFrame, 
+    stop_times: gpd.GeoDataFrame, 
     shapes: gpd.GeoDataFrame
 ) -> pd.DataFrame:
     """
     Project the stop's position to the shape and
     get stop_meters (meters from start of the shape).
+    
+    stop_meters only depends on shape_array_key-stop_id,
+    so project each unique pair once (not every stop_time) 
+    and give it an integer shape_stop_idx that 
+    downstream stages can join on.
     """
+    shape_stops = stop_times[
+        ["shape_array_key", "stop_id", "geometry"]
+    ].drop_duplicates(
+        subset=["shape_array_key", "stop_id"]
+    ).reset_index(drop=True)
+    
     gdf = pd.merge(
-        stop_times,
+        shape_stops,
         shapes.rename(columns = {"geometry": "shape_geometry"}),
         on = "shape_array_key",
         how = "inner"
+    ).sort_values(
+        ["shape_array_key", "stop_id"]
+    ).reset_index(drop=True)
+    
+    stop_meters = shapely.line_locate_point(
+        gdf.shape_geometry.to_numpy(), 
+        gdf.geometry.to_numpy()
     )
     
-    gdf = gdf.assign(
-        stop_meters = gdf.shape_geometry.project(gdf.geometry)
-    ).drop(columns = "shape_geometry").drop_duplicates()
+    df = pd.DataFrame({
+        "shape_stop_idx": np.arange(len(gdf), dtype="int64"),
+        "shape_array_key": gdf.shape_array_key.to_numpy(),
+        "stop_id": gdf.stop_id.to_numpy(),
+        "stop_meters": stop_meters,
+    })
+    
+    return df
+    
+
+def concatenate_with_subseq_value(
+    values: pd.Series,
+    subseq_codes_mask: np.ndarray
+) -> np.ndarray:
+    """
+    Build "value__subseq_value" strings for every row.
+    Work on the factorized codes: only the unique pairs of codes 
+    are concatenated into strings, then broadcast back to rows.
+    Where there's no subseq stop, subseq_value is "".
+    """
+    codes, uniques = pd.factorize(values)
+    n_uniques = len(uniques)
+    
+    # code -1 (no subseq stop) indexes into the trailing ""
+    labels = np.append(np.asarray(uniques, dtype="object").astype(str), "")
+    
+    subseq_codes = np.append(codes[1:], -1)
+    subseq_codes[~subseq_codes_mask] = -1
     
-    return gdf
+    pair_keys = codes.astype("int64") * (n_uniques + 1) + (subseq_codes + 1)
+    pair_idx, unique_pair_keys = pd.factorize(pair_keys)
     
+    pair_strings = (
+        pd.Series(labels[unique_pair_keys // (n_uniques + 1)]) + "__" + 
+        pd.Series(labels[unique_pair_keys % (n_uniques + 1) - 1])
+    ).to_numpy()
+    
+    return pair_strings[pair_idx]
+
 
 def find_prior_subseq_stop(
     stop_times: gpd.GeoDataFrame,
@@ -90,76 +142,44 @@ def find_prior_subseq_stop(
 ) -> gpd.GeoDataFrame:
     """
     For trip-stop, find the previous stop (using stop sequence).
-    Attach the previous stop's geometry.
+    Attach the previous stop's coordinates.
     This will determine the direction for the stop (it's from prior stop).
     Add in subseq stop information too.
+    
+    Sort once by trip-stop_sequence, then prior / subseq values 
+    are positional shifts, masked wherever the neighboring row 
+    belongs to a different trip. No grouped shifts or self-merges.
     """
-    prior_stop = stop_times[trip_stop_cols].sort_values(
-        trip_stop_cols).reset_index(drop=True)
-        
-    prior_stop = prior_stop.assign(
-        prior_stop_sequence = (prior_stop.groupby("trip_instance_key")
-                               .stop_sequence
-                               .shift(1)),
-        # add subseq stop info here
-        subseq_stop_sequence = (prior_stop.groupby("trip_instance_key")
-                                .stop_sequence
-                                .shift(-1)),
-        subseq_stop_id = (prior_stop.groupby("trip_instance_key")
-                          .stop_id
-                          .shift(-1)),
-        subseq_stop_name = (prior_stop.groupby("trip_instance_key")
-                          .stop_name
-                          .shift(-1))        
-    )
+    stop_times = stop_times.sort_values(
+        ["trip_instance_key", "stop_sequence"]
+    ).reset_index(drop=True)
     
-    # Merge in prior stop geom as a separate column so we can
-    # calculate distance / direction
-    prior_stop_geom = (stop_times[["trip_instance_key", 
-                                   "stop_sequence", "geometry"]]
-                       .rename(columns = {
-                           "stop_sequence": "prior_stop_sequence",
-                           "geometry": "prior_geometry"
-                           })
-                       .set_geometry("prior_geometry")
-                      )
-    
-    stop_times_with_prior = pd.merge(
-        stop_times,
-        prior_stop,
-        on = trip_stop_cols,
-        how = "left"
+    trip_codes, _ = pd.factorize(stop_times.trip_instance_key)
+    same_trip = trip_codes[1:] == trip_codes[:-1]
+    has_prior = np.append(False, same_trip)
+    has_subseq = np.append(same_trip, False)
+    
+    stop_sequence = stop_times.stop_sequence
+    
+    x = stop_times.geometry.x.to_numpy()
+    y = stop_times.geometry.y.to_numpy()
+    
+    stop_times = stop_times.assign(
+        prior_stop_sequence = stop_sequence.shift(1).where(
+            has_prior).astype("Int64"),
+        subseq_stop_sequence = stop_sequence.shift(-1).where(
+            has_subseq).astype("Int64"),
+        prior_x = np.where(has_prior, np.append(np.nan, x[:-1]), np.nan),
+        prior_y = np.where(has_prior, np.append(np.nan, y[:-1]), np.nan),
+        # Create stop pair with underscores, since stop_id 
+        # can contain hyphens
+        stop_pair = concatenate_with_subseq_value(
+            stop_times.stop_id, has_subseq),
+        stop_pair_name = concatenate_with_subseq_value(
+            stop_times.stop_name, has_subseq),
     )
     
-    stop_times_with_prior_geom = pd.merge(
-        stop_times_with_prior,
-        prior_stop_geom,
-        on = ["trip_instance_key", "prior_stop_sequence"],
-        how = "left"
-    ).astype({
-        "prior_stop_sequence": "Int64",
-        "subseq_stop_sequence": "Int64"
-    }).fillna({
-        "subseq_stop_id": "",
-        "subseq_stop_name": ""
-    })
-        
-    # Create stop pair with underscores, since stop_id 
-    # can contain hyphens
-    stop_times_with_prior_geom = stop_times_with_prior_geom.assign(
-        stop_pair = stop_times_with_prior_geom.apply(
-            lambda x: 
-            str(x.stop_id) + "__" + str(x.subseq_stop_id), 
-            axis=1, 
-        ),
-        stop_pair_name = stop_times_with_prior_geom.apply(
-            lambda x: 
-            x.stop_name + "__" + x.subseq_stop_name, 
-            axis=1, 
-        ),    
-    ).drop(columns = ["subseq_stop_id", "subseq_stop_name"])
-    
-    return stop_times_with_prior_geom
+    return stop_times
 
 
 def assemble_stop_times_with_direction(
@@ -177,8 +197,37 @@ def assemble_stop_times_with_direction(
     start = datetime.datetime.now()
 
     EXPORT_FILE = dict_inputs.rt_vs_schedule_tables.stop_times_direction
+    INDEX_FILE = dict_inputs.rt_vs_schedule_tables.stop_shape_meters
     
     scheduled_stop_times = prep_scheduled_stop_times(analysis_date)
+    
+    shapes = helpers.import_scheduled_shapes(
+        analysis_date,
+        columns = ["shape_array_key", "geometry"],
+        filters = [[("shape_array_key", "in", 
+                     scheduled_stop_times.shape_array_key.unique().tolist())]],
+        crs = PROJECT_CRS,
+        get_pandas = True
+    )
+    
+    stop_shape_index = get_projected_stop_meters(
+        scheduled_stop_times, shapes
+    )
+    
+    stop_shape_index.to_parquet(
+        f"{RT_SCHED_GCS}{INDEX_FILE}_{analysis_date}.parquet"
+    )
+    
+    # Only the integer key is attached to stop_times,
+    # stop_meters is looked up in the index when it's needed
+    scheduled_stop_times = pd.merge(
+        scheduled_stop_times,
+        stop_shape_index[["shape_array_key", "stop_id", "shape_stop_idx"]],
+        on = ["shape_array_key", "stop_id"],
+        how = "left"
+    ).astype({"shape_stop_idx": "Int64"})
+    
+    del shapes, stop_shape_index
 
     trip_stop_cols = ["trip_instance_key", "stop_sequence", 
                       "stop_id", "stop_name"]
@@ -187,40 +236,29 @@ def assemble_stop_times_with_direction(
         scheduled_stop_times, trip_stop_cols
     )
     
-    other_stops = scheduled_stop_times2[
-        ~(scheduled_stop_times2.prior_geometry.isna())
-    ]
-
-    first_stop = scheduled_stop_times2[
-        scheduled_stop_times2.prior_geometry.isna()
-    ]
-    
-    first_stop = first_stop.assign(
-        stop_primary_direction = "Unknown"
-    ).drop(columns = "prior_geometry")
-    
-    other_stops_no_geom = other_stops.drop(columns = ["prior_geometry"])
-    
-    prior_geom = other_stops.prior_geometry
-    current_geom = other_stops.geometry
+    current_x = scheduled_stop_times2.geometry.x.to_numpy()
+    current_y = scheduled_stop_times2.geometry.y.to_numpy()
+    distance_east = current_x - scheduled_stop_times2.prior_x.to_numpy()
+    distance_north = current_y - scheduled_stop_times2.prior_y.to_numpy()
     
     # Create a column with readable direction like westbound, eastbound, etc
-    stop_direction = np.vectorize(
-        rt_utils.primary_cardinal_direction)(prior_geom, current_geom)
-    stop_distance = prior_geom.distance(current_geom)
+    # The first stop has no prior stop, and is Unknown 
+    stop_direction = np.where(
+        scheduled_stop_times2.prior_stop_sequence.isna(),
+        "Unknown",
+        rt_utils.primary_cardinal_direction_array(
+            distance_east, distance_north)
+    )
     
-    other_stops_no_geom = other_stops_no_geom.assign(
+    # Distance from prior stop (NaN for first stop)
+    stop_distance = np.hypot(distance_east, distance_north)
+    
+    df = scheduled_stop_times2.assign(
         stop_primary_direction = stop_direction,
         stop_meters = stop_distance,
-    )
-    
-    scheduled_stop_times_with_direction = pd.concat(
-        [first_stop, other_stops_no_geom], 
-        axis=0
-    )
-        
-    df = scheduled_stop_times_with_direction.sort_values(
-        trip_stop_cols).reset_index(drop=True)
+    ).drop(
+        columns = ["prior_x", "prior_y"]
+    ).sort_values(trip_stop_cols).reset_index(drop=True)
 
     time1 = datetime.datetime.now()
     print(f"get scheduled stop times with direction: {time1 - start}")
@@ -2,13 +2,13 @@
 Add dwell time to vp
 """
 import datetime
+import numpy as np
 import pandas as pd
 import sys
 
 from dask import delayed, compute
 from loguru import logger
 
-from segment_speed_utils import segment_calcs
 from segment_speed_utils.project_vars import SEGMENT_GCS
 from shared_utils import publish_utils
 from update_vars import GTFS_DATA_DICT
@@ -31,111 +31,63 @@ def import_vp(analysis_date: str) -> pd.DataFrame:
     return vp
 
 
-def group_vp_dwelling_rows(df: pd.DataFrame) -> pd.DataFrame: 
+def split_into_moving_and_dwelling(vp: pd.DataFrame) -> pd.DataFrame:
     """
+    Use vp_primary_direction to split vp into either moving vp or dwelling vp.
+    Dwelling vp need extra transforms to figure how long it dwelled.
+    It's unknown if there was no movement, because the x, y is the 
+    same, so direction was not able to be calculated.
+    The only exception is the first vp, because there is no prior point against which
+    to calculate direction.
+    
     We do not know how many vp have repeated positions consecutively,
     but we want to consolidate as many as we can until it moves to 
-    the next position.
+    the next position. Label these as runs over vp sorted by trip-vp_idx.
     
-    We know that the prior position has a vp index of vp_idx - 1.
-    If it's not that, then it's moved on.
+    A vp continues the prior vp's run (is_moving=0) only if 
+    both it and the prior vp are part of an unknown stretch 
+    (an Unknown vp or the vp right before one), and the prior vp is the 
+    same trip with vp_idx - 1. 
     This is important because buses can revisit a stop in a loop route,
     and it can stop at a plaza, go on elsewhere, and come back to a plaza,
     and we don't want to mistakenly group non-consecutive vp.
     """
-    df = df.assign(
-        #prior_expected = df.vp_idx - 1,
-        prior = (df.sort_values(["trip_instance_key", "vp_idx"])
-                .groupby("trip_instance_key", observed=True, group_keys=False)
-                .vp_idx
-                .apply(lambda x: x.shift(1))
-               )
-    )
-
-
-    df = df.assign(
-        # flag whether it is moving (we want 0's to show up for dwelling vp 
-        # because this will get the cumcount() to work 
-        is_moving = df.apply(
-            lambda x: 
-            0 if x.prior == x.prior_expected
-            else 1, axis=1).astype("int8")
-    )
+    vp = vp.sort_values(
+        ["trip_instance_key", "vp_idx"]
+    ).reset_index(drop=True)
     
-    return df
-
-
-def split_into_moving_and_dwelling(vp: pd.DataFrame):
-    """
-    Use vp_primary_direction to split vp into either moving vp or dwelling vp.
-    Dwelling vp need extra transforms to figure how long it dwelled.
-    It's unknown if there was no movement, because the x, y is the 
-    same, so direction was not able to be calculated.
-    The only exception is the first vp, because there is no prior point against which
-    to calculate direction.
-    """
-    usable_bounds = segment_calcs.get_usable_vp_bounds_by_trip(
-        vp
-    ).drop(columns = "max_vp_idx")
-
-    vp2 = pd.merge(
-        vp, 
-        usable_bounds,
-        on = "trip_instance_key",
-        how = "inner"
-    )
+    vp_idx = vp.vp_idx.to_numpy()
+    trip_codes, _ = pd.factorize(vp.trip_instance_key)
+    
+    is_unknown = (vp.vp_primary_direction == "Unknown").to_numpy()
     
-    vp2 = vp2.assign(
-        prior_expected = vp2.vp_idx - 1,
+    # Unknown vp, plus the vp right before each unknown one
+    in_unknown_stretch = is_unknown | np.isin(
+        vp_idx, vp_idx[is_unknown] - 1)
+    
+    continues_prior = np.append(
+        False,
+        (in_unknown_stretch[1:] & in_unknown_stretch[:-1] & 
+         (trip_codes[1:] == trip_codes[:-1]) & 
+         (vp_idx[1:] - vp_idx[:-1] == 1))
     )
     
-    # keep subset of prior vp when we have unknowns, 
-    #then we want to grab just the one above
-    subset_vp_prior = vp2[
-        vp2.vp_primary_direction=="Unknown"
-    ].prior_expected.unique().tolist()
-    
-    subset_unknown_vp = vp2[
-        vp2.vp_primary_direction=="Unknown"
-    ].vp_idx.unique().tolist()
-    
-    # These vp have unknowns and may need to consolidate 
-    # leave first vp in, just in case the second vp is unknown
-    vp_unknowns = vp2.loc[
-        vp2.vp_idx.isin(subset_vp_prior + subset_unknown_vp)
-    ]
-
-    # Vast majority of vp should be here, and we want to 
-    # separate these out because no change is happening
-    # and we don't want to do an expensive row-wise shift on these
-    vp_knowns = vp2.loc[~vp2.vp_idx.isin(subset_vp_prior + subset_unknown_vp)]
-    
-    vp_unknowns2 = group_vp_dwelling_rows(vp_unknowns)
-    
-    vp3 = pd.concat(
-        [vp_knowns, vp_unknowns2], 
-        axis=0, ignore_index=True
-    ).drop(
-        columns = ["prior", "prior_expected"]
-    ).fillna(
-        {"is_moving": 1}
-    ).astype(
-        {"is_moving": "int8"}
-    ).sort_values("vp_idx").reset_index(drop=True)
-    
-    vp3 = vp3.assign(
-        # since is_moving=0 if the vp is dwelling,
-        # cumsum() will not change from the prior vp
-        # and a set of 2 or 3 will hold the same vp_grouping value
-        # once the vp moves and is_moving=1, then cumsum() will increase again
-        vp_grouping = (vp3.groupby("trip_instance_key", 
-                                  observed=True, group_keys=False)
-                   .is_moving
-                   .cumsum() 
-                  )
+    is_moving = (~continues_prior).astype("int8")
+    
+    # The first vp of every trip starts a new run, so a global cumsum 
+    # separates trips too. Subtract where the trip starts 
+    # so vp_grouping restarts at 1 for each trip.
+    run_id = np.cumsum(is_moving)
+    trip_start = np.append(True, trip_codes[1:] != trip_codes[:-1])
+    trip_start_run_id = np.maximum.accumulate(
+        np.where(trip_start, run_id, 0))
+    
+    vp = vp.assign(
+        is_moving = is_moving,
+        vp_grouping = run_id - trip_start_run_id + 1,
     )
     
-    return vp3
+    return vp
 
 
 def add_dwell_time(
@@ -145,37 +97,27 @@ def add_dwell_time(
     Take vp that have their groups flagged and 
     add dwell time (in seconds). Dwell time is calculated
     for this vp_location, which may not necessarily be a bus stop.
+    
+    vp_grouped is sorted by trip-vp_idx, so each vp_grouping is a 
+    contiguous run of rows. Collapse every run in one pass with 
+    np.ufunc.reduceat at the run starts.
     """
-    group_cols = ["trip_instance_key", "vp_grouping"]
-
-    start_vp = (vp_grouped
-                .groupby(group_cols, observed=True, group_keys=False)
-                .agg({
-                    "vp_idx": "min",
-                    "location_timestamp_local": "min",
-                    "vp_primary_direction": "count"
-                }).reset_index()
-                .rename(columns = {"vp_primary_direction": "n_vp_at_location"})
-               )
-
-    end_vp = (vp_grouped
-              .groupby(group_cols, observed=True, group_keys=False)
-              .agg({
-                  "vp_idx": "max",
-                  "location_timestamp_local": "max"
-              }).reset_index()
-               .rename(columns = {
-                   "vp_idx": "end_vp_idx",
-                   "location_timestamp_local": "moving_timestamp_local"
-               })
-    )
+    run_starts = np.flatnonzero(
+        vp_grouped.is_moving.to_numpy() == 1)
     
-    df = pd.merge(
-        start_vp,
-        end_vp,
-        on = group_cols,
-        how = "inner"
-    )
+    vp_idx = vp_grouped.vp_idx.to_numpy()
+    timestamps = vp_grouped.location_timestamp_local.to_numpy()
+    has_direction = vp_grouped.vp_primary_direction.notna().to_numpy()
+    
+    df = pd.DataFrame({
+        "trip_instance_key": vp_grouped.trip_instance_key.to_numpy()[run_starts],
+        "vp_grouping": vp_grouped.vp_grouping.to_numpy()[run_starts],
+        "vp_idx": np.minimum.reduceat(vp_idx, run_starts),
+        "location_timestamp_local": np.minimum.reduceat(timestamps, run_starts),
+        "n_vp_at_location": np.add.reduceat(has_direction.astype("int64"), run_starts),
+        "end_vp_idx": np.maximum.reduceat(vp_idx, run_starts),
+        "moving_timestamp_local": np.maximum.reduceat(timestamps, run_starts),
+    })
     
     df = df.assign(
         dwell_sec = (df.moving_timestamp_local - 
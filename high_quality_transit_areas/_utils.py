@@ -3,7 +3,11 @@ Shared utility functions for HQTA
 """
 import geopandas as gpd
 import intake
+import numpy as np
 import pandas as pd
+import shapely
+
+from dask import delayed, compute
 
 catalog = intake.open_catalog("catalog.yml")
 
@@ -40,4 +44,134 @@ def clip_to_ca(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
 
     gdf2 = gdf.clip(ca, keep_geom_type = False).reset_index(drop=True)
 
-    return gdf2
\ No newline at end of file
+    return gdf2
+
+
+def union_by_group(
+    geometry_array: np.ndarray, 
+    group_ids: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Union geometries that share a group id.
+    Returns the unique group ids and the unioned geometry for each.
+    """
+    order = np.argsort(group_ids, kind="stable")
+    group_ids = group_ids[order]
+    geometry_array = geometry_array[order]
+    
+    unique_groups, group_start = np.unique(group_ids, return_index=True)
+    
+    unioned = np.array(
+        [shapely.union_all(g) for g in np.split(geometry_array, group_start[1:])],
+        dtype=object
+    )
+    
+    return unique_groups, unioned
+
+
+def tiled_dissolve(
+    gdf: gpd.GeoDataFrame,
+    by: list,
+    tile_meters: int = 20_000
+) -> gpd.GeoDataFrame:
+    """
+    Same result as gdf[by + ["geometry"]].dissolve(by=by).reset_index(),
+    but instead of one statewide union, partition the 
+    geometries on a grid (tile_meters, in the gdf's projected CRS).
+    
+    Each geometry goes to the tile holding its representative point.
+    Each tile unions its own group pieces, and tiles run in parallel.
+    Then the pieces from neighboring tiles are unioned
+    per group, which stitches the seams.
+    """
+    gdf = gdf[by + ["geometry"]].reset_index(drop=True)
+    
+    group_ids = gdf.groupby(by, sort=True, dropna=True).ngroup().to_numpy()
+    keep = group_ids >= 0
+    
+    if not keep.any():
+        return gdf.iloc[:0].reset_index(drop=True)
+    
+    geoms = gdf.geometry.to_numpy()[keep]
+    group_ids = group_ids[keep]
+    
+    points = shapely.point_on_surface(geoms)
+    tile_x = np.floor(shapely.get_x(points) / tile_meters).astype("int64")
+    tile_y = np.floor(shapely.get_y(points) / tile_meters).astype("int64")
+    tile_ids = pd.factorize(pd.MultiIndex.from_arrays([tile_x, tile_y]))[0]
+    
+    # Sort once by tile and split, instead of a mask over all geometries per tile
+    order = np.argsort(tile_ids, kind="stable")
+    _, tile_start = np.unique(tile_ids[order], return_index=True)
+    
+    tile_results = compute([
+        delayed(union_by_group)(geoms[i], group_ids[i])
+        for i in np.split(order, tile_start[1:])
+    ])[0]
+    
+    # Stitch the seams: union each group's pieces across tiles
+    piece_groups = np.concatenate([g for g, _ in tile_results])
+    piece_geoms = np.concatenate([p for _, p in tile_results])
+    
+    unique_groups, dissolved_geom = union_by_group(piece_geoms, piece_groups)
+    
+    group_keys = (gdf.loc[keep, by]
+                  .assign(group_id = group_ids)
+                  .drop_duplicates("group_id")
+                  .set_index("group_id")
+                  .loc[unique_groups]
+                  .reset_index(drop=True)
+                 )
+    
+    dissolved = gpd.GeoDataFrame(
+        group_keys,
+        geometry = dissolved_geom,
+        crs = gdf.crs
+    )
+    
+    return dissolved
+
+
+def buffer_with_cache(
+    gdf: gpd.GeoDataFrame,
+    buffer_meters: int,
+    cache_path: str,
+) -> tuple[gpd.GeoSeries, gpd.GeoDataFrame]:
+    """
+    Buffer geometries, reusing buffers from the previous run
+    for any geometry (matched on its WKB) that hasn't changed.
+    
+    Returns the buffered geometry (aligned to gdf)
+    and the updated cache, which holds only the geometries
+    passed in this time.
+    """
+    geom_key = pd.util.hash_array(
+        shapely.to_wkb(gdf.geometry.to_numpy()).astype(object)
+    )
+    
+    try:
+        cached = gpd.read_parquet(
+            cache_path,
+            filters = [[("buffer_meters", "==", buffer_meters)]]
+        ).to_crs(gdf.crs)
+    except FileNotFoundError:
+        cached = gpd.GeoDataFrame(
+            {"geom_key": pd.Series(dtype="uint64"), 
+             "buffer_meters": pd.Series(dtype="int64")},
+            geometry = gpd.GeoSeries([], crs=gdf.crs),
+        )
+    
+    cached = cached.drop_duplicates("geom_key").set_index("geom_key").geometry
+    
+    buffered = cached.reindex(geom_key).to_numpy()
+    
+    is_new = pd.isna(buffered)
+    buffered[is_new] = gdf.geometry[is_new].buffer(buffer_meters).to_numpy()
+    
+    new_cache = gpd.GeoDataFrame(
+        {"geom_key": geom_key, "buffer_meters": buffer_meters},
+        geometry = buffered,
+        crs = gdf.crs
+    ).drop_duplicates("geom_key").reset_index(drop=True)
+    
+    return gpd.GeoSeries(buffered, index=gdf.index, crs=gdf.crs), new_cache
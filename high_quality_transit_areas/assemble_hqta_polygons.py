@@ -21,6 +21,8 @@ from update_vars import (GCS_FILE_PATH, analysis_date, PROJECT_CRS, EXPORT_PATH,
 
 catalog = intake.open_catalog("*.yml")
 
+STOP_BUFFER_CACHE = "hqta_stop_buffers"
+
 def buffer_hq_corridor_bus(
     analysis_date: str,
     buffer_meters: int,
@@ -29,7 +31,8 @@ def buffer_hq_corridor_bus(
     Buffer hq bus corridors.
     
     Start with bus corridors, filter to those that are high quality,
-    and do a dissolve.
+    and do a dissolve. The dissolve is split across a spatial grid 
+    and stitched back together.
     After the dissolve, buffer by an additional amount to 
     get the full 0.5 mile buffer.
     """
@@ -39,10 +42,7 @@ def buffer_hq_corridor_bus(
     
     keep_cols = ['schedule_gtfs_dataset_key', 'route_id']
     
-    dissolved = (gdf[keep_cols + ["geometry"]]
-                 .dissolve(by=keep_cols)
-                 .reset_index()
-                )
+    dissolved = _utils.tiled_dissolve(gdf, by = keep_cols)
     
     # Bus corridors are already buffered 50 meters, 
     # so will buffer 705 meters to get 0.5 mile radius
@@ -75,15 +75,28 @@ def buffer_major_transit_stops(
     """
     Buffer major transit stops. 
     Start with hqta points and filter out the hq_corridor_bus types.
+    Buffers for stops whose point hasn't moved since the last run
+    are reused from the buffer cache.
     """
     hqta_points = catalog.hqta_points.read().to_crs(PROJECT_CRS)
 
     stops = hqta_points[hqta_points.hqta_type != "hq_corridor_bus"]
     
     # General buffer distance: 1/2mi ~= 805 meters
-    # stops are already buffered 
+    stop_buffers, buffer_cache = _utils.buffer_with_cache(
+        stops,
+        buffer_meters,
+        f"{GCS_FILE_PATH}{STOP_BUFFER_CACHE}.parquet"
+    )
+    
     stops = stops.assign(
-        geometry = stops.geometry.buffer(buffer_meters)
+        geometry = stop_buffers
+    )
+    
+    utils.geoparquet_gcs_export(
+        buffer_cache,
+        GCS_FILE_PATH,
+        STOP_BUFFER_CACHE
     )
 
     return stops
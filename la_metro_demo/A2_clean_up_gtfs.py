@@ -97,12 +97,13 @@ def split_route_into_separate_rows(df: pd.DataFrame) -> pd.DataFrame:
         obs = duplicated.groupby("route_short_name").cumcount() + 1
     )
     
+    # 1st copy gets the route before the slash, 2nd copy gets the one after
+    route_parts = duplicated.route_short_name.str.split('/')
+    
     duplicated = duplicated.assign(
-        route_short_name_new = duplicated.apply(
-            lambda x: x.route_short_name.split('/')[0] if x.obs ==1 
-            else x.route_short_name.split('/')[1], axis=1),  
-    ).drop(columns = ["obs", "route_short_name"]).rename(
-        columns = {"route_short_name_new": "route_short_name"})
+        route_short_name = route_parts.str[0].where(
+            duplicated.obs == 1, route_parts.str[1]),  
+    ).drop(columns = ["obs"])
     
     cleaned_df = pd.concat(
         [no_slash, 
@@ -153,9 +154,9 @@ def recode_route_for_shape(df: pd.DataFrame) -> pd.DataFrame:
     )
 
     duplicated = duplicated.assign(
-        route_short_name = duplicated.apply(
-            lambda x: DUP_ME_AND_RECODE[x.route_short_name] if x.obs ==2
-            else x.route_short_name, axis=1),    
+        route_short_name = duplicated.route_short_name.map(
+            DUP_ME_AND_RECODE).where(
+            duplicated.obs == 2, duplicated.route_short_name),    
     ).drop(columns = ["obs"])
     
     cleaned_df = pd.concat(
@@ -4,7 +4,7 @@ import geopandas as gpd
 import pandas as pd
 
 from calitp_data_analysis import geography_utils
-from shared_utils import portfolio_utils, rt_dates
+from shared_utils import geometry_utils, portfolio_utils, rt_dates
 from bus_service_utils import calenviroscreen_lehd_utils
 from segment_speed_utils.project_vars import SEGMENT_GCS, COMPILED_CACHED_VIEWS
 
@@ -12,6 +12,8 @@ import A2_clean_up_gtfs as clean_up_gtfs
 
 PROJECT_CRS = geography_utils.CA_NAD83Albers
 BUS_SERVICE_GCS = "gs://calitp-analytics-data/data-analyses/bus_service_increase/"
+# shape x tract intersected lengths from prior runs
+INTERSECTION_CACHE = f"{BUS_SERVICE_GCS}cached_shape_polygon_lengths.parquet"
 
     
 def import_calenviroscreen_tracts():
@@ -32,17 +34,43 @@ def import_calenviroscreen_tracts():
     return calenviroscreen_tracts
 
 
+def route_lengths_by_tract(
+    routes: gpd.GeoDataFrame,
+    tracts: gpd.GeoDataFrame,
+    cache_path: str = INTERSECTION_CACHE
+) -> pd.DataFrame:
+    """
+    Apportion each route's length across the tracts it passes through.
+    Shapes we've already intersected with these tracts are read
+    from the cache instead of clipped again.
+    """
+    try:
+        cache = pd.read_parquet(cache_path)
+    except FileNotFoundError:
+        cache = None
+    
+    route_to_tracts, cache = geometry_utils.apportion_lines_to_polygons(
+        routes,
+        tracts,
+        polygon_cols = ["Tract", "overall_ptile_group"],
+        cache = cache
+    )
+    
+    cache.to_parquet(cache_path)
+    
+    return route_to_tracts
+
+
 def aggregate_overlay_intersect_by_equity(
-    gdf: gpd.GeoDataFrame) -> pd.DataFrame: 
+    df: pd.DataFrame) -> pd.DataFrame: 
     """
     Aggregate by route-equity_group and get the distribution of 
     route intersecting with the 3 equity groups.
     Also count the number of tracts the route is passing through
     for each equity group.
     """
-    gdf = gdf.assign(
-        intersect_length = gdf.geometry.length,
-        overall_ptile_group = gdf.overall_ptile_group.fillna(0),
+    df = df.assign(
+        overall_ptile_group = df.overall_ptile_group.fillna(0),
     )
     
     route_cols = ["name", "route_id", "route_short_name", 
@@ -50,7 +78,7 @@ def aggregate_overlay_intersect_by_equity(
     equity_cols = ["overall_ptile_group"]
     
     by_route_equity = portfolio_utils.aggregate_by_geography(
-        gdf,
+        df,
         group_cols = route_cols + equity_cols,
         sum_cols = ["intersect_length"],
         nunique_cols = ["Tract"]
@@ -88,10 +116,9 @@ def get_processed_route_data():
     
     calenviroscreen_tracts = import_calenviroscreen_tracts()
     
-    route_to_tracts = gpd.overlay(
-        routes_with_geom,
-        calenviroscreen_tracts,
-        how = "intersection",
+    route_to_tracts = route_lengths_by_tract(
+        routes_with_geom, 
+        calenviroscreen_tracts
     )
     
     by_equity_groups = aggregate_overlay_intersect_by_equity(route_to_tracts)
@@ -7,13 +7,17 @@ NTD Monthly Ridership by RTPA
 """
 import gcsfs
 import geopandas as gpd
+import hashlib
+import json
 import os
 import pandas as pd
 import shutil
 
 from calitp_data_analysis.tables import tbls
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from siuba import _, collect, count, filter, show_query
 from calitp_data_analysis.sql import to_snakecase
+from segment_speed_utils import time_series_utils
 from segment_speed_utils.project_vars import PUBLIC_GCS
 from update_vars import GCS_FILE_PATH, NTD_MODES, NTD_TOS
 
@@ -28,22 +32,30 @@ def add_change_columns(
     df: pd.DataFrame) -> pd.DataFrame:
     """
     This function works with the warehouse `dim_monthly_ntd_ridership_with_adjustments` long data format.
-    Sorts the df by ntd id, mode, tos, period month and period year. then adds 2 new columns, 1. previous year/month UPT and 2. UPT change 1yr.
+    For each ntd id, mode, tos, adds 2 new columns, 1. previous year/month UPT (same month, prior year) and 2. UPT change 1yr.
+    If the same month last year isn't reported, previous year/month UPT is left null.
     """
-
-    sort_cols2 =  ["ntd_id","mode", "tos","period_month", "period_year"] # got the order correct with ["period_month", "period_year"]! sorted years with grouped months
     group_cols2 = ["ntd_id","mode", "tos"]
     
     df[["period_year","period_month"]] = df[["period_year","period_month"]].astype(int)
 
-    df = df.assign(
-        previous_y_m_upt = (df.sort_values(sort_cols2)
-                        .groupby(group_cols2)["upt"] 
-                        .apply(lambda x: x.shift(1))
-                       )
+    df = time_series_utils.add_change_from_prior_period(
+        df.assign(
+            year_month = time_series_utils.year_month_to_period(
+                df.period_year, df.period_month)
+        ),
+        group_cols2,
+        period_col = "year_month",
+        value_cols = ["upt"],
+        lag = 12
+    ).drop(
+        columns = ["year_month", "pct_change_upt"]
+    ).rename(
+        columns = {
+            "prior_upt": "previous_y_m_upt",
+            "change_upt": "change_1yr"
+        }
     )
-
-    df["change_1yr"] = (df["upt"] - df["previous_y_m_upt"])
     
     df = get_percent_change(df)
     
@@ -92,18 +104,7 @@ def sum_by_group(
     return grouped_df
 
 
-def save_rtpa_outputs(
-    df: pd.DataFrame, 
-    year: int, 
-    month: str,
-    upload_to_public: bool = False
-):
-    """
-    Export an excel for each RTPA, adds new tabs for: READ ME & agg by agency, tos and mode. then writes into a folder.
-    Zip that folder. 
-    Upload zipped file to GCS.
-    """
-    col_dict ={
+RTPA_COL_DICT = {
     'Uace Cd': "UACE Code",
     'Dt': "Date",
     'Ntd Id': "NTD ID",
@@ -119,41 +120,132 @@ def save_rtpa_outputs(
     'Pct Change 1Yr': "Percent Change in 1 Year UPT",
     'Tos Full': "Type of Service Full Name"
 }
+
+COVER_SHEET_TEMPLATE = "./cover_sheet_template.xlsx"
+
+# Last written workbook for each RTPA + hash of the slice that produced it
+RTPA_WORKBOOK_STORE = f"{GCS_FILE_PATH}rtpa_workbooks/"
+RTPA_HASH_FILE = f"{RTPA_WORKBOOK_STORE}rtpa_slice_hashes.json"
+
+
+def hash_rtpa_slice(
+    rtpa_df: pd.DataFrame,
+    cover_sheet_bytes: bytes
+) -> str:
+    """
+    Fingerprint one RTPA's rows (and the cover sheet that goes 
+    into every workbook), so we can tell if the workbook 
+    from the prior release can be reused.
+    """
+    h = hashlib.sha256()
     
-    for i in df["RTPA"].unique():
-        # Filename should be snakecase
-        rtpa_snakecase = i.replace(' ', '_').lower()
-
-        (df[df["RTPA"] == i]
-         .sort_values("ntd_id")
-         #got error from excel not recognizing timezone, made list to include dropping "ts" column
-         .drop(columns = ["_merge","ts"])
-         #cleaning column names
-         .rename(columns=lambda x: x.replace("_"," ").title().strip())
-         #rename columns
-         .rename(columns=col_dict)
-         #updated to `to_excel`, added sheet_name 
-         .to_excel(
-            f"./{year}_{month}/{rtpa_snakecase}.xlsx", sheet_name = "RTPA Ridership Data",
-            index = False)
-         
-        )
-        #insertng readme cover sheet, 
-        cover_sheet = pd.read_excel("./cover_sheet_template.xlsx", index_col = "NTD Monthly Ridership by RTPA")
-        
-        agency_cols = ["ntd_id", "agency", "RTPA"]
-        mode_cols = ["mode", "RTPA"]
-        tos_cols = ["tos", "RTPA"]
+    h.update(",".join(rtpa_df.columns).encode())
+    h.update(
+        pd.util.hash_pandas_object(
+            rtpa_df, index=False
+        ).to_numpy().tobytes()
+    )
+    h.update(cover_sheet_bytes)
+    
+    return h.hexdigest()
+
+
+def write_rtpa_workbook(
+    rtpa_df: pd.DataFrame,
+    cover_sheet: pd.DataFrame,
+    export_path: str
+) -> str:
+    """
+    Write one RTPA's excel: the ridership data, READ ME 
+    & agg by agency, mode and tos tabs, in one pass.
+    """
+    agency_cols = ["ntd_id", "agency", "RTPA"]
+    mode_cols = ["mode", "RTPA"]
+    tos_cols = ["tos", "RTPA"]
+
+    by_agency_long = sum_by_group(rtpa_df, agency_cols)
+    by_mode_long = sum_by_group(rtpa_df, mode_cols)
+    by_tos_long = sum_by_group(rtpa_df, tos_cols)
+    
+    ridership = (rtpa_df
+                 .sort_values("ntd_id")
+                 #cleaning column names
+                 .rename(columns=lambda x: x.replace("_"," ").title().strip())
+                 #rename columns
+                 .rename(columns=RTPA_COL_DICT)
+                )
+    
+    with pd.ExcelWriter(export_path) as writer:
+        ridership.to_excel(writer, sheet_name = "RTPA Ridership Data", index = False)
+        cover_sheet.to_excel(writer, sheet_name = "READ ME")
+        by_agency_long.to_excel(writer, sheet_name = "Aggregated by Agency")
+        by_mode_long.to_excel(writer, sheet_name = "Aggregated by Mode")
+        by_tos_long.to_excel(writer, sheet_name = "Aggregated by TOS")
+    
+    return export_path
+
 
-        by_agency_long = sum_by_group(df, agency_cols)
-        by_mode_long = sum_by_group(df, mode_cols)
-        by_tos_long = sum_by_group(df, tos_cols)
+def save_rtpa_outputs(
+    df: pd.DataFrame, 
+    year: int, 
+    month: str,
+    upload_to_public: bool = False,
+    max_workers: int = 4
+):
+    """
+    Export an excel for each RTPA, adds new tabs for: READ ME & agg by agency, tos and mode. then writes into a folder.
+    df is split by RTPA once, workbooks are written in a process pool.
+    If an RTPA's slice is unchanged since the last release, 
+    copy its saved workbook instead of writing it again.
+    Zip that folder. 
+    Upload zipped file to GCS.
+    """
+    #got error from excel not recognizing timezone, made list to include dropping "ts" column
+    df = df.drop(columns = ["_merge","ts"])
+    
+    with open(COVER_SHEET_TEMPLATE, "rb") as f:
+        cover_sheet_bytes = f.read()
+    
+    #insertng readme cover sheet, 
+    cover_sheet = pd.read_excel(COVER_SHEET_TEMPLATE, index_col = "NTD Monthly Ridership by RTPA")
+    
+    if fs.exists(RTPA_HASH_FILE):
+        with fs.open(RTPA_HASH_FILE, "r") as f:
+            prior_hashes = json.load(f)
+    else:
+        prior_hashes = {}
+    
+    new_hashes = {}
+    
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
         
-        with pd.ExcelWriter(f"./{year}_{month}/{rtpa_snakecase}.xlsx", mode ="a") as writer:
-            cover_sheet.to_excel(writer, sheet_name = "READ ME")
-            by_agency_long.to_excel(writer, sheet_name = "Aggregated by Agency")
-            by_mode_long.to_excel(writer, sheet_name = "Aggregated by Mode")
-            by_tos_long.to_excel(writer, sheet_name = "Aggregated by TOS")
+        for i, rtpa_df in df.groupby("RTPA", sort = False):
+            # Filename should be snakecase
+            rtpa_snakecase = i.replace(' ', '_').lower()
+            local_path = f"./{year}_{month}/{rtpa_snakecase}.xlsx"
+            store_path = f"{RTPA_WORKBOOK_STORE}{rtpa_snakecase}.xlsx"
+            
+            slice_hash = hash_rtpa_slice(rtpa_df, cover_sheet_bytes)
+            new_hashes[rtpa_snakecase] = slice_hash
+            
+            if (prior_hashes.get(rtpa_snakecase) == slice_hash and 
+                fs.exists(store_path)):
+                fs.get(store_path, local_path)
+                continue
+            
+            future = executor.submit(
+                write_rtpa_workbook, rtpa_df, cover_sheet, local_path)
+            futures[future] = store_path
+
+        for future in as_completed(futures):
+            fs.put(future.result(), futures[future])
+    
+    print(f"Wrote {len(futures)} RTPA workbooks, "
+          f"reused {len(new_hashes) - len(futures)} unchanged")
+    
+    with fs.open(RTPA_HASH_FILE, "w") as f:
+        json.dump(new_hashes, f)
         
     shutil.make_archive(f"./{year}_{month}", "zip", f"{year}_{month}")
     print("Zipped folder")
@@ -5,26 +5,37 @@ route_id, route_name, operator name.
 import datetime
 import geopandas as gpd
 import pandas as pd
-import yaml
 
 import open_data_utils
 from calitp_data_analysis.geography_utils import WGS84
 from calitp_data_analysis import utils
-from shared_utils import portfolio_utils, publish_utils
+from shared_utils import portfolio_utils
 from segment_speed_utils import helpers
 from update_vars import analysis_date, TRAFFIC_OPS_GCS
 
 
-def create_routes_file_for_export(date: str) -> gpd.GeoDataFrame:
+def create_routes_file_for_export(
+    date: str,
+    gtfs_dataset_keys: list = None
+) -> gpd.GeoDataFrame:
     """
     Create a shapes (with associated route info) file for export.
     This allows users to plot the various shapes,
     transit path options, and select between variations for 
     a given route.
+    
+    Pass gtfs_dataset_keys to only create it for some operators.
+    Operator info is attached later (open_data_utils.assemble_from_snapshots).
     """
+    if gtfs_dataset_keys is not None:
+        trip_filters = [[("gtfs_dataset_key", "in", gtfs_dataset_keys)]]
+    else:
+        trip_filters = None
+    
     # Read in local parquets
     trips = helpers.import_scheduled_trips(
         date,
+        filters = trip_filters,
         columns = [
             "gtfs_dataset_key",
             "route_id", "route_type", 
@@ -36,6 +47,8 @@ def create_routes_file_for_export(date: str) -> gpd.GeoDataFrame:
     
     shapes = helpers.import_scheduled_shapes(
         date,
+        filters = [[("shape_array_key", "in", 
+                     trips.shape_array_key.unique().tolist())]],
         columns = ["shape_array_key", "n_trips", "geometry"],
         get_pandas = True,
         crs = WGS84
@@ -58,13 +71,8 @@ def create_routes_file_for_export(date: str) -> gpd.GeoDataFrame:
         .drop_duplicates(subset=route_shape_cols)
         .reset_index(drop=True)
     )
-    
-    routes_assembled2 = open_data_utils.standardize_operator_info_for_exports(
-        routes_assembled, 
-        date
-    ).pipe(remove_erroneous_shapes)    
             
-    return routes_assembled2
+    return routes_assembled
 
 
 def remove_erroneous_shapes(
@@ -96,49 +104,6 @@ def remove_erroneous_shapes(
     return ok_shapes
 
 
-def patch_previous_dates(
-    current_routes: gpd.GeoDataFrame,
-    current_date: str,
-    published_operators_yaml: str = "../gtfs_funnel/published_operators.yml"
-) -> gpd.GeoDataFrame:
-    """
-    Compare to the yaml for what operators we want, and
-    patch in previous dates for the 10 or so operators
-    that do not have data for this current date.
-    """
-    with open(published_operators_yaml) as f:
-        published_operators_dict = yaml.safe_load(f)
-    
-    patch_operators_dict = {
-        str(date): operator_list for 
-        date, operator_list in published_operators_dict.items() 
-        if str(date) != current_date
-    }
-    
-    partial_dfs = []
-
-    for one_date, operator_list in patch_operators_dict.items():
-        df_to_add = publish_utils.subset_table_from_previous_date(
-            gcs_bucket = TRAFFIC_OPS_GCS,
-            filename = f"ca_transit_routes",
-            operator_and_dates_dict = patch_operators_dict,
-            date = one_date, 
-            crosswalk_col = "schedule_gtfs_dataset_key",
-            data_type = "gdf"
-        ).pipe(open_data_utils.standardize_operator_info_for_exports, one_date)
-        
-        partial_dfs.append(df_to_add)
-
-    patch_routes = pd.concat(partial_dfs, axis=0, ignore_index=True)
-
-    published_routes = pd.concat(
-        [current_routes, patch_routes], 
-        axis=0, ignore_index=True
-    )
-    
-    return published_routes
-    
-
 def finalize_export_df(df: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
     """
     Suppress certain columns used in our internal modeling for export.
@@ -164,25 +129,31 @@ if __name__ == "__main__":
     
     time0 = datetime.datetime.now()
     
-    # Make an operator-feed level file (this is published)    
-    routes = create_routes_file_for_export(analysis_date)  
+    # Only operators whose feed changed are rebuilt,
+    # everyone else (including operators without data for this date) 
+    # comes from the operator snapshot store
+    routes_store = open_data_utils.update_operator_snapshots(
+        "ca_transit_routes",
+        analysis_date,
+        create_routes_file_for_export,
+        seed_gcs_bucket = TRAFFIC_OPS_GCS,
+        seed_filename = "ca_transit_routes"
+    )
+    
+    routes = open_data_utils.assemble_from_snapshots(
+        routes_store
+    ).pipe(remove_erroneous_shapes)
     
     # Export into GCS (outside export/)
-    # create_routes is different than create_stops, which already has
-    # a table created in gtfs_funnel that we can use to patch in previous dates
-    # here, we have to create those for each date, then save a copy
+    # Save a copy of the operators that have data for this date
     # the export/ folder contains the patched versions of the routes
     utils.geoparquet_gcs_export(
-        routes,
+        routes[routes.snapshot_date == analysis_date].drop(columns = "snapshot_date"),
         TRAFFIC_OPS_GCS,
         f"ca_transit_routes_{analysis_date}"
     )
     
-    
-    published_routes = patch_previous_dates(
-        routes, 
-        analysis_date,
-    ).pipe(finalize_export_df)
+    published_routes = finalize_export_df(routes)
         
     utils.geoparquet_gcs_export(
         published_routes, 
@@ -4,12 +4,9 @@ route_id, route_name, agency_id, agency_name.
 """
 import datetime
 import geopandas as gpd
-import pandas as pd
-import yaml
 
 import open_data_utils
 from calitp_data_analysis import utils
-from shared_utils import publish_utils
 from update_vars import (analysis_date, 
                          GTFS_DATA_DICT,
                          TRAFFIC_OPS_GCS, 
@@ -18,72 +15,34 @@ from update_vars import (analysis_date,
 
 def create_stops_file_for_export(
     date: str,
+    gtfs_dataset_keys: list = None
 ) -> gpd.GeoDataFrame:
     """
-    Read in scheduled stop metrics table and attach crosswalk 
-    info related to organization for Geoportal.
+    Read in scheduled stop metrics table, 
+    for all operators or just gtfs_dataset_keys.
+    Organization info for Geoportal is attached later 
+    (open_data_utils.assemble_from_snapshots).
     """
     time0 = datetime.datetime.now()
 
     # Read in parquets
     STOP_FILE = GTFS_DATA_DICT.rt_vs_schedule_tables.sched_stop_metrics
 
+    if gtfs_dataset_keys is not None:
+        filters = [[("schedule_gtfs_dataset_key", "in", gtfs_dataset_keys)]]
+    else:
+        filters = None
+    
     stops = gpd.read_parquet(
-        f"{RT_SCHED_GCS}{STOP_FILE}_{date}.parquet"
+        f"{RT_SCHED_GCS}{STOP_FILE}_{date}.parquet",
+        filters = filters
     )
     
-    stops2 = open_data_utils.standardize_operator_info_for_exports(stops, date)
-
     time1 = datetime.datetime.now()
     print(f"get stops for date: {time1 - time0}")
     
-    return stops2
-
-
-def patch_previous_dates(
-    current_stops: gpd.GeoDataFrame,
-    current_date: str,
-    published_operators_yaml: str = "../gtfs_funnel/published_operators.yml"
-) -> gpd.GeoDataFrame:
-    """
-    Compare to the yaml for what operators we want, and
-    patch in previous dates for the 10 or so operators
-    that do not have data for this current date.
-    """
-    with open(published_operators_yaml) as f:
-        published_operators_dict = yaml.safe_load(f)
-    
-    patch_operators_dict = {
-        str(date): operator_list for 
-        date, operator_list in published_operators_dict.items() 
-        if str(date) != current_date
-    }
-    
-    partial_dfs = []
-
-    STOP_FILE = GTFS_DATA_DICT.rt_vs_schedule_tables.sched_stop_metrics
+    return stops
 
-    for one_date, operator_list in patch_operators_dict.items():
-        df_to_add = publish_utils.subset_table_from_previous_date(
-            gcs_bucket = RT_SCHED_GCS,
-            filename = STOP_FILE,
-            operator_and_dates_dict = patch_operators_dict,
-            date = one_date, 
-            crosswalk_col = "schedule_gtfs_dataset_key",
-            data_type = "gdf"
-        ).pipe(open_data_utils.standardize_operator_info_for_exports, one_date)
-        
-        partial_dfs.append(df_to_add)
-
-    patch_stops = pd.concat(partial_dfs, axis=0, ignore_index=True)
-
-    published_stops = pd.concat(
-        [current_stops, patch_stops], 
-        axis=0, ignore_index=True
-    )
-    
-    return published_stops
-    
 
 def finalize_export_df(df: gpd.GeoDataFrame) -> gpd.GeoDataFrame: 
     """
@@ -115,12 +74,22 @@ def finalize_export_df(df: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
 if __name__ == "__main__":
         
     time0 = datetime.datetime.now()
+    
+    STOP_FILE = GTFS_DATA_DICT.rt_vs_schedule_tables.sched_stop_metrics
 
-    stops = create_stops_file_for_export(analysis_date)  
-
-    published_stops = patch_previous_dates(
-        stops, 
+    # Only operators whose feed changed are rebuilt,
+    # everyone else (including operators without data for this date) 
+    # comes from the operator snapshot store
+    stops_store = open_data_utils.update_operator_snapshots(
+        "ca_transit_stops",
         analysis_date,
+        create_stops_file_for_export,
+        seed_gcs_bucket = RT_SCHED_GCS,
+        seed_filename = STOP_FILE
+    )
+    
+    published_stops = open_data_utils.assemble_from_snapshots(
+        stops_store
     ).pipe(finalize_export_df)    
 
     utils.geoparquet_gcs_export(
@@ -5,8 +5,12 @@ and get it ready for GTFS schedule routes / stops datasets.
 import geopandas as gpd
 import intake
 import pandas as pd
+import yaml
 
-from calitp_data_analysis import geography_utils
+from typing import Callable
+
+from calitp_data_analysis import geography_utils, utils
+from segment_speed_utils import helpers
 from shared_utils import gtfs_utils_v2, schedule_rt_utils
 from update_vars import TRAFFIC_OPS_GCS, analysis_date, GTFS_DATA_DICT, SCHED_GCS
 
@@ -115,6 +119,210 @@ def clip_to_usa(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
     return gdf2
     
 
+# Latest good rows for each operator, one file per dataset 
+SNAPSHOT_GCS = f"{TRAFFIC_OPS_GCS}operator_snapshots/"
+CROSSWALK_COLS = ["name", "base64_url", 
+                  "organization_source_record_id", "organization_name"]
+
+
+def operator_feed_fingerprints(date: str) -> pd.DataFrame:
+    """
+    For each operator on this date, fingerprint its feed
+    (feed_key + the trips scheduled that day).
+    If the fingerprint matches what's in the snapshot store,
+    the operator's rows don't need to be regenerated.
+    """
+    trips = helpers.import_scheduled_trips(
+        date,
+        columns = ["gtfs_dataset_key", "name", "feed_key", "trip_id"],
+        get_pandas = True
+    )
+    
+    # Order doesn't matter for a sum of hashes
+    trips = trips.assign(
+        trip_hash = pd.util.hash_pandas_object(
+            trips.trip_id, index=False).to_numpy()
+    )
+    
+    df = (trips
+          .groupby(["schedule_gtfs_dataset_key", "name", "feed_key"], 
+                   observed=True, group_keys=False)
+          .agg({"trip_hash": "sum"})
+          .reset_index()
+         )
+    
+    df = df.assign(
+        feed_fingerprint = df.feed_key + "_" + df.trip_hash.astype(str)
+    )[["schedule_gtfs_dataset_key", "name", "feed_fingerprint"]]
+    
+    return df
+
+
+def read_operator_snapshots(dataset: str) -> gpd.GeoDataFrame:
+    try:
+        return gpd.read_parquet(f"{SNAPSHOT_GCS}{dataset}.parquet")
+    except FileNotFoundError:
+        return None
+
+
+def seed_from_previous_date(
+    gcs_bucket: str,
+    filename: str,
+    operator_list: list,
+    date: str
+) -> gpd.GeoDataFrame:
+    """
+    For operators not in the snapshot store yet,
+    take their rows from the dated file they were last published with.
+    """
+    crosswalk = pd.read_parquet(
+        f"{SCHED_GCS}{GTFS_DATA_DICT.schedule_tables.gtfs_key_crosswalk}_{date}.parquet",
+        columns = ["name", "schedule_gtfs_dataset_key"],
+        filters = [[("name", "in", operator_list)]]
+    ).drop_duplicates()
+    
+    past_gdf = gpd.read_parquet(
+        f"{gcs_bucket}{filename}_{date}.parquet",
+        filters = [[("schedule_gtfs_dataset_key", "in", 
+                     crosswalk.schedule_gtfs_dataset_key.tolist())]]
+    )
+    
+    past_gdf = pd.merge(
+        past_gdf.drop(columns = CROSSWALK_COLS, errors = "ignore"),
+        crosswalk,
+        on = "schedule_gtfs_dataset_key",
+        how = "inner"
+    ).assign(snapshot_date = date, feed_fingerprint = None)
+    
+    return past_gdf
+
+
+def update_operator_snapshots(
+    dataset: str,
+    date: str,
+    create_func: Callable,
+    seed_gcs_bucket: str,
+    seed_filename: str,
+    published_operators_yaml: str = "../gtfs_funnel/published_operators.yml"
+) -> gpd.GeoDataFrame:
+    """
+    Keep the latest good rows for each operator in one store.
+    
+    create_func(date, gtfs_dataset_keys) builds the rows for 
+    a subset of operators (not standardized yet).
+    Only operators whose feed fingerprint changed are regenerated, 
+    operators whose feed didn't change are just moved up to this date,
+    and operators missing this date keep their last rows,
+    so patching them in is a lookup on the store.
+    Operators in published_operators_yaml that were never stored are
+    seeded from the date they were last published with.
+    """
+    feeds = operator_feed_fingerprints(date)
+    store = read_operator_snapshots(dataset)
+    
+    if store is None:
+        changed = feeds
+        store = gpd.GeoDataFrame()
+    else:
+        stored_fingerprints = store[
+            ["name", "feed_fingerprint"]].drop_duplicates(subset="name")
+        
+        changed = feeds.merge(
+            stored_fingerprints,
+            on = ["name", "feed_fingerprint"],
+            how = "left",
+            indicator = True
+        ).query('_merge == "left_only"').drop(columns = "_merge")
+        
+        store = store.assign(
+            snapshot_date = store.snapshot_date.mask(
+                store.name.isin(feeds.name) & ~store.name.isin(changed.name), 
+                date)
+        )
+    
+    # Rerunning the same date changes nothing, 
+    # and create_func can't build rows for no operators
+    if len(changed) > 0:
+        new_gdf = create_func(
+            date, changed.schedule_gtfs_dataset_key.tolist()
+        ).merge(
+            changed,
+            on = "schedule_gtfs_dataset_key",
+            how = "inner"
+        ).assign(snapshot_date = date)
+    
+        # Only operators that came back with rows replace what's stored
+        store = pd.concat([
+            store[~store.name.isin(new_gdf.name)] if len(store) > 0 else store, 
+            new_gdf
+        ], axis=0, ignore_index=True)
+        
+        n_regenerated = new_gdf.name.nunique()
+    else:
+        n_regenerated = 0
+    
+    with open(published_operators_yaml) as f:
+        published_operators_dict = yaml.safe_load(f)
+    
+    stored_names = set(store.name)
+    seed_dfs = []
+    
+    for one_date, operator_list in published_operators_dict.items():
+        missing = [i for i in operator_list if i not in stored_names]
+        if str(one_date) != date and len(missing) > 0:
+            seed_dfs.append(
+                seed_from_previous_date(
+                    seed_gcs_bucket, seed_filename, missing, str(one_date))
+            )
+    
+    store = gpd.GeoDataFrame(
+        pd.concat([store, *seed_dfs], axis=0, ignore_index=True),
+        geometry = "geometry",
+        crs = geography_utils.WGS84
+    )
+    
+    utils.geoparquet_gcs_export(
+        store,
+        SNAPSHOT_GCS,
+        dataset
+    )
+    
+    print(f"{dataset}: regenerated {n_regenerated} operators, "
+          f"seeded {sum(df.name.nunique() for df in seed_dfs)}")
+    
+    return store
+
+
+def assemble_from_snapshots(
+    store: gpd.GeoDataFrame,
+    published_operators_yaml: str = "../gtfs_funnel/published_operators.yml"
+) -> gpd.GeoDataFrame:
+    """
+    Statewide layer from the snapshot store, for the operators we publish.
+    Each operator's rows are standardized with the crosswalk
+    for the date they came from.
+    """
+    with open(published_operators_yaml) as f:
+        published_operators_dict = yaml.safe_load(f)
+    
+    published_names = [
+        name for operator_list in published_operators_dict.values() 
+        for name in operator_list
+    ]
+    
+    store = store[store.name.isin(published_names)]
+    
+    gdf = pd.concat([
+        standardize_operator_info_for_exports(
+            df.drop(columns = ["name", "snapshot_date", "feed_fingerprint"]), 
+            one_date
+        ).assign(snapshot_date = one_date)
+        for one_date, df in store.groupby("snapshot_date")
+    ], axis=0, ignore_index=True)
+    
+    return gdf
+    
+    
 STANDARDIZED_COLUMNS_DICT = {
     "caltrans_district": "district_name",
     "organization_source_record_id": "org_id",
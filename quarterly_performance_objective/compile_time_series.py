@@ -151,18 +151,24 @@ def change_from_prior(
     """
     Add change (absolute change) and percent change
     for some metrics.
+    Prior is the quarter right before, if that quarter is missing
+    for a group, the change columns are left null.
     """
     group_cols2 = [i for i in group_cols if i != time_col]
     
+    df = time_series_utils.add_change_from_prior_period(
+        df.assign(
+            quarter_period = time_series_utils.year_quarter_to_period(
+                df[time_col])
+        ),
+        group_cols2,
+        period_col = "quarter_period",
+        value_cols = change_cols,
+        lag = 1
+    ).drop(columns = "quarter_period")
+    
     for c in change_cols:
-        df[f"prior_{c}"] = (df.sort_values(group_cols)
-                            .groupby(group_cols2, 
-                                     observed=True, group_keys=False)
-                            [c]
-                            .apply(lambda x: x.shift(1))
-                           )
-        
-        df[f"change_{c}"] = round(df[c] - df[f"prior_{c}"], 2)
+        df[f"change_{c}"] = round(df[f"change_{c}"], 2)
         df[f"pct_change_{c}"] = round(df[f"change_{c}"] / df[c] * 100, 1)
     
     return df
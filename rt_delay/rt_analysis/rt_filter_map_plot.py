@@ -535,12 +535,16 @@ class RtFilterMapper:
         g.get_root().html.add_child(folium.Element(title_html)) # might still want a util for this...
         return g
     
-    def map_gz_export(self, map_type: str='_20p_speeds', access_cmap=False):
+    def map_gz_export(self, map_type: str='_20p_speeds', access_cmap=False,
+                      export_format: str='geojson', simplify_tolerance: float=None):
         '''
         Test exporting speed data to gcs bucket for iframe render
         Will always put state highway network in state['layers'][0] 
         map_type: '_20p_speeds', 'variance', or 'shn'
+        export_format: 'geojson' (gzipped) or 'flatgeobuf'
+        simplify_tolerance: meters to simplify geometries by before export, None to skip
         '''
+        export_kwargs = {'export_format': export_format, 'simplify_tolerance': simplify_tolerance}
         if not hasattr(self, 'spa_map_state'):
             self.spa_map_state = {"name": "null", "layers": [], "lat_lon": (),
                              "zoom": 13}
@@ -549,7 +553,7 @@ class RtFilterMapper:
         if map_type == '_20p_speeds':
             assert hasattr(self, 'detailed_map_view'), 'must generate a speedmap first with self.segment_speed_map'
             if len(self.spa_map_state["layers"]) != 1:  # re-initialize to SHN only
-                self.map_gz_export(map_type = 'shn')
+                self.map_gz_export(map_type = 'shn', **export_kwargs)
                 
             gdf = self.detailed_map_view.copy()
             gdf['organization_name'] = self.organization_name
@@ -567,7 +571,8 @@ class RtFilterMapper:
             export_result = set_state_export(gdf, subfolder = subfolder, filename = filename,
                                 map_type = 'speedmap', map_title = title, cmap = cmap,
                                 color_col = 'p20_mph', legend_url = legend_url,
-                                existing_state = self.spa_map_state
+                                existing_state = self.spa_map_state,
+                                **export_kwargs
                                             )
             self.spa_map_state = export_result['state_dict']
             self.spa_map_url = export_result['spa_link']
@@ -576,7 +581,7 @@ class RtFilterMapper:
         elif map_type == 'variance':
             assert hasattr(self, 'detailed_map_view'), 'must generate a variance map first with self.map_variance'
             if len(self.spa_map_state["layers"]) != 1:  # re-initialize to SHN only
-                self.map_gz_export(map_type = 'shn')
+                self.map_gz_export(map_type = 'shn', **export_kwargs)
             
             filename = f'{self.calitp_itp_id}_{self.filter_period}_variance'
             title = f"{self.organization_name} {self.display_date} {self.filter_period.replace('_', ' ')}"
@@ -585,7 +590,8 @@ class RtFilterMapper:
                                 map_type = 'speed_variation', map_title = title, cmap = self.variance_cmap,
                                 color_col = 'fast_slow_ratio', 
                                 legend_url = 'https://storage.googleapis.com/calitp-map-tiles/variance_legend.svg',
-                                existing_state = self.spa_map_state
+                                existing_state = self.spa_map_state,
+                                **export_kwargs
                                             )
             self.spa_map_state = export_result['state_dict']
             self.spa_map_url = export_result['spa_link']
@@ -597,7 +603,8 @@ class RtFilterMapper:
             title = f"D{dist} State Highway Network"
             
             export_result = set_state_export(self.shn, subfolder = subfolder, filename = filename,
-                                map_type = 'state_highway_network', map_title = title)
+                                map_type = 'state_highway_network', map_title = title,
+                                **export_kwargs)
             self.spa_map_state = export_result['state_dict']
             self.spa_map_url = export_result['spa_link']
             return
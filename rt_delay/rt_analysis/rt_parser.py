@@ -13,6 +13,12 @@ import shapely
 from shapely.geometry import Point
 
 import datetime as dt
+import glob
+import json
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm import tqdm
 
 # import numpy as np
@@ -248,9 +254,14 @@ class OperatorDayAnalysis:
             assert no_shape_trs.shape[0] < self.trs.shape[0] / 10, '>10% of trips have no shape!'
             self.trs = self.trs >> filter(_.shape_id.isin(self.shapes.shape_id))
         ## project scheduled stops to shape, TODO evaluate accuracy/replace alongside improving vp projection
-        self.trs['shape_meters'] = (self.trs.apply(lambda x:
-                (self.shapes >> filter(_.shape_id == x.shape_id)).geometry.iloc[0].project(x.geometry),
-         axis = 1))
+        ## each stop-shape pair is projected once, in a single vectorized call
+        trs_shape_geo = (self.trs[['shape_id']]
+                         .merge(self.shapes[['shape_id', 'geometry']]
+                                .drop_duplicates(subset = 'shape_id')
+                                .rename(columns = {'geometry': 'shape_geometry'}),
+                                on = 'shape_id', how = 'left'))
+        self.trs['shape_meters'] = shapely.line_locate_point(
+            np.asarray(trs_shape_geo.shape_geometry), np.asarray(self.trs.geometry))
         self.shapes = self.shapes.apply(self._ix_from_routeline, axis=1)
         
         # return ## debug return
@@ -416,27 +427,162 @@ class OperatorDayAnalysis:
 
         return
     
-def run_operators(analysis_date, operator_list, pbar=None):
+CHECKPOINT_DIR = './_rt_checkpoints'
+PROGRESS_COLS = ['organization_itp_id', 'stage', 'status', 'error',
+                 'elapsed_seconds', 'updated_at']
+
+def operator_checkpoint_path(itp_id, analysis_date, stage, checkpoint_dir=CHECKPOINT_DIR):
+    """
+    One small json file per operator-day-stage, so an interrupted run
+    (or a crashed worker) never loses what other operators finished.
+    """
+    return f'{checkpoint_dir}/{analysis_date.isoformat()}/{itp_id}_{stage}.json'
+
+def write_operator_checkpoint(record, analysis_date, checkpoint_dir=CHECKPOINT_DIR):
+    """
+    record: dict with PROGRESS_COLS
+    Write to a temp file then rename, so a checkpoint is never half written.
+    """
+    path = operator_checkpoint_path(record['organization_itp_id'], analysis_date,
+                                    record['stage'], checkpoint_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(record, f)
+    os.replace(f'{path}.tmp', path)
+    return
+
+def read_operator_checkpoints(analysis_date, checkpoint_dir=CHECKPOINT_DIR):
+    """
+    All checkpoints for a date as a df with PROGRESS_COLS,
+    keeping only the most recent stage for each operator.
+    """
+    records = []
+    for path in glob.glob(f'{checkpoint_dir}/{analysis_date.isoformat()}/*.json'):
+        with open(path) as f:
+            records.append(json.load(f))
+    checkpoints = pd.DataFrame(records, columns=PROGRESS_COLS)
+    checkpoints = (checkpoints.sort_values('updated_at')
+                   .drop_duplicates('organization_itp_id', keep='last')
+                   .reset_index(drop=True)
+                  )
+    return checkpoints
+
+def speedmap_progress_table(speedmaps_index, analysis_date=None, checkpoint_dir=CHECKPOINT_DIR):
+    """
+    speedmaps_index: pd.DataFrame of all agencies to try generating a speedmap,
+        from ca_transit_speed_maps/build_speedmaps_index.py
+    
+    Progress table for the speedmap scripts: one row per organization in the index,
+    with status from the latest checkpoint (already_ran, parser_failed,
+    map_confirmed, map_failed). Operators without a checkpoint whose
+    intermediate data is already in GCS are already_ran.
+    Replaces check_intermediate_data. speedmaps_index can also be a previously saved
+    progress table, its checkpoint columns are rebuilt from the checkpoints.
+    """
+    analysis_date = analysis_date or speedmaps_index.analysis_date.iloc[0]
+    if isinstance(analysis_date, str):
+        analysis_date = dt.date.fromisoformat(analysis_date)
+    checkpoints = read_operator_checkpoints(analysis_date, checkpoint_dir)
+
+    checkpoint_cols = [col for col in PROGRESS_COLS if col != 'organization_itp_id']
+    progress = speedmaps_index.drop(columns=checkpoint_cols, errors='ignore').merge(
+        checkpoints, on='organization_itp_id', how='left')
+    
+    no_checkpoint = progress.status.isna()
+    gcs_status = rt_utils.get_operators(
+        analysis_date, progress[no_checkpoint].organization_itp_id.to_list())
+    progress.loc[no_checkpoint, 'status'] = (progress[no_checkpoint].organization_itp_id
+                                             .map(gcs_status)
+                                             .replace({'not_yet_run': 'speedmap_segs_available'})
+                                            )
+    return progress
+
+def _limit_worker_memory(max_memory_gb):
+    """
+    ProcessPoolExecutor initializer. Cap the worker's address space so a runaway operator
+    raises MemoryError (recorded as parser_failed) instead of taking down the machine.
+    """
+    if max_memory_gb:
+        max_bytes = int(max_memory_gb * 1024**3)
+        resource.setrlimit(resource.RLIMIT_AS, (max_bytes, max_bytes))
+    return
+
+def parse_operator_day(itp_id, analysis_date, checkpoint_dir=CHECKPOINT_DIR):
     """
-    Wrapper function for generating rt_trips and stop_delay_views in GCS for operators on a given day, after checking existence with shared_utils.rt_utils.get_operators.
+    Generate and export rt_trips and stop_delay_views for one operator-day, then checkpoint.
+    Runs in a worker process, so failures are caught and recorded rather than raised.
+    """
+    start = time.time()
+    try:
+        rt_day = OperatorDayAnalysis(itp_id, analysis_date)
+        rt_day.export_views_gcs()
+        status, error = 'already_ran', None
+    except Exception as e:
+        status, error = 'parser_failed', f'{type(e).__name__}: {e}'
+    record = {'organization_itp_id': int(itp_id), 'stage': 'parser',
+              'status': status, 'error': error,
+              'elapsed_seconds': round(time.time() - start, 1),
+              'updated_at': dt.datetime.now().isoformat()}
+    write_operator_checkpoint(record, analysis_date, checkpoint_dir)
+    return record
+
+def run_operators(analysis_date, operator_list, pbar=None, max_workers=4,
+                  max_memory_gb=None, checkpoint_dir=CHECKPOINT_DIR, retry_failed=False):
+    """
+    Wrapper function for generating rt_trips and stop_delay_views in GCS for operators on a given day, after checking existence with shared_utils.rt_utils.get_operators
+    and any checkpoints from a previous (possibly interrupted) run.
+    
+    Each operator-day runs in its own worker process (recycled after every operator,
+    so memory doesn't accumulate), and a slow or failing operator doesn't hold up the rest.
 
     analysis_date: datetime.date
     operator_list: list of itp_id's
-    pbar: tqdm.notebook.tqdm(), optional progress bar for generation
+    pbar: tqdm.notebook.tqdm(), optional progress bar, advanced once per operator
+    max_workers: number of operators to run at once
+    max_memory_gb: optional cap on each worker's memory
+    checkpoint_dir: where per-operator checkpoint json files are written
+    retry_failed: rerun operators whose checkpoint says parser_failed
+    
+    Returns the checkpoint progress table (see read_operator_checkpoints) for this date.
     """
+    if isinstance(analysis_date, str):
+        analysis_date = dt.date.fromisoformat(analysis_date)
     op_dict_runstatus = rt_utils.get_operators(analysis_date, operator_list)
+    checkpoints = read_operator_checkpoints(analysis_date, checkpoint_dir)
     
-    op_list_notrun = []
-    for key, value in op_dict_runstatus.items():
-        if value == "not_yet_run":
-            op_list_notrun.append(key)
+    skip_status = ['already_ran', 'map_confirmed', 'map_failed']
+    if not retry_failed:
+        skip_status += ['parser_failed']
+    checkpointed = checkpoints[checkpoints.status.isin(skip_status)].organization_itp_id.to_list()
     
-    for itp_id in op_list_notrun:
-        print(f"calculating for agency: {itp_id}...")
-        try:
-            rt_day = OperatorDayAnalysis(itp_id, analysis_date, pbar)
-            rt_day.export_views_gcs()
-            print(f"complete for agency: {itp_id}")
-        except Exception as e:
-            print(f"rt failed for agency {itp_id}")
-            print(e)
\ No newline at end of file
+    op_list_notrun = [key for key, value in op_dict_runstatus.items()
+                      if value == "not_yet_run" and key not in checkpointed]
+    if pbar is not None:
+        pbar.reset(total=len(op_list_notrun))
+    
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             initializer=_limit_worker_memory,
+                             initargs=(max_memory_gb,),
+                             max_tasks_per_child=1) as executor:
+        futures = {executor.submit(parse_operator_day, itp_id, analysis_date,
+                                   checkpoint_dir): itp_id
+                   for itp_id in op_list_notrun}
+        for future in as_completed(futures):
+            itp_id = futures[future]
+            try:
+                record = future.result()
+            except Exception as e:
+                # worker died before it could checkpoint
+                record = {'organization_itp_id': int(itp_id), 'stage': 'parser',
+                          'status': 'parser_failed', 'error': f'{type(e).__name__}: {e}',
+                          'elapsed_seconds': None, 'updated_at': dt.datetime.now().isoformat()}
+                write_operator_checkpoint(record, analysis_date, checkpoint_dir)
+            if record['status'] == 'already_ran':
+                print(f"complete for agency: {itp_id} ({record['elapsed_seconds']}s)")
+            else:
+                print(f"rt failed for agency {itp_id}")
+                print(record['error'])
+            if pbar is not None:
+                pbar.update(1)
+    
+    return read_operator_checkpoints(analysis_date, checkpoint_dir)
@@ -1,5 +1,6 @@
 import os
 from rt_analysis import rt_filter_map_plot
+from shared_utils import rt_utils
 import pandas as pd
 import geopandas as gpd
 import datetime as dt
@@ -10,8 +11,11 @@ import shapely
 import numpy as np
 from calitp_data_analysis import get_fs
 import glob
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm.notebook import tqdm
 
+SEGMENT_STORE = f'{rt_utils.GCS_FILE_PATH}signal_speedmap_segments/'
+
 
 def read_signal_excel(path):
     '''
@@ -24,17 +28,62 @@ def read_signal_excel(path):
     
     return gdf
 
+def speedmap_segments_one_operator(itp_id, analysis_date, filter_args: dict = None):
+    '''
+    polygon segments for one operator from legacy speedmap workflow, with relevant ids attached
+    '''
+    rt_day = rt_filter_map_plot.from_gcs(itp_id, analysis_date)
+    if filter_args:
+        rt_day.set_filter(**filter_args)
+    _m = rt_day.segment_speed_map(how='low_speeds', no_title=True, shn=True,
+                         no_render=True
+                        )
+
+    dmv_proj = rt_day.detailed_map_view.to_crs(CA_NAD83Albers)
+    # re-add some identifiers since we won't have the instance handy
+    # dmv_proj['feed_key'] = rt_day.rt_trips.feed_key.iloc[0]
+    dmv_proj['gtfs_dataset_key'] = rt_day.rt_trips.gtfs_dataset_key.iloc[0]
+    dmv_proj['organization_name'] = rt_day.organization_name
+    dmv_proj['organization_itp_id'] = itp_id
+    dmv_proj['system_p50_median'] = dmv_proj.p50_mph.quantile(.5)
+    return dmv_proj
+
+def segment_store_path(analysis_date, filter_args: dict = None):
+    '''
+    one folder per date (and filter), one parquet per operator inside it
+    '''
+    filter_slug = ('_'.join(f'{k}={v}' for k, v in sorted(filter_args.items())).replace(':', '')
+                   if filter_args else 'all_day')
+    return f'{SEGMENT_STORE}{analysis_date}/{filter_slug}/'
+
+def stored_operators(store_path, fs=None):
+    '''
+    itp_ids already in the segment store, from the {itp_id}.parquet names,
+    anything else in the folder (_SUCCESS, temp files, folders) is ignored
+    '''
+    fs = fs or get_fs()
+    if not fs.exists(store_path):
+        return []
+    stems = [os.path.basename(path.rstrip('/')).removesuffix('.parquet')
+             for path in fs.ls(store_path) if path.rstrip('/').endswith('.parquet')]
+    return [int(stem) for stem in stems if stem.isdigit()]
+
 def concatenate_speedmap_segments(progress_df: pd.DataFrame = None,
                              itp_id_list: list = None,
                              analysis_date: dt.datetime = None,
                              pbar: tqdm = None,
-                             filter_args: dict = None):
+                             filter_args: dict = None,
+                             max_workers: int = 4):
     '''
     get polygon segments from legacy speedmap workflow, with relevant ids attached
-    relatively fast if already ran for date, slow otherwise
+    
+    operators are generated in parallel and each is saved to a columnar store in GCS
+    (see segment_store_path), so this is only slow the first time for a date,
+    after that all operators are read back in one pass.
     
     progress_df: see data_analyses/ca_transit_speed_maps
     filter_dict: dict of args to RtFilterMapper.set_filter
+    pbar: optional progress bar, advanced once per operator
     '''
     
     df_present = isinstance(progress_df, pd.DataFrame)
@@ -43,29 +92,33 @@ def concatenate_speedmap_segments(progress_df: pd.DataFrame = None,
                 and (not (df_present and analysis_date))), 'must provide either a speedmap progress df or itp_ids and analysis date'
     itp_id_list = itp_id_list or progress_df.organization_itp_id.to_list()
     analysis_date = analysis_date or progress_df.analysis_date.iloc[0]
-    all_segment_gdfs = []
-    for itp_id in itp_id_list:
-        print(itp_id)
-        try:
-            rt_day = rt_filter_map_plot.from_gcs(itp_id, analysis_date, pbar)
-            if filter_args:
-                rt_day.set_filter(**filter_args)
-            _m = rt_day.segment_speed_map(how='low_speeds', no_title=True, shn=True,
-                                 no_render=True
-                                )
-
-            dmv_proj = rt_day.detailed_map_view.to_crs(CA_NAD83Albers)
-            # re-add some identifiers since we won't have the instance handy
-            # dmv_proj['feed_key'] = rt_day.rt_trips.feed_key.iloc[0]
-            dmv_proj['gtfs_dataset_key'] = rt_day.rt_trips.gtfs_dataset_key.iloc[0]
-            dmv_proj['organization_name'] = rt_day.organization_name
-            dmv_proj['system_p50_median'] = dmv_proj.p50_mph.quantile(.5)
-
-            all_segment_gdfs += [dmv_proj]
-        except Exception as e:
-            print(f'{itp_id}, {e}')
-    
-    all_segment_gdfs = pd.concat(all_segment_gdfs)
+    
+    fs = get_fs()
+    store_path = segment_store_path(analysis_date, filter_args)
+    already_stored = stored_operators(store_path, fs)
+    to_run = [itp_id for itp_id in itp_id_list if itp_id not in already_stored]
+    if pbar is not None:
+        pbar.reset(total=len(to_run))
+    
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(speedmap_segments_one_operator, itp_id,
+                                   analysis_date, filter_args): itp_id
+                   for itp_id in to_run}
+        for future in as_completed(futures):
+            itp_id = futures[future]
+            try:
+                future.result().to_parquet(f'{store_path}{itp_id}.parquet')
+            except Exception as e:
+                print(f'{itp_id}, {e}')
+            if pbar is not None:
+                pbar.update(1)
+    
+    # nothing stored (every operator failed, or nothing to run on a first run)
+    if not set(itp_id_list) & set(stored_operators(store_path, fs)):
+        return gpd.GeoDataFrame(geometry=[], crs=CA_NAD83Albers)
+    
+    all_segment_gdfs = gpd.read_parquet(
+        store_path, filters=[[('organization_itp_id', 'in', list(itp_id_list))]])
     return all_segment_gdfs
 
 def copy_segment_speeds(progress_df: pd.DataFrame = None,
@@ -110,29 +163,50 @@ def copy_segment_speeds(progress_df: pd.DataFrame = None,
     
     return segment_lines_all
 
-def sjoin_signals(signal_gdf: gpd.GeoDataFrame,
-                  segments_gdf: gpd.GeoDataFrame,
-                  segments_lines_gdf: gpd.GeoDataFrame):
+def prep_signals(signal_gdf: gpd.GeoDataFrame):
     '''
     signal_gdf: one-off format from traffic ops. primarily a spatial process,
     so exclude freeway ramp meters (only relevant to traffic joining fwy,
     which usually isn't transit)
-    segments_gdf: geometry is polygons (buffered)
-    segments_lines_gdf: geometry is linestrings (need for later approaching calc)
     '''
-    
     signals = (signal_gdf
                    >> filter(_.tms_unit_type != 'Freeway Ramp Meters')
                    >> select(_.imms_id, _.location, _.geometry)
                ).copy()
-    signals_points = signals.to_crs(CA_NAD83Albers)
-    signals_buffered = signals_points.copy()
-    signals_buffered.geometry = signals_buffered.buffer(150)
+    signals_points = signals.to_crs(CA_NAD83Albers).reset_index(drop=True)
+    return signals_points
+
+def index_signals(signals_points: gpd.GeoDataFrame, buffer_meters: int = 150):
+    '''
+    spatial index on the buffered signals, tree positions line up with signals_points rows.
+    build once and reuse for every batch of segments.
+    '''
+    return shapely.STRtree(signals_points.buffer(buffer_meters).to_numpy())
 
-    joined = gpd.sjoin(segments_gdf, signals_buffered) >> select(-_.index_right)
+def sjoin_signals(signal_gdf: gpd.GeoDataFrame,
+                  segments_gdf: gpd.GeoDataFrame,
+                  segments_lines_gdf: gpd.GeoDataFrame,
+                  signal_tree: shapely.STRtree = None):
+    '''
+    signal_gdf: one-off format from traffic ops, see prep_signals
+    segments_gdf: geometry is polygons (buffered)
+    segments_lines_gdf: geometry is linestrings (need for later approaching calc)
+    signal_tree: optional, from index_signals(prep_signals(signal_gdf))
+    '''
+    signals_points = prep_signals(signal_gdf)
+    if signal_tree is None:
+        signal_tree = index_signals(signals_points)
 
-    points_for_join = signals_points >> select(_.imms_id, _.signal_pt_geom == _.geometry)
-    joined_signal_points = joined >> inner_join(_, points_for_join, on ='imms_id')
+    segments_gdf = segments_gdf.reset_index(drop=True)
+    seg_idx, signal_idx = signal_tree.query(segments_gdf.geometry.to_numpy(), predicate='intersects')
+    
+    joined_signal_points = pd.concat([
+        segments_gdf.iloc[seg_idx].reset_index(drop=True),
+        (signals_points.iloc[signal_idx]
+         .rename(columns={'geometry': 'signal_pt_geom'})
+         .reset_index(drop=True)
+        )
+    ], axis=1)
 
     # add line geometries from stop_segment_speed_view
     seg_lines = (segments_lines_gdf
@@ -143,32 +217,26 @@ def sjoin_signals(signal_gdf: gpd.GeoDataFrame,
     joined_seg_lines = joined_signal_points >> inner_join(_, seg_lines, on = ['shape_id', 'stop_sequence', 'stop_id'])
     return joined_seg_lines
 
-@np.vectorize
-def vector_start(linestring):
-    return shapely.ops.substring(linestring, 0, 0)
-
-@np.vectorize
-def vector_end(linestring):
-    return shapely.ops.substring(linestring, linestring.length, linestring.length)
-
-@np.vectorize
-def vector_distance(point1, point2):
-    return point1.distance(point2)
-
 def determine_approaching(joined_seg_lines_gdf: gpd.GeoDataFrame):
     
     '''
     using vectorized shapely functions,
-    determine if segment is approaching a signal or departing a signal.
+    determine if segment is approaching a signal or departing a signal,
+    and the segment's bearing (compass degrees, start to end).
     '''
+    line_geom = np.asarray(joined_seg_lines_gdf.line_geom)
+    signal_geom = np.asarray(joined_seg_lines_gdf.signal_pt_geom)
     
-    start_array = vector_start(joined_seg_lines_gdf.line_geom)
-    end_array = vector_end(joined_seg_lines_gdf.line_geom)
-    start_distances = vector_distance(start_array, joined_seg_lines_gdf.signal_pt_geom)
-    end_distances = vector_distance(end_array, joined_seg_lines_gdf.signal_pt_geom)
+    start_array = shapely.line_interpolate_point(line_geom, 0)
+    end_array = shapely.line_interpolate_point(line_geom, shapely.length(line_geom))
+    start_distances = shapely.distance(start_array, signal_geom)
+    end_distances = shapely.distance(end_array, signal_geom)
     approaching = start_distances > end_distances
     assert len(approaching) == len(joined_seg_lines_gdf)
     joined_seg_lines_gdf['approaching'] = approaching
+    joined_seg_lines_gdf['approach_bearing'] = np.round(np.degrees(np.arctan2(
+        shapely.get_x(end_array) - shapely.get_x(start_array),
+        shapely.get_y(end_array) - shapely.get_y(start_array))) % 360, 1)
     return joined_seg_lines_gdf
 
 def calculate_speed_score(df):
@@ -218,4 +286,22 @@ def calculate_scores(joined_seg_lines_gdf):
                                            )
                         >> mutate(overall_transit_score = _.speed_score + _.variability_score + _.frequency_score)
                        )
-    return median_by_signal >> arrange(-_.overall_transit_score)
\ No newline at end of file
+    return median_by_signal >> arrange(-_.overall_transit_score)
+
+def score_signals_statewide(signal_gdf: gpd.GeoDataFrame,
+                            progress_df: pd.DataFrame,
+                            segments_lines_gdf: gpd.GeoDataFrame,
+                            filter_args: dict = None,
+                            pbar: tqdm = None):
+    '''
+    score every signal against every operator's segments in one run:
+    load all speedmap segments from the store once, join against the signal index,
+    determine approaches and score.
+    
+    progress_df: see data_analyses/ca_transit_speed_maps
+    segments_lines_gdf: from copy_segment_speeds
+    '''
+    segments = concatenate_speedmap_segments(progress_df, pbar=pbar, filter_args=filter_args)
+    joined = sjoin_signals(signal_gdf, segments, segments_lines_gdf)
+    joined = determine_approaching(joined)
+    return calculate_scores(joined)
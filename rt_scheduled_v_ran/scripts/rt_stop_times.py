@@ -5,7 +5,9 @@ what was derived from RT vehicle positions.
 import datetime
 import pandas as pd
 
-from segment_speed_utils import helpers, segment_calcs
+from dask import delayed, compute
+
+from segment_speed_utils import helpers, segment_calcs, time_series_utils
 from update_vars import GTFS_DATA_DICT, SEGMENT_GCS, RT_SCHED_GCS
 
 def prep_scheduled_stop_times(
@@ -93,20 +95,59 @@ def assemble_scheduled_rt_stop_times(
     return df
 
 
+def export_scheduled_rt_stop_times(
+    df: pd.DataFrame,
+    analysis_date: str,
+    export_file: str
+):
+    df.to_parquet(f"{RT_SCHED_GCS}{export_file}_{analysis_date}.parquet")
+    
+    return
+
+
+def assemble_scheduled_rt_stop_times_batched(
+    analysis_date_list: list,
+    trip_stop_cols: list,
+    export_file: str,
+    overwrite: bool = True
+) -> list:
+    """
+    Build every date's schedule vs RT stop times in one dask graph
+    and write one file per date.
+    If overwrite is False, dates that already have an output are skipped.
+    """
+    dates = time_series_utils.find_dates_without_output(
+        f"{RT_SCHED_GCS}{export_file}", analysis_date_list, overwrite
+    )
+    
+    results = [
+        delayed(export_scheduled_rt_stop_times)(
+            delayed(assemble_scheduled_rt_stop_times)(analysis_date, trip_stop_cols),
+            analysis_date, 
+            export_file
+        ) for analysis_date in dates
+    ]
+    
+    compute(*results)
+    
+    return dates
+
+
 if __name__ == "__main__":
     
-    from update_vars import analysis_date_list
+    from update_vars import analysis_date_list, overwrite_existing_dates
     
     EXPORT_FILE = GTFS_DATA_DICT.rt_vs_schedule_tables.schedule_rt_stop_times
     trip_stop_cols = [*GTFS_DATA_DICT.rt_stop_times.trip_stop_cols]
     
-    for analysis_date in analysis_date_list:
-        
-        start = datetime.datetime.now()
-        
-        df = assemble_scheduled_rt_stop_times(analysis_date, trip_stop_cols)
-        
-        df.to_parquet(f"{RT_SCHED_GCS}{EXPORT_FILE}_{analysis_date}.parquet")
-        
-        end = datetime.datetime.now()
-        print(f"execution time: {analysis_date} {end - start}")
\ No newline at end of file
+    start = datetime.datetime.now()
+    
+    dates = assemble_scheduled_rt_stop_times_batched(
+        analysis_date_list, 
+        trip_stop_cols, 
+        EXPORT_FILE,
+        overwrite = overwrite_existing_dates
+    )
+    
+    end = datetime.datetime.now()
+    print(f"execution time: {dates} {end - start}")
@@ -5,14 +5,25 @@ import datetime
 import pandas as pd
 import sys
 
+from dask import delayed, compute
 from loguru import logger
 
-from segment_speed_utils import gtfs_schedule_wrangling, metrics
+from segment_speed_utils import gtfs_schedule_wrangling, metrics, time_series_utils
 from segment_speed_utils.time_series_utils import ROUTE_DIR_COLS
 from update_vars import RT_SCHED_GCS, GTFS_DATA_DICT
 from shared_utils import rt_dates
 
-def operator_metrics(analysis_date: str, dict_inputs: dict) -> pd.DataFrame:
+CROSSWALK_COLS = [
+    "schedule_gtfs_dataset_key",
+    "name",
+    "organization_name",
+    "caltrans_district",]
+
+
+def operator_metrics(
+    analysis_date: str, 
+    dict_inputs: dict
+) -> pd.DataFrame:
     start = datetime.datetime.now()
 
     TRIP_EXPORT = dict_inputs.vp_trip_metrics
@@ -22,16 +33,10 @@ def operator_metrics(analysis_date: str, dict_inputs: dict) -> pd.DataFrame:
     df = pd.read_parquet(f"{RT_SCHED_GCS}{TRIP_EXPORT}_{analysis_date}.parquet")
     
     # Merge in identifiers
-    crosswalk_cols = [
-    "schedule_gtfs_dataset_key",
-    "name",
-    "organization_name",
-    "caltrans_district",]
-    
     df2 = gtfs_schedule_wrangling.merge_operator_identifiers(
         df,
         [analysis_date],
-        columns = crosswalk_cols)
+        columns = CROSSWALK_COLS)
     
     # Aggregate
     groupby_cols = [
@@ -57,6 +62,33 @@ def operator_metrics(analysis_date: str, dict_inputs: dict) -> pd.DataFrame:
 
     return agg1
 
+
+def operator_metrics_batched(
+    analysis_date_list: list,
+    dict_inputs: dict,
+    overwrite: bool = True
+) -> list:
+    """
+    Aggregate agency metrics for many dates in one dask graph.
+    Each date reads its own operator crosswalk inside its task.
+    If overwrite is False, dates that already have an output are skipped.
+    """
+    OP_EXPORT = dict_inputs.vp_operator_metrics
+
+    dates = time_series_utils.find_dates_without_output(
+        f"{RT_SCHED_GCS}{OP_EXPORT}", analysis_date_list, overwrite
+    )
+    
+    results = [
+        delayed(operator_metrics)(analysis_date, dict_inputs) 
+        for analysis_date in dates
+    ]
+    
+    compute(*results)
+    
+    return dates
+
+
 if __name__ == "__main__":
     
     LOG_FILE = "../logs/rt_v_scheduled_operator_metrics.log"
@@ -65,9 +97,12 @@ if __name__ == "__main__":
                format="{time:YYYY-MM-DD at HH:mm:ss} | {level} | {message}", 
                level="INFO")
     
-    from update_vars import analysis_date_list
+    from update_vars import analysis_date_list, overwrite_existing_dates
     
     dict_inputs = GTFS_DATA_DICT.rt_vs_schedule_tables
     
-    for analysis_date in analysis_date_list: 
-        operator_metrics(analysis_date, dict_inputs)
\ No newline at end of file
+    operator_metrics_batched(
+        analysis_date_list, 
+        dict_inputs, 
+        overwrite = overwrite_existing_dates
+    )
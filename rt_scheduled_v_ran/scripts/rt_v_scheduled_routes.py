@@ -5,9 +5,10 @@ import datetime
 import pandas as pd
 import sys
 
+from dask import delayed, compute
 from loguru import logger
 
-from segment_speed_utils import gtfs_schedule_wrangling, metrics
+from segment_speed_utils import gtfs_schedule_wrangling, metrics, time_series_utils
 from segment_speed_utils.time_series_utils import ROUTE_DIR_COLS
 from update_vars import RT_SCHED_GCS, GTFS_DATA_DICT
 
@@ -36,6 +37,16 @@ def average_rt_trip_times(
     return df
     
 
+CROSSWALK_COLS = [
+    "schedule_gtfs_dataset_key",
+    "name",
+    "schedule_source_record_id",
+    "base64_url",
+    "organization_source_record_id",
+    "organization_name",
+    "caltrans_district",]
+
+
 def route_metrics(
     analysis_date: str, 
     dict_inputs: dict
@@ -52,15 +63,6 @@ def route_metrics(
         f"{RT_SCHED_GCS}{TRIP_EXPORT}_{analysis_date}.parquet"
     )
     
-    crosswalk_cols = [
-    "schedule_gtfs_dataset_key",
-    "name",
-    "schedule_source_record_id",
-    "base64_url",
-    "organization_source_record_id",
-    "organization_name",
-    "caltrans_district",]
-    
     route_df = metrics.concatenate_peak_offpeak_allday_averages(
         trip_df,
         group_cols = ["schedule_gtfs_dataset_key"] + ROUTE_DIR_COLS,
@@ -74,7 +76,7 @@ def route_metrics(
     route_df = gtfs_schedule_wrangling.merge_operator_identifiers(
         route_df,
         [analysis_date],
-        columns = crosswalk_cols)
+        columns = CROSSWALK_COLS)
     
     # Save
     route_df.to_parquet(
@@ -86,6 +88,33 @@ def route_metrics(
     
     return 
 
+
+def route_metrics_batched(
+    analysis_date_list: list,
+    dict_inputs: dict,
+    overwrite: bool = True
+) -> list:
+    """
+    Aggregate route-direction metrics for many dates in one dask graph.
+    Each date reads its own operator crosswalk inside its task.
+    If overwrite is False, dates that already have an output are skipped.
+    """
+    ROUTE_EXPORT = dict_inputs.vp_route_direction_metrics
+
+    dates = time_series_utils.find_dates_without_output(
+        f"{RT_SCHED_GCS}{ROUTE_EXPORT}", analysis_date_list, overwrite
+    )
+    
+    results = [
+        delayed(route_metrics)(analysis_date, dict_inputs) 
+        for analysis_date in dates
+    ]
+    
+    compute(*results)
+    
+    return dates
+
+
 if __name__ == "__main__":
     
     LOG_FILE = "../logs/rt_v_scheduled_route_metrics.log"
@@ -94,9 +123,12 @@ if __name__ == "__main__":
                format="{time:YYYY-MM-DD at HH:mm:ss} | {level} | {message}", 
                level="INFO")
     
-    from update_vars import analysis_date_list
+    from update_vars import analysis_date_list, overwrite_existing_dates
     
     dict_inputs = GTFS_DATA_DICT.rt_vs_schedule_tables
     
-    for analysis_date in analysis_date_list: 
-        route_metrics(analysis_date, dict_inputs)
+    route_metrics_batched(
+        analysis_date_list, 
+        dict_inputs, 
+        overwrite = overwrite_existing_dates
+    )
@@ -7,133 +7,32 @@ import geopandas as gpd
 import pandas as pd
 import sys
 
-from dask import delayed, compute
 from loguru import logger
 
 from calitp_data_analysis.geography_utils import WGS84
 from segment_speed_utils.project_vars import PROJECT_CRS
 from segment_speed_utils import (gtfs_schedule_wrangling, helpers, 
-                                 metrics,
-                                 segment_calcs)
+                                 metrics)
 from update_vars import SEGMENT_GCS, RT_SCHED_GCS
 
 
 # UPDATE COMPLETENESS
-def vp_trip_time(vp: pd.DataFrame,) -> pd.DataFrame:
-    """
-    For each trip: find the total service minutes
-    recorded in real time data so we can compare it with
-    scheduled service minutes.
-    """
-    vp = segment_calcs.convert_timestamp_to_seconds(
-        vp, ["location_timestamp_local"])
-    
-    # Find the max and the min time based on location timestamp
-    grouped_df = vp.groupby("trip_instance_key", 
-                            observed=True, group_keys=False)
-    start_time = (
-        grouped_df
-        .agg({
-            "location_timestamp_local": "count",
-            "location_timestamp_local_sec": "min"
-        })
-        .reset_index()
-        .rename(columns={
-            "location_timestamp_local": "total_vp",
-            "location_timestamp_local_sec": "min_time"
-        })
-    )
-    
-    end_time = (
-        grouped_df
-        .agg({"location_timestamp_local_sec": "max"})
-        .reset_index()
-        .rename(columns={"location_timestamp_local_sec": "max_time"})
-    )
-    
-    df = start_time.merge(
-        end_time,
-        on = "trip_instance_key",
-        how = "inner"
-    )
-    
-    # Find total rt service minutes (take difference in seconds)
-    df = df.assign(
-        rt_service_minutes = (df.max_time - df.min_time) / 60
-    ).drop(columns = ["max_time", "min_time"])
-
-    return df
-
-
-def vp_one_minute_interval_metrics(
-    vp: pd.DataFrame,
-) -> pd.DataFrame:
-    """
-    For each trip: count how many rows are associated with each minute
-    then tag whether or not a minute has 2+ pings. 
-    """
-    time_col = "location_timestamp_local"
-    grouped_df = vp.groupby(
-        ["trip_instance_key", 
-         pd.Grouper(key = time_col, freq="1Min")
-        ]
-    )
-    
-    # Find number of pings each minute
-    df = (
-        grouped_df
-        .vp_idx
-        .count()
-        .reset_index()
-        .rename(columns={"vp_idx": "n_pings_per_min"})
-    )
-
-    # Determine which rows have 2+ pings per minute
-    df = df.assign(
-        at_least2=df.apply(
-            lambda x: 1 if x.n_pings_per_min >= 2 else 0, axis=1
-        )
-    )
-    
-    df2 = (df.groupby("trip_instance_key", observed=True, group_keys=False)
-           .agg({
-               # this is time frequency grouper
-               time_col: "count",
-               "at_least2": "sum"
-           })
-           .rename(columns = {
-               time_col: "minutes_atleast1_vp", 
-               "at_least2": "minutes_atleast2_vp"
-           }).reset_index()
-          )
-    
-    return df2
-
-
 def basic_counts_by_vp_trip(analysis_date: str) -> pd.DataFrame:
     """
     Calculate vp trip metrics that are strictly tabular
     that can be easily generated.
-    Use dask delayed because pd.Grouper is pandas only.
+    Total vp, RT service minutes and minutes with 1 or 2+ vp 
+    come out of one pass over the day's vp.
     """
     trip_cols = ["trip_instance_key"]
     
-    vp = delayed(pd.read_parquet)(
+    vp = pd.read_parquet(
         f"{SEGMENT_GCS}vp_usable_{analysis_date}",
-        columns = trip_cols + ["location_timestamp_local", "vp_idx"],
+        columns = trip_cols + ["location_timestamp_local"],
     )
     
-    rt_service_df = vp_trip_time(vp)
-    rt_time_coverage = vp_one_minute_interval_metrics(vp)
-   
-    results = delayed(pd.merge)(
-        rt_service_df,
-        rt_time_coverage,
-        on = trip_cols,
-        how = "inner"
-    )
+    results = metrics.vp_trip_time_and_minute_metrics(vp)
     
-    results = compute(results)[0]
     results.to_parquet(
         f"{RT_SCHED_GCS}vp_trip/intermediate/"
         f"trip_stats_{analysis_date}.parquet")
@@ -8,6 +8,9 @@ oct2024_week = rt_dates.get_week("oct2024", exclude_wed=True)
 
 #analysis_date_list = [rt_dates.DATES["oct2024"]]
 analysis_date_list = [rt_dates.DATES[f"oct2024{i}"] for i in ["a", "b"]]
+# Every date is rerun, so outputs pick up fixes upstream.
+# For a backfill, set to False to skip dates already written
+overwrite_existing_dates = True
 
 GTFS_DATA_DICT = catalog_utils.get_catalog("gtfs_analytics_data")
 
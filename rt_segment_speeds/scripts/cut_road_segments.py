@@ -2,11 +2,14 @@
 Cut road segments.
 """
 import datetime
+import gcsfs
 import geopandas as gpd
+import hashlib
+import json
 import pandas as pd
+import shapely
 import sys
 
-from dask import delayed, compute
 from loguru import logger
 
 from calitp_data_analysis.sql import to_snakecase
@@ -14,9 +17,12 @@ from segment_speed_utils.project_vars import (SHARED_GCS,
                                               PROJECT_CRS, 
                                               ROAD_SEGMENT_METERS
                                              )
-from calitp_data_analysis import geography_utils, utils
+from calitp_data_analysis import utils
+from segment_speed_utils import wrangle_shapes
 from shared_utils import rt_utils
 
+fs = gcsfs.GCSFileSystem()
+
 def load_roads(**kwargs) -> gpd.GeoDataFrame:
     """
     Load roads based on what you filter for MTFCC values (road types).
@@ -92,7 +98,10 @@ def cut_segments(
     group_cols: list,
     segment_length_meters: int
 ) -> gpd.GeoDataFrame:
-    
+    """
+    Roads shorter than the segment length are kept as one segment.
+    Longer roads are all cut at once at fixed intervals.
+    """
     short_roads = roads[
         roads.road_length <= segment_length_meters
     ].drop(columns = "road_length").assign(
@@ -103,19 +112,20 @@ def cut_segments(
         roads.road_length > segment_length_meters
     ].drop(columns = "road_length").reset_index(drop=True)
     
-    gdf["segment_geometry"] = gdf.apply(
-        lambda x: 
-        geography_utils.create_segments(x.geometry, int(segment_length_meters)), 
-        axis=1,
+    line_idx, segment_sequence, segment_geom = (
+        wrangle_shapes.cut_lines_at_fixed_interval(
+            gdf.geometry.to_numpy(), 
+            int(segment_length_meters)
+        )
     )
     
-    gdf2 = geography_utils.explode_segments(
-        gdf,
-        group_cols,
-        segment_col = "segment_geometry",
-    )[
-        group_cols + ["segment_sequence", "geometry"]
-    ].set_geometry("geometry").set_crs(PROJECT_CRS)
+    gdf2 = gpd.GeoDataFrame(
+        gdf[group_cols].iloc[line_idx].reset_index(drop=True).assign(
+            segment_sequence = segment_sequence.astype("int16")
+        ),
+        geometry = segment_geom,
+        crs = PROJECT_CRS
+    )
     
     segmented = pd.concat(
         [short_roads, gdf2], axis=0
@@ -132,43 +142,90 @@ def add_segment_direction(df: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
     Since we're going to reverse the road segment to create the
     one running on other side, we need to distinguish between
     these 2 rows with same linearid-mtfcc-fullname.
+    
+    Direction comes from the vector between the 
+    segment's first and last points.
     """
     df = df.dropna(subset="geometry")
-    df = rt_utils.add_origin_destination(df)
+    
+    geom = df.geometry.to_numpy()
+    origin = shapely.get_point(geom, 0)
+    destination = shapely.get_point(geom, -1)
     
     df = df.assign(
-        primary_direction = df.apply(
-            lambda x: 
-            rt_utils.primary_cardinal_direction(x.origin, x.destination),
-            axis=1,
+        origin = gpd.GeoSeries(origin, index=df.index, crs=df.crs),
+        destination = gpd.GeoSeries(destination, index=df.index, crs=df.crs),
+        primary_direction = rt_utils.primary_cardinal_direction_array(
+            shapely.get_x(destination) - shapely.get_x(origin),
+            shapely.get_y(destination) - shapely.get_y(origin),
         )
     )
 
     return df
 
 
+def hash_roads(
+    roads: gpd.GeoDataFrame, 
+    segment_length_meters: int
+) -> str:
+    """
+    Fingerprint the roads input (attributes and geometry)
+    along with the segment length, so we can tell if the
+    segmented roads already saved came from the same input.
+    """
+    h = hashlib.sha256()
+    
+    h.update(
+        pd.util.hash_pandas_object(
+            roads.drop(columns = "geometry"), index=False
+        ).to_numpy().tobytes()
+    )
+    h.update(b"".join(shapely.to_wkb(roads.geometry.to_numpy())))
+    h.update(str(segment_length_meters).encode())
+    
+    return h.hexdigest()
+
+
 def cut_road_segments(
     group_cols: list,
     segment_length_meters: int, 
     road_segment_str: str, 
     **kwargs
 ):
-    roads = delayed(load_roads)(**kwargs)
+    """
+    Cut roads into segments and add direction.
+    Skip the cutting if the roads input is unchanged
+    since the last time this segmented roads file was exported.
+    """
+    EXPORT_FILE = f"segmented_roads_{road_segment_str}_2020"
+    HASH_FILE = f"{SHARED_GCS}{EXPORT_FILE}_roads_hash.json"
     
-    road_segments = delayed(cut_segments)(
+    roads = load_roads(**kwargs)
+    roads_hash = hash_roads(roads, segment_length_meters)
+    
+    if fs.exists(HASH_FILE) and fs.exists(f"{SHARED_GCS}{EXPORT_FILE}.parquet"):
+        with fs.open(HASH_FILE, "r") as f:
+            cached_hash = json.load(f)["roads_hash"]
+        
+        if cached_hash == roads_hash:
+            logger.info(f"{EXPORT_FILE}: roads unchanged, using cached segments")
+            return
+    
+    road_segments = cut_segments(
         roads, 
         group_cols, 
         segment_length_meters
     ).pipe(add_segment_direction)
     
-    road_segments = compute(road_segments)[0]
-    
     utils.geoparquet_gcs_export(
         road_segments,
         SHARED_GCS,
-        f"segmented_roads_{road_segment_str}_2020"
+        EXPORT_FILE
     )   
     
+    with fs.open(HASH_FILE, "w") as f:
+        json.dump({"roads_hash": roads_hash}, f)
+    
     return 
     
     
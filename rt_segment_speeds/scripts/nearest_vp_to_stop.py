@@ -47,7 +47,8 @@ def stop_times_for_shape_segments(
         analysis_date,
         columns = ["trip_instance_key", "shape_array_key",
                    "stop_sequence", "stop_id", "stop_pair",
-                   "stop_primary_direction", "geometry"],
+                   "stop_primary_direction", "shape_stop_idx", 
+                   "geometry"],
         filters = [[("trip_instance_key", "in", subset_trips)]],
         get_pandas = True,
         with_direction = True
@@ -78,7 +79,7 @@ def stop_times_for_all_trips(
         analysis_date,
         columns = ["trip_instance_key", "shape_array_key",
                    "stop_sequence", "stop_id", "stop_pair", 
-                   "stop_primary_direction",
+                   "stop_primary_direction", "shape_stop_idx",
                    "geometry"],
         with_direction = True,
         get_pandas = True,
@@ -104,9 +105,11 @@ def stop_times_for_speedmaps(
         'trip_instance_key', 'shape_array_key',
         'stop_sequence', 'stop_sequence1', 
         'stop_id', 'stop_pair',
-        'stop_primary_direction', 'geometry'
+        'stop_primary_direction', 'shape_stop_idx', 'geometry'
     ] 
     
+    # Proxy stops are not in the stop-to-shape index, 
+    # so shape_stop_idx is left missing
     STOP_TIMES_FILE = GTFS_DATA_DICT.speedmap_segments.proxy_stop_times
 
     stop_times = gpd.read_parquet(
@@ -138,7 +141,7 @@ def nearest_neighbor_for_stop(
     stop_time_col_order = [
         'trip_instance_key', 'shape_array_key',
         'stop_sequence', 'stop_id', 'stop_pair',
-        'stop_primary_direction', 'geometry'
+        'stop_primary_direction', 'shape_stop_idx', 'geometry'
     ] 
     
     if segment_type == "stop_segments":
@@ -164,6 +167,7 @@ def nearest_neighbor_for_stop(
     # use trip_stop_cols as a way to uniquely key into a row 
     keep_cols = trip_stop_cols + [
         "shape_array_key",
+        "shape_stop_idx",
         "stop_geometry",
         "nearest_vp_arr"
     ]
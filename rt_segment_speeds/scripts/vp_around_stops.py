@@ -24,35 +24,66 @@ def stops_projected_against_shape(
     trip_stop_cols: list,
 ) -> pd.DataFrame:
     """
-    From nearest 10 vp points, project the stop geometry
-    onto shape geometry and get 
-    stop_meters.
+    From nearest 10 vp points, attach stop_meters
+    (stop geometry projected onto shape geometry).
+    
+    Stops found in the stop-to-shape index (from gtfs_funnel) 
+    are an integer join on shape_stop_idx. Only proxy stops
+    (speedmaps) need to be projected against the shape here.
     """
     stop_position = gpd.read_parquet(
         f"{SEGMENT_GCS}{input_file}_{analysis_date}.parquet",
         columns = trip_stop_cols + [
-            "shape_array_key", "stop_geometry"],
+            "shape_array_key", "shape_stop_idx", "stop_geometry"],
     ).to_crs(PROJECT_CRS)
     
+    indexed_stops = stop_position[
+        stop_position.shape_stop_idx.notna()
+    ][trip_stop_cols + ["shape_stop_idx"]].astype({"shape_stop_idx": "int64"})
+    
+    stop_meters_index = helpers.import_stop_shape_meters(
+        analysis_date,
+        columns = ["shape_stop_idx", "stop_meters"]
+    )
+    
+    indexed_gdf = pd.merge(
+        indexed_stops,
+        stop_meters_index,
+        on = "shape_stop_idx",
+        how = "inner"
+    )[trip_stop_cols + ["stop_meters"]]
+    
+    proxy_stops = stop_position[stop_position.shape_stop_idx.isna()]
+    
+    if len(proxy_stops) == 0:
+        return indexed_gdf
+    
     shapes = helpers.import_scheduled_shapes(
         analysis_date,
         columns = ["shape_array_key", "geometry"],
+        filters = [[("shape_array_key", "in", 
+                     proxy_stops.shape_array_key.unique().tolist())]],
         crs = PROJECT_CRS,
         get_pandas = True
     )
     
-    gdf = pd.merge(
-        stop_position,
+    proxy_gdf = pd.merge(
+        proxy_stops,
         shapes.rename(columns = {"geometry": "shape_geometry"}),
         on = "shape_array_key",
         how = "inner"
     )
     
-    gdf = gdf.assign(
-        stop_meters = gdf.shape_geometry.project(gdf.stop_geometry),
+    proxy_gdf = proxy_gdf.assign(
+        stop_meters = proxy_gdf.shape_geometry.project(proxy_gdf.stop_geometry),
     )[trip_stop_cols + ["stop_meters"]]
     
-    del shapes, stop_position
+    gdf = pd.concat(
+        [indexed_gdf, proxy_gdf], 
+        axis=0, ignore_index=True
+    )
+    
+    del shapes, stop_position, stop_meters_index
     
     return gdf
 
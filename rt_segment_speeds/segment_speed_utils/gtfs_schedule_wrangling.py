@@ -4,6 +4,7 @@ All kinds of GTFS schedule table wrangling.
 import geopandas as gpd
 import pandas as pd
 import dask.dataframe as dd
+import re
 
 from typing import Literal, Union
 
@@ -99,6 +100,78 @@ def stop_arrivals_per_stop(
     return arrivals_by_stop
     
     
+def stop_frequencies_by_day_type(
+    analysis_dates: dict,
+    operator_names: list = None,
+    by_hour: bool = True
+) -> pd.DataFrame:
+    """
+    For each stop-route_type and day type, count the trips 
+    (and routes) serving the stop, by departure_hour if by_hour is True.
+    
+    analysis_dates: {day_type: analysis_date}, 
+        ex: {"weekday": "2024-04-17", "saturday": "2024-04-20"}
+        Dates need to be in the gtfs_funnel cached trips / stop_times.
+    operator_names: optional list of strings, keep feeds whose name 
+        contains any of these (not case-sensitive).
+    
+    Reads the cached schedule tables instead of the warehouse,
+    stacks all the dates and aggregates in one groupby.
+    """
+    stop_cols = ["schedule_gtfs_dataset_key", "name", 
+                 "feed_key", "stop_id", "route_type"]
+    
+    df = []
+    
+    for day_type, analysis_date in analysis_dates.items():
+        trips = helpers.import_scheduled_trips(
+            analysis_date,
+            columns = ["gtfs_dataset_key", "name", "feed_key",
+                       "trip_id", "route_id", "route_type"],
+            get_pandas = True
+        )
+        
+        if operator_names is not None:
+            trips = trips[
+                trips.name.str.contains(
+                    "|".join(map(re.escape, operator_names)), 
+                    case=False, regex=True)
+            ]
+        
+        stop_times = helpers.import_scheduled_stop_times(
+            analysis_date,
+            filters = [[("feed_key", "in", trips.feed_key.unique().tolist())]],
+            columns = ["feed_key", "trip_id", "stop_id", "departure_hour"],
+            get_pandas = True,
+            with_direction = False
+        )
+        
+        df.append(
+            pd.merge(
+                stop_times,
+                trips,
+                on = ["feed_key", "trip_id"],
+                how = "inner"
+            ).assign(day_type = day_type)
+        )
+    
+    df = pd.concat(df, axis=0, ignore_index=True)
+    
+    group_cols = ["day_type"] + stop_cols
+    if by_hour:
+        group_cols = group_cols + ["departure_hour"]
+    
+    stop_freq = (
+        df.groupby(group_cols, observed=True, group_keys=False)
+        .agg(
+            n_trips = ("trip_id", "nunique"),
+            n_routes = ("route_id", "nunique")
+        ).reset_index()
+    )
+    
+    return stop_freq
+
+    
 def add_peak_offpeak_column(df: pd.DataFrame) -> pd.DataFrame:
     """
     Add a single peak_offpeak column based on the time-of-day column.
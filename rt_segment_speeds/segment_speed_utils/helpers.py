@@ -124,6 +124,26 @@ def import_scheduled_stop_times(
     return stop_times.drop_duplicates().reset_index(drop=True)
 
 
+def import_stop_shape_meters(
+    analysis_date: str,
+    filters: tuple = None,
+    columns: list = None,
+) -> pd.DataFrame:
+    """
+    Get the stop-to-shape index (stop_meters for each 
+    shape_array_key-stop_id), created alongside stop_times_direction.
+    Join to stop_times_direction with the integer shape_stop_idx.
+    """
+    TABLE = GTFS_DATA_DICT.rt_vs_schedule_tables.stop_shape_meters
+    FILE = f"{RT_SCHED_GCS}{TABLE}_{analysis_date}.parquet"
+    
+    df = pd.read_parquet(
+        FILE, filters = filters, columns = columns
+    )
+    
+    return df
+
+
 def import_scheduled_stops(
     analysis_date: str,
     filters: tuple = None,
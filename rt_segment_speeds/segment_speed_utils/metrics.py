@@ -2,6 +2,7 @@
 Define the metrics we can derive for 
 segment speeds, RT vs schedule, etc.
 """
+import numpy as np
 import pandas as pd
 
 from typing import Literal
@@ -92,22 +93,114 @@ def derive_trip_comparison_metrics(
                                        df.scheduled_service_minutes)
     )
 
+    # Compare the whole column against the cutoffs at once
+    # instead of going row-by-row. NaNs compare as False, so
+    # trips missing either set of minutes are tagged 0 for all 3.
+    journey_diff = df.rt_sched_journey_difference
+    
     df = df.assign(
-        is_early = df.apply(
-            lambda x: 
-            1 if x.rt_sched_journey_difference < early_cutoff
-            else 0, axis=1).astype(int),
-        is_ontime = df.apply(
-            lambda x: 
-            1 if (x.rt_sched_journey_difference >= early_cutoff) and 
-            (x.rt_sched_journey_difference <= late_cutoff)
-            else 0, axis=1).astype(int), 
-        is_late = df.apply(
-            lambda x: 
-            1 if x.rt_sched_journey_difference > late_cutoff
-            else 0, axis=1).astype(int),
+        is_early = (journey_diff < early_cutoff).astype(int),
+        is_ontime = ((journey_diff >= early_cutoff) & 
+                     (journey_diff <= late_cutoff)).astype(int),
+        is_late = (journey_diff > late_cutoff).astype(int),
+    )
+    
+    return df
+
+
+def vp_trip_time_and_minute_metrics(
+    vp: pd.DataFrame,
+    group_col: str = "trip_instance_key",
+    timestamp_col: str = "location_timestamp_local"
+) -> pd.DataFrame:
+    """
+    For each trip, in one pass over the vp: 
+    count the vp (total_vp), find the RT service minutes 
+    (first to last vp), and count the minutes 
+    that have at least 1 or 2+ pings.
+    
+    Timestamps are floored into integer minute bins (seconds // 60)
+    and the vp are sorted once by trip-minute. 
+    The runs of the same trip-minute give the pings per minute, 
+    and np.bincount / reduceat roll those up to the trip.
+    """
+    vp = vp[vp[timestamp_col].notna()]
+    
+    trip_codes, trip_keys = pd.factorize(vp[group_col], sort=True)
+    n_trips = len(trip_keys)
+    
+    minute_bins = (
+        vp[timestamp_col].to_numpy()
+        .astype("datetime64[s]").astype("int64") // 60
+    )
+    
+    # RT service minutes are measured on seconds since midnight, 
+    # same as segment_calcs.convert_timestamp_to_seconds
+    time_sec = segment_calcs.convert_timestamp_to_seconds(
+        vp[[timestamp_col]], [timestamp_col]
+    )[f"{timestamp_col}_sec"].to_numpy()
+    
+    order = np.lexsort((minute_bins, trip_codes))
+    trip_codes = trip_codes[order]
+    minute_bins = minute_bins[order]
+    time_sec = time_sec[order]
+    
+    # Positions where a new trip / new trip-minute starts
+    new_trip = np.ones(len(order), dtype=bool)
+    new_trip[1:] = trip_codes[1:] != trip_codes[:-1]
+    
+    new_minute = new_trip.copy()
+    new_minute[1:] |= minute_bins[1:] != minute_bins[:-1]
+    
+    trip_starts = np.flatnonzero(new_trip)
+    minute_starts = np.flatnonzero(new_minute)
+    
+    # Number of pings for each trip-minute
+    n_pings_per_min = np.diff(np.append(minute_starts, len(order)))
+    minute_trip_codes = trip_codes[minute_starts]
+    
+    total_vp = np.bincount(trip_codes, minlength = n_trips)
+    
+    minutes_atleast1_vp = np.bincount(
+        minute_trip_codes, 
+        minlength = n_trips
+    )
+    minutes_atleast2_vp = np.bincount(
+        minute_trip_codes, 
+        weights = (n_pings_per_min >= 2),
+        minlength = n_trips
     )
     
+    if n_trips > 0:
+        min_time = np.minimum.reduceat(time_sec, trip_starts)
+        max_time = np.maximum.reduceat(time_sec, trip_starts)
+    else:
+        min_time = max_time = time_sec[:0]
+    
+    df = pd.DataFrame({
+        group_col: np.asarray(trip_keys),
+        "total_vp": total_vp.astype("int64"),
+        "rt_service_minutes": (max_time - min_time) / 60,
+        "minutes_atleast1_vp": minutes_atleast1_vp.astype("int64"),
+        "minutes_atleast2_vp": minutes_atleast2_vp.astype("int64"),
+    })
+    
+    return df
+
+
+def vp_one_minute_interval_metrics(
+    vp: pd.DataFrame,
+    group_col: str = "trip_instance_key",
+    timestamp_col: str = "location_timestamp_local"
+) -> pd.DataFrame:
+    """
+    For each trip: count the minutes that have at least 1 or 2+ pings.
+    See vp_trip_time_and_minute_metrics.
+    """
+    df = vp_trip_time_and_minute_metrics(
+        vp, group_col, timestamp_col
+    )[[group_col, "minutes_atleast1_vp", "minutes_atleast2_vp"]]
+    
     return df
 
 
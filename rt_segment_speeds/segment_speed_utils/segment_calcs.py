@@ -92,8 +92,13 @@ def convert_timestamp_to_seconds(
 ) -> dd.DataFrame: 
     """
     Convert timestamp into seconds.
+    If the seconds column was already added upstream 
+    (schedule_rt_utils.localize_timestamp_col), use it as is.
     """
     for c in timestamp_cols:
+        if f"{c}_sec" in df.columns:
+            continue
+            
         df = df.assign(
             time_sec = ((df[c].dt.hour * 3_600) + 
                             (df[c].dt.minute * 60) + 
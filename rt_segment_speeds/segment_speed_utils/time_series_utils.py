@@ -5,7 +5,11 @@ by concatenating aggregated data across multiple months.
 import datetime
 import geopandas as gpd
 import gcsfs
+import json
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 from dask import delayed, compute
 from pathlib import Path
@@ -63,6 +67,450 @@ def concatenate_datasets_across_dates(
     return df
 
 
+def read_time_series_manifest(store_path: str) -> dict:
+    """
+    Return the manifest of a time-series store: 
+    the service dates already ingested and the columns of the store.
+    A new store has no dates and no columns.
+    """
+    manifest_path = f"{store_path}/_manifest.json"
+    
+    if not fs.exists(manifest_path):
+        return {"service_dates": [], "columns": None}
+    
+    with fs.open(manifest_path, "r") as f:
+        manifest = json.load(f)
+    
+    # stores written before columns were tracked
+    manifest.setdefault("columns", None)
+    
+    return manifest
+
+
+def write_time_series_manifest(
+    store_path: str,
+    dataset_name: str,
+    service_dates: list,
+    columns: list
+):
+    """
+    Record which service dates are in the store and its columns.
+    Written after the partitions, so an interrupted run 
+    re-ingests those dates next time.
+    """
+    with fs.open(f"{store_path}/_manifest.json", "w") as f:
+        json.dump({
+            "dataset_name": dataset_name,
+            "service_dates": sorted(service_dates),
+            "columns": columns
+        }, f)
+    
+    return
+
+
+def time_series_partition_path(
+    store_path: str,
+    dataset_name: str,
+    analysis_date: str
+) -> str:
+    return (f"{store_path}/service_date={analysis_date}/"
+            f"{Path(dataset_name).name}_{analysis_date}.parquet")
+
+
+def source_schema(
+    gcs_bucket: str,
+    dataset_name: str,
+    analysis_date: str
+) -> pa.Schema:
+    """
+    Arrow schema of a date's parquet (without the pandas index), 
+    read from the parquet footer only.
+    """
+    with fs.open(f"{gcs_bucket}{dataset_name}_{analysis_date}.parquet", "rb") as f:
+        schema = pq.read_schema(f).remove_metadata()
+    
+    return pa.schema([
+        field for field in schema if not field.name.startswith("__index_level_")
+    ])
+
+
+def source_columns(
+    gcs_bucket: str,
+    dataset_name: str,
+    analysis_date: str
+) -> list:
+    """
+    Column names of a date's parquet, from the parquet schema only.
+    """
+    return source_schema(gcs_bucket, dataset_name, analysis_date).names
+
+
+def store_schema(
+    gcs_bucket: str,
+    dataset_name: str,
+    date_list: list,
+    columns: list
+) -> pa.Schema:
+    """
+    Schema every partition in the store is written with.
+    Each column takes its type from the most recent date that has it,
+    so a column missing from older dates is written as 
+    nulls of that type instead of all-NaN doubles.
+    """
+    types = {}
+    
+    for analysis_date in sorted(date_list, reverse=True):
+        schema = source_schema(gcs_bucket, dataset_name, analysis_date)
+        
+        for c in columns:
+            if c not in types and c in schema.names:
+                types[c] = schema.field(c).type
+        
+        if len(types) == len(columns):
+            break
+    
+    return pa.schema([(c, types.get(c, pa.null())) for c in columns])
+
+
+def partition_schema(
+    store_path: str,
+    dataset_name: str,
+    analysis_date: str
+) -> pa.Schema:
+    with fs.open(
+        time_series_partition_path(store_path, dataset_name, analysis_date), "rb"
+    ) as f:
+        return pq.read_schema(f).remove_metadata()
+
+
+def write_partition(
+    df: pd.DataFrame,
+    path: str,
+    schema: pa.Schema
+):
+    """
+    Write df with exactly the store's schema: 
+    columns df doesn't have are added as typed nulls,
+    and the others are cast to the store's types.
+    """
+    table = pa.Table.from_pandas(
+        df[[c for c in schema.names if c in df.columns]], 
+        preserve_index=False
+    )
+    
+    for field in schema:
+        if field.name not in table.column_names:
+            table = table.append_column(
+                field, pa.nulls(len(table), type=field.type))
+    
+    table = table.select(schema.names).cast(schema)
+    
+    with fs.open(path, "wb") as f:
+        pq.write_table(table, f)
+    
+    return
+
+
+def ingest_one_date(
+    gcs_bucket: str,
+    dataset_name: str,
+    analysis_date: str,
+    store_path: str,
+    sort_cols: list,
+    schema: pa.Schema,
+):
+    """
+    Read a single date's parquet and write it into its own
+    service_date partition in the store.
+    Every partition is written with the store's schema 
+    (typed nulls if a date doesn't have a column),
+    so reading the store never mixes schemas.
+    Rows are sorted so row group statistics can skip 
+    operators that are filtered out when reading.
+    """
+    available_cols = source_columns(gcs_bucket, dataset_name, analysis_date)
+    
+    df = pd.read_parquet(
+        f"{gcs_bucket}{dataset_name}_{analysis_date}.parquet",
+        columns = [c for c in schema.names if c in available_cols]
+    )
+    
+    sort_cols = [c for c in sort_cols if c in df.columns]
+    
+    write_partition(
+        df.sort_values(sort_cols).reset_index(drop=True),
+        time_series_partition_path(store_path, dataset_name, analysis_date),
+        schema
+    )
+    
+    return
+
+
+def update_time_series_store(
+    gcs_bucket: str,
+    dataset_name: str,
+    date_list: list,
+    store_path: str,
+    sort_cols: list = None,
+    columns: list = None,
+) -> list:
+    """
+    Append-only store for a dataset we save monthly.
+    Only dates not listed in the store's manifest are read from
+    the original parquets, and each is written as a 
+    service_date=YYYY-MM-DD partition. 
+    
+    The manifest also records the store's columns 
+    (columns, or all the columns in the most recent date's parquet).
+    Column types come from the most recent date that has the column 
+    (see store_schema).
+    If the columns or their types change, every date is ingested again.
+    
+    Returns the list of dates that were (re)written.
+    """
+    if sort_cols is None:
+        sort_cols = ["schedule_gtfs_dataset_key"]
+    
+    manifest = read_time_series_manifest(store_path)
+    ingested_dates = manifest["service_dates"]
+    
+    if columns is None:
+        columns = source_columns(gcs_bucket, dataset_name, max(date_list))
+    
+    schema = store_schema(
+        gcs_bucket, 
+        dataset_name, 
+        sorted(set(date_list).union(ingested_dates)), 
+        columns
+    )
+    
+    if (
+        manifest["columns"] != columns or 
+        (len(ingested_dates) > 0 and not partition_schema(
+            store_path, dataset_name, max(ingested_dates)).equals(schema))
+    ):
+        new_dates = sorted(set(date_list).union(ingested_dates))
+        ingested_dates = []
+    else:
+        new_dates = sorted(set(date_list).difference(ingested_dates))
+    
+    if len(new_dates) == 0:
+        return new_dates
+    
+    results = [
+        delayed(ingest_one_date)(
+            gcs_bucket,
+            dataset_name,
+            d,
+            store_path,
+            sort_cols,
+            schema,
+        ) for d in new_dates
+    ]
+    
+    compute(results)
+    
+    write_time_series_manifest(
+        store_path, 
+        dataset_name, 
+        ingested_dates + new_dates, 
+        columns
+    )
+    
+    return new_dates
+
+
+def write_time_series_partitions(
+    df: pd.DataFrame,
+    store_path: str,
+    dataset_name: str,
+    sort_cols: list = None,
+) -> list:
+    """
+    Write a df that is already at service_date grain 
+    (ex: merged across sources) into a time-series store,
+    replacing the partitions for the dates in df.
+    The df's columns become the store's columns.
+    If the columns didn't change, new partitions are cast to the 
+    types already in the store, so the store never mixes schemas.
+    
+    Returns the list of dates written.
+    """
+    if sort_cols is None:
+        sort_cols = ["schedule_gtfs_dataset_key"]
+    
+    manifest = read_time_series_manifest(store_path)
+    
+    df = df.assign(
+        service_date = pd.to_datetime(df.service_date).dt.strftime("%Y-%m-%d")
+    )
+    columns = [c for c in df.columns if c != "service_date"]
+    sort_cols = [c for c in sort_cols if c in columns]
+    
+    new_dates = sorted(df.service_date.unique())
+    other_dates = sorted(set(manifest["service_dates"]).difference(new_dates))
+    
+    if manifest["columns"] == columns and len(other_dates) > 0:
+        schema = partition_schema(store_path, dataset_name, max(other_dates))
+    else:
+        schema = pa.Schema.from_pandas(
+            df[columns], preserve_index=False).remove_metadata()
+    
+    for analysis_date, one_date in df.groupby("service_date"):
+        write_partition(
+            one_date.sort_values(sort_cols).reset_index(drop=True),
+            time_series_partition_path(store_path, dataset_name, analysis_date),
+            schema
+        )
+    
+    write_time_series_manifest(
+        store_path,
+        dataset_name,
+        sorted(set(manifest["service_dates"]).union(new_dates)),
+        columns
+    )
+    
+    return new_dates
+
+
+def read_time_series_store(
+    store_path: str,
+    date_list: list = None,
+    columns: list = None,
+    filters: list = None,
+) -> pd.DataFrame:
+    """
+    Read a time-series store created by `update_time_series_store`.
+    Subsetting by date prunes whole partitions, and
+    filters on operator columns (schedule_gtfs_dataset_key, 
+    organization_name) use the row group statistics.
+    `filters` is a list of tuples that are all applied (AND).
+    """
+    filters = [] if filters is None else filters
+    
+    if date_list is not None:
+        filters = filters + [("service_date", "in", date_list)]
+    
+    if columns is not None and "service_date" not in columns:
+        columns = columns + ["service_date"]
+        
+    df = pd.read_parquet(
+        store_path,
+        columns = columns,
+        filters = [filters] if len(filters) > 0 else None,
+    )
+    
+    # Partition values come back as categorical strings
+    df = df.assign(
+        service_date = pd.to_datetime(df.service_date.astype(str))
+    )
+    
+    return df
+
+
+def find_dates_without_output(
+    file_prefix: str,
+    analysis_date_list: list,
+    overwrite: bool = False
+) -> list:
+    """
+    For date-partitioned outputs ({file_prefix}_{analysis_date}.parquet),
+    keep only the dates that haven't been written yet,
+    so a backfill over many dates only does the new dates.
+    """
+    if overwrite:
+        return list(analysis_date_list)
+    
+    return [
+        analysis_date for analysis_date in analysis_date_list
+        if not fs.exists(f"{file_prefix}_{analysis_date}.parquet")
+    ]
+
+
+def year_quarter_to_period(year_quarter: pd.Series) -> pd.Series:
+    """
+    Turn year_quarter strings (2024-Q1) into consecutive integers,
+    so the quarter before 2024-Q1 is 2023-Q4.
+    """
+    parts = year_quarter.str.split("-Q", expand=True).astype(int)
+    
+    return parts[0] * 4 + parts[1] - 1
+
+
+def year_month_to_period(
+    year: pd.Series, 
+    month: pd.Series
+) -> pd.Series:
+    """
+    Turn year and month into consecutive integers,
+    so the month before Jan 2024 is Dec 2023 and 
+    the same month last year is 12 periods back.
+    """
+    return year.astype(int) * 12 + month.astype(int) - 1
+
+
+def add_change_from_prior_period(
+    df: pd.DataFrame,
+    group_cols: list,
+    period_col: str,
+    value_cols: list,
+    lag: int = 1,
+) -> pd.DataFrame:
+    """
+    For each value column, add prior_{c} (the value `lag` periods back 
+    for the same group), change_{c} and pct_change_{c} 
+    (change as a share of the current value, not rounded).
+    
+    period_col must be consecutive integers 
+    (see year_quarter_to_period, year_month_to_period).
+    The prior value is matched on period - lag exactly, 
+    so if that period is missing for a group (gap in the history), 
+    the prior is left null instead of using whatever row came before.
+    
+    Rows are sorted once and matched with array offsets (searchsorted),
+    and results are returned in df's original row order.
+    """
+    if len(df) == 0:
+        return df.assign(**{
+            f"{prefix}{c}": np.nan
+            for c in value_cols
+            for prefix in ["prior_", "change_", "pct_change_"]
+        })
+
+    group_id = df.groupby(
+        group_cols, observed=True, group_keys=False
+    ).ngroup().to_numpy()
+    period = df[period_col].to_numpy().astype("int64")
+    has_group = ~np.isnan(group_id)
+    
+    # One sortable key for group-period:
+    # group_id * span + period, where span is wider than any period range
+    min_period = period.min() - lag
+    span = period.max() - min_period + 1
+    key = np.where(has_group, np.nan_to_num(group_id).astype("int64"), -1) * span + (period - min_period)
+    
+    order = np.argsort(key, kind="stable")
+    sorted_key = key[order]
+    
+    prior_key = key - lag
+    prior_position = np.searchsorted(sorted_key, prior_key)
+    prior_position = np.minimum(prior_position, len(sorted_key) - 1)
+    
+    found = has_group & (sorted_key[prior_position] == prior_key)
+    prior_row = order[prior_position]
+    
+    new_cols = {}
+    for c in value_cols:
+        values = df[c].to_numpy().astype("float64")
+        prior = np.where(found, values[prior_row], np.nan)
+        
+        new_cols[f"prior_{c}"] = prior
+        new_cols[f"change_{c}"] = values - prior
+        new_cols[f"pct_change_{c}"] = (values - prior) / values
+    
+    return df.assign(**new_cols)
+
+
 def clean_standardized_route_names(
     df: pd.DataFrame, 
 ) -> pd.DataFrame:
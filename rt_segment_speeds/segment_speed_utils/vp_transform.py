@@ -5,6 +5,7 @@ import shapely
 
 from calitp_data_analysis.geography_utils import WGS84
 from segment_speed_utils import wrangle_shapes
+from shared_utils import geometry_utils
 
 def condense_point_geom_to_line(
     df: pd.DataFrame, 
@@ -35,14 +36,21 @@ def condense_point_geom_to_line(
         how = "inner"
     )
     
-    df3 = (df2.groupby(group_cols, 
-                      observed=True, group_keys=False)
-           .agg({
-               geom_col: lambda x: shapely.LineString(list(x)),
-               **{k: lambda x: list(x) for k in other_cols}
-           })
-           .reset_index()
-          )
+    # Draw all the lines at once from the point coordinates
+    groups, lines = geometry_utils.condense_points_to_lines(
+        df2, group_cols, geom_col)
+    
+    df3 = groups.assign(**{geom_col: lines})
+    
+    if len(other_cols) > 0:
+        df3 = pd.concat([
+            df3,
+            (df2.groupby(group_cols, 
+                         observed=True, group_keys=False)
+             .agg({k: lambda x: list(x) for k in other_cols})
+             .reset_index(drop=True)
+            )
+        ], axis=1)
     
     return df3
 
@@ -192,4 +192,92 @@ def interpolate_stop_arrival_time(
 
     return np.interp(
         stop_position, np.asarray(shape_meters_arr), timestamp_arr
-    ).astype("datetime64[s]")
\ No newline at end of file
+    ).astype("datetime64[s]")
+
+def cut_lines_at_fixed_interval(
+    geometry_array: np.ndarray,
+    segment_distance: float,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Cut every linestring into segments of segment_distance at once.
+    Same cuts as geography_utils.create_segments
+    (shapely.ops.substring from i to i + segment_distance, for i in
+    range(0, int(length), segment_distance)), but instead of
+    looping over lines and cut points, work off the coordinate arrays.
+
+    For each segment, the coordinates are the interpolated start point,
+    the line's vertices that fall strictly between start and end,
+    and the interpolated end point.
+
+    Returns arrays of line position (index into geometry_array),
+    segment_sequence within that line, and the segment linestrings.
+    """
+    geometry_array = np.asarray(geometry_array)
+    lengths = shapely.length(geometry_array)
+
+    n_segments = np.ceil(
+        lengths.astype("int64") / segment_distance).astype("int64")
+
+    line_idx = np.repeat(np.arange(len(geometry_array)), n_segments)
+    segment_offset = np.cumsum(n_segments) - n_segments
+    segment_sequence = np.arange(len(line_idx)) - segment_offset[line_idx]
+
+    # The last segment's end can run past the line's length,
+    # interpolating there just returns the line's last point
+    start_dist = segment_sequence * segment_distance
+    end_dist = start_dist + segment_distance
+
+    start_coords = shapely.get_coordinates(
+        shapely.line_interpolate_point(geometry_array[line_idx], start_dist))
+    end_coords = shapely.get_coordinates(
+        shapely.line_interpolate_point(geometry_array[line_idx], end_dist))
+
+    # Cumulative distance along the line for each vertex,
+    # restarting at zero at each line's first vertex
+    coords, vertex_line = shapely.get_coordinates(
+        geometry_array, return_index=True)
+    first_vertex = np.r_[True, vertex_line[1:] != vertex_line[:-1]]
+    last_vertex = np.r_[vertex_line[1:] != vertex_line[:-1], True]
+
+    step = np.sqrt(np.diff(coords[:, 0], prepend=0)**2 +
+                   np.diff(coords[:, 1], prepend=0)**2)
+    step[first_vertex] = 0
+    vertex_dist = pd.Series(step).groupby(vertex_line).cumsum().to_numpy()
+
+    # A vertex can only belong to segment floor(dist / segment_distance),
+    # and is kept if it's strictly between that segment's start and end.
+    # The line's last vertex is never kept, the end point covers it.
+    vertex_segment = np.floor(
+        vertex_dist / segment_distance).astype("int64")
+    keep = (
+        (vertex_dist > 0) & ~last_vertex &
+        (vertex_segment < n_segments[vertex_line])
+    )
+    interior_segment = segment_offset[vertex_line[keep]] + vertex_segment[keep]
+
+    keep[keep] = (
+        (vertex_dist[keep] > start_dist[interior_segment]) &
+        (vertex_dist[keep] < end_dist[interior_segment])
+    )
+    interior_segment = segment_offset[vertex_line[keep]] + vertex_segment[keep]
+
+    n = len(line_idx)
+    all_coords = np.concatenate(
+        [start_coords, coords[keep], end_coords], axis=0)
+    all_segments = np.concatenate(
+        [np.arange(n), interior_segment, np.arange(n)])
+    # start point first, vertices in their order, end point last
+    all_order = np.concatenate([
+        np.full(n, -1),
+        np.flatnonzero(keep),
+        np.full(n, len(coords))
+    ])
+
+    sort_order = np.lexsort((all_order, all_segments))
+
+    segments = shapely.linestrings(
+        all_coords[sort_order],
+        indices=all_segments[sort_order]
+    )
+
+    return line_idx, segment_sequence, segments
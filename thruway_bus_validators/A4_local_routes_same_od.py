@@ -5,13 +5,16 @@ as Amtrak thruway buses.
 import dask.dataframe as dd
 import dask_geopandas as dg
 import geopandas as gpd
+import intake
+import numpy as np
 import pandas as pd
-
-from shapely.geometry import Point
+import shapely
 
 from _utils import GCS_FILE_PATH, SELECTED_DATE, COMPILED_CACHED_VIEWS
 from shared_utils import geography_utils
 
+catalog = intake.open_catalog("*.yml")
+
 
 def keep_long_shape_ids(routelines: dg.GeoDataFrame | gpd.GeoDataFrame, 
                         mile_cutoff: float | int = 20
@@ -94,72 +97,89 @@ def keep_longest_route(routelines: gpd.GeoDataFrame | dg.GeoDataFrame,
                     )
     
     # Add the route's origin and destination
+    origin, destination = line_endpoints(longest_route.geometry)
+    
     longest_route = longest_route.assign(
-        origin = longest_route.geometry.apply(lambda x: Point(x.coords[0])),
-        destination = longest_route.geometry.apply(lambda x: Point(x.coords[-1])),
+        origin = origin,
+        destination = destination,
     )
     
     return longest_route
 
 
-def buffer_around_origin_destination(gdf: gpd.GeoDataFrame, 
-                                     buffer_feet: int = 0) -> gpd.GeoDataFrame:
+def line_endpoints(geometry: gpd.GeoSeries) -> tuple[gpd.GeoSeries]:
     """
-    Since we have origin / destination point geom,
-    might want to draw a 5 mile, 10 mile buffer around the origin?
-    Somehow capture local bus routes that also travel
-    to the same cities, but not necessarily stop at the same train station.
+    First and last point of every line, for all lines at once.
     """
-    # Project to CA State Plane (feet)
-    # for all geom cols, just keep for standardization
-    geom_cols = list(gdf.select_dtypes("geometry").columns)
-    
-    for c in geom_cols:
-        gdf[c] = gdf[c].to_crs(geography_utils.CA_StatePlane)
+    geom_array = geometry.to_numpy()
     
-    gdf = gdf.assign(
-        origin_buffer = gdf.origin.buffer(buffer_feet),
-        destination_buffer = gdf.destination.buffer(buffer_feet)
+    origin = gpd.GeoSeries(
+        shapely.get_point(geom_array, 0), 
+        index = geometry.index, crs = geometry.crs
+    )
+    destination = gpd.GeoSeries(
+        shapely.get_point(geom_array, -1), 
+        index = geometry.index, crs = geometry.crs
     )
     
-    return gdf
+    return origin, destination
 
 
-def reshape_wide_to_long_and_dissolve(
-    gdf: gpd.GeoDataFrame, 
-    id_vars: list,
-    value_vars: list,
-    var_name: str = "variable",
-    value_name: str = "value"
-) -> gpd.GeoDataFrame:
+def routes_with_same_od(
+    local_routes: gpd.GeoDataFrame,
+    amtrak_routes: gpd.GeoDataFrame,
+    buffer_feet: int = 0,
+    local_id_cols: list = ["calitp_itp_id", "route_id"],
+    amtrak_id_cols: list = ["calitp_itp_id", "route_id", "origin_destination"]
+) -> pd.DataFrame:
     """
-    Since origin / destinations are in separate columns, 
-    change this to long, so a dissolve can be done.
+    Find every pair of local route / Amtrak thruway route (origin_destination) 
+    where the local route's origin and destination both fall within
+    the buffered origin / destination of the Amtrak route.
     
-    Take all the inputs normally for pd.melt().
+    Since we have origin / destination point geom,
+    might want to draw a 5 mile, 10 mile buffer around the origin?
+    Somehow capture local bus routes that also travel
+    to the same cities, but not necessarily stop at the same train station.
     
-    Returns a long gdf that's been dissolved by id_vars.
+    Amtrak origin and destination buffers go into one STRtree and 
+    all the local origins and destinations are queried against it together.
     """
+    n_amtrak = len(amtrak_routes)
+    n_local = len(local_routes)
+    
+    # Project to CA State Plane (feet)
+    amtrak_endpoints = np.concatenate([
+        amtrak_routes.origin.to_crs(geography_utils.CA_StatePlane).to_numpy(),
+        amtrak_routes.destination.to_crs(geography_utils.CA_StatePlane).to_numpy()
+    ])
+    local_endpoints = np.concatenate([
+        local_routes.origin.to_crs(geography_utils.CA_StatePlane).to_numpy(),
+        local_routes.destination.to_crs(geography_utils.CA_StatePlane).to_numpy()
+    ])
 
-    gdf_long = pd.melt(
-        gdf[id_vars + value_vars],
-        id_vars = id_vars,
-        value_vars = value_vars,
-        var_name = var_name,
-        value_name = value_name
-    )
+    # buffer i and i + n_amtrak belong to Amtrak route i,
+    # same for local endpoints
+    tree = shapely.STRtree(shapely.buffer(amtrak_endpoints, buffer_feet, quad_segs=16))
     
-    dissolved = (gdf_long.dissolve(by = id_vars)
-                .reset_index()
-                .drop(columns = var_name)
-    )
+    endpoint_idx, buffer_idx = tree.query(local_endpoints, predicate = "within")
     
-    # In the melting, we lose the geometry column that was set
-    # Even though it's still gdf, need to reset the CRS
-    dissolved.crs = gdf.crs 
-    dissolved = dissolved.set_geometry(value_name)
+    local_idx = endpoint_idx % n_local
+    amtrak_idx = buffer_idx % n_amtrak
+    is_origin = endpoint_idx < n_local
     
-    return dissolved
+    # A pair counts once the local origin and local destination 
+    # are each within one of that Amtrak route's buffers
+    pair_key = local_idx.astype("int64") * n_amtrak + amtrak_idx
+    pairs = np.intersect1d(pair_key[is_origin], pair_key[~is_origin])
+    
+    local_ids = local_routes[local_id_cols].iloc[pairs // n_amtrak].reset_index(drop=True)
+    amtrak_ids = (amtrak_routes[amtrak_id_cols].iloc[pairs % n_amtrak]
+                  .reset_index(drop=True)
+                  .add_prefix("amtrak_"))
+    
+    return pd.concat([local_ids, amtrak_ids], axis=1)
+
 
 if __name__ == "__main__":
     trips = dd.read_parquet(
@@ -179,35 +199,17 @@ if __name__ == "__main__":
     amtrak_routes = catalog.amtrak_thruway_routes_with_od.read()
     
     # Draw a 5 mile buffer around origin / destination
-    amtrak_routes2 = buffer_around_origin_destination(
-        amtrak_routes[amtrak_routes.route_type=='3'], 
-        buffer_feet = geography_utils.FEET_PER_MI * 5)
-    
-    amtrak_od = reshape_wide_to_long_and_dissolve(
-        amtrak_routes2, 
-        id_vars = ["calitp_itp_id", "route_id", "origin_destination"],
-        value_vars = ["origin_buffer", "destination_buffer"],
-        value_name = "geometry"
-    )
-    
-    longest_route_diss = reshape_wide_to_long_and_dissolve(
+    od_pairs = routes_with_same_od(
         longest_route,
-        id_vars = ["calitp_itp_id", "route_id"],
-        value_vars = ["origin", "destination"],
-        value_name = "geometry"
+        amtrak_routes[amtrak_routes.route_type=='3'].reset_index(drop=True),
+        buffer_feet = geography_utils.FEET_PER_MI * 5
     )
     
-    intersects_amtrak = gpd.sjoin(
-        longest_route_diss, 
-        # only need to set origin as geometry, since amtrak_od contains both OD
-        amtrak_od[["geometry"]], 
-        how = "inner",
-        predicate = "within"
-    )[["calitp_itp_id", "route_id", "geometry"]].drop_duplicates()
+    od_pairs.to_parquet("routes_same_od_amtrak_pairs.parquet")
     
     routes_intersect_amtrak = pd.merge(
         longest_route,
-        intersects_amtrak.drop(columns = "geometry"),
+        od_pairs[["calitp_itp_id", "route_id"]].drop_duplicates(),
         on = ["calitp_itp_id", "route_id"],
         how = "inner",
         validate = "1:1"